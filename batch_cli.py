@@ -0,0 +1,158 @@
+# batch_cli.py
+# Chạy PPA / EPC hàng loạt không cần GUI (không import Qt):
+#   python batch_cli.py "data/2024-*.xlsx" data/thang12 -m ppa epc -o ket_qua -j 4
+# Mỗi file dispatch -> <tên file>_<PPA|EPC>.xlsx (cùng bố cục A/D/G/J như nút Calculate),
+# kèm run_summary.csv tổng hợp kết quả từng file. -f chọn định dạng khác (xlsx_fast, csv,
+# csv_gz, parquet, feather), vd lưu trữ quyết toán: -f parquet
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tab_module.main_window_modules.data_utils import make_unit_steps, read_dispatch
+from tab_module.main_window_modules.input_cache import default_cache
+from tab_module.calculation_modules.pipeline import BUILDERS, compute_hourly, export_minutely_and_hourly
+from tab_module.calculation_modules.result_cache import default_result_cache
+from tab_module.calculation_modules.export_utils import EXPORT_FORMATS, export_formats
+
+INPUT_EXTS = (".xlsx", ".xls", ".xlsb", ".csv")
+SUMMARY_COLS = ["file", "mode", "status", "pairs_s1", "pairs_s2", "hours_s1", "hours_s2",
+                "minutes", "seconds", "output", "error"]
+
+
+def collect_inputs(items):
+    """File / thư mục / glob -> danh sách file dispatch (bỏ file khóa ~$ của Excel, không trùng)."""
+    out = []
+    for item in items:
+        if os.path.isdir(item):
+            found = [os.path.join(item, f) for f in sorted(os.listdir(item))]
+        elif glob.has_magic(item):
+            found = sorted(glob.glob(item))
+            if not found:
+                print(f"Không có file khớp: {item}", file=sys.stderr)
+        else:
+            found = [item]
+        for p in found:
+            name = os.path.basename(p)
+            if name.startswith("~$") or os.path.splitext(name)[1].lower() not in INPUT_EXTS:
+                continue
+            p = os.path.abspath(p)
+            if p not in out:
+                out.append(p)
+    return out
+
+
+def output_stems(files):
+    """Tên gốc file kết quả; trùng tên khác đuôi (a.csv / a.xlsx) -> thêm đuôi vào tên."""
+    stems = [os.path.splitext(os.path.basename(f))[0] for f in files]
+    return [s if stems.count(s) == 1 else f"{s}_{os.path.splitext(f)[1].lstrip('.').lower()}"
+            for s, f in zip(stems, files)]
+
+
+def run_file(path, stem, modes, out_dir, use_cache=True, fmt="xlsx"):
+    """Xử lý 1 file dispatch cho các mode; trả về list dòng summary. Hàm top-level cho process con."""
+    # FutureWarning của pandas lặp lại theo từng file làm ngập log batch
+    warnings.simplefilter("ignore", FutureWarning)
+    rows = []
+    t0 = time.perf_counter()
+    cache = default_result_cache() if use_cache else None
+    try:
+        loader = lambda: read_dispatch(path)
+        parts = default_cache().load(path, "dispatch", loader) if use_cache else loader()
+        steps = make_unit_steps(parts)
+        df1, df2 = steps["S1"], steps["S2"]
+        if df1.empty or df2.empty:
+            raise ValueError("DF1 hoặc DF2 rỗng!")
+    except Exception as ex:
+        return [dict(file=path, mode=m, status="error", error=f"Lỗi đọc file: {ex}") for m in modes]
+
+    for mode in modes:
+        t = time.perf_counter() if rows else t0   # mode đầu tính cả thời gian đọc file
+        row = dict(file=path, mode=mode)
+        try:
+            res = compute_hourly(mode, df1, df2, workers=1, cache=cache)
+            out_path = os.path.join(out_dir, f"{stem}_{mode}{EXPORT_FORMATS[fmt]}")
+            mins = export_minutely_and_hourly(res["seg1"], res["seg2"], out_path, mode,
+                                              cache=cache, keys=(res["key1"], res["key2"]), fmt=fmt)
+            row.update(status="ok", output=out_path,
+                       pairs_s1=len(res["sum1"]), pairs_s2=len(res["sum2"]),
+                       hours_s1=len(res["s1_hour"]), hours_s2=len(res["s2_hour"]),
+                       minutes=len(mins["s1_min"]) + len(mins["s2_min"]))
+        except Exception as ex:
+            row.update(status="error", error=str(ex))
+        row["seconds"] = round(time.perf_counter() - t, 3)
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Tính PPA / EPC hàng loạt cho các file dispatch (không GUI).")
+    ap.add_argument("inputs", nargs="+", help="file, thư mục hoặc glob (vd \"data/*.xlsx\")")
+    ap.add_argument("-m", "--mode", nargs="+", default=["PPA"], type=str.upper,
+                    choices=sorted(BUILDERS), help="PPA và/hoặc EPC (mặc định PPA)")
+    ap.add_argument("-o", "--out", default="output", help="thư mục kết quả (mặc định ./output)")
+    ap.add_argument("-j", "--jobs", type=int, default=0,
+                    help="số process song song theo file (mặc định: số CPU, tối đa số file)")
+    ap.add_argument("-f", "--format", default="xlsx", choices=list(EXPORT_FORMATS),
+                    help="định dạng file kết quả (mặc định xlsx; xlsx_fast: ghi nhanh cùng bố cục)")
+    ap.add_argument("--no-cache", action="store_true", help="không dùng cache dữ liệu đã đọc / kết quả đã tính")
+    args = ap.parse_args(argv)
+
+    if args.format not in export_formats():
+        print(f"Định dạng {args.format} cần cài thêm pyarrow (pip install pyarrow).", file=sys.stderr)
+        return 2
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("Không tìm thấy file dữ liệu.", file=sys.stderr)
+        return 2
+    os.makedirs(args.out, exist_ok=True)
+    modes = list(dict.fromkeys(args.mode))
+    jobs = args.jobs or (os.cpu_count() or 1)
+    jobs = max(1, min(jobs, len(files)))
+    print(f"{len(files)} file, mode {'/'.join(modes)}, {jobs} process -> {os.path.abspath(args.out)}")
+
+    t0 = time.perf_counter()
+    rows = []
+    stems = output_stems(files)
+    if jobs == 1:
+        for i, (f, stem) in enumerate(zip(files, stems), 1):
+            rows += run_file(f, stem, modes, args.out, not args.no_cache, args.format)
+            _report(i, len(files), f, rows[-len(modes):])
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(run_file, f, stem, modes, args.out, not args.no_cache, args.format): f
+                       for f, stem in zip(files, stems)}
+            for i, fut in enumerate(as_completed(futures), 1):
+                f = futures[fut]
+                try:
+                    got = fut.result()
+                except Exception as ex:   # process con chết (hết RAM, ...)
+                    got = [dict(file=f, mode=m, status="error", error=str(ex)) for m in modes]
+                rows += got
+                _report(i, len(files), f, got)
+
+    rows.sort(key=lambda r: (files.index(r["file"]), modes.index(r["mode"])))
+    summary = os.path.join(args.out, "run_summary.csv")
+    with open(summary, "w", newline="", encoding="utf-8-sig") as fh:
+        w = csv.DictWriter(fh, fieldnames=SUMMARY_COLS)
+        w.writeheader()
+        for r in rows:
+            w.writerow({c: r.get(c, "") for c in SUMMARY_COLS})
+    n_err = sum(r["status"] != "ok" for r in rows)
+    print(f"Xong {len(rows) - n_err}/{len(rows)} trong {time.perf_counter() - t0:.1f}s ; tổng hợp: {summary}")
+    return 1 if n_err else 0
+
+
+def _report(i, n, path, rows):
+    for r in rows:
+        msg = r.get("output") if r["status"] == "ok" else r.get("error")
+        print(f"[{i}/{n}] {os.path.basename(path)} {r['mode']}: {r['status']} - {msg}")
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
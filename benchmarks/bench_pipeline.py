@@ -0,0 +1,282 @@
+# bench_pipeline.py
+# Đo thời gian + bộ nhớ từng chặng PPA / EPC trên dispatch giả lập (synthetic_dispatch), nhiều cỡ:
+#   python -m benchmarks.bench_pipeline -n 200 800 3200 -r 3
+#   python -m benchmarks.bench_pipeline --save-baseline may_a      # lưu benchmarks/baselines/may_a.json
+#   python -m benchmarks.bench_pipeline --compare may_a            # so baseline, chậm hơn ngưỡng -> exit 1
+# Mỗi cỡ n = số lệnh / tổ máy (S1 + S2). Thời gian = min của -r lần chạy; bộ nhớ = đỉnh tracemalloc
+# của 1 lần chạy riêng (tracemalloc làm chậm nên không đo chung). Cột "mũ" = độ dốc log(thời gian) /
+# log(n) giữa các cỡ (1 ~ tuyến tính, 2 ~ bình phương). Baseline phụ thuộc máy: lưu / so trên cùng máy.
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+from tab_module.main_window_modules.data_utils import make_unit_steps, read_any, read_dispatch
+from tab_module.calculation_modules.ppa_calculation import build_ppa_per_pair
+from tab_module.calculation_modules.epc_calculation import build_epc_per_pair
+from tab_module.calculation_modules.ppa_minutely import ppa_segments_to_minutely
+from tab_module.calculation_modules.ppa_hourly import segments_to_hourly
+from tab_module.calculation_modules.export_utils import export_ppa_minutely_and_hourly_to_excel, minutely_to_hourly_avg
+from tab_module.calculation_modules.pipeline import HOURLY_PARAMS, merge_hour_with_contract
+from benchmarks.synthetic_dispatch import synthetic_contract, synthetic_dispatch, write_dispatch
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+DEFAULT_SIZES = (200, 800, 3200)
+UNITS = ("S1", "S2")
+
+
+# ===================== Các chặng =====================
+# (tên, hàm(ctx) -> kết quả lưu vào ctx[tên]); chạy theo thứ tự, chặng sau dùng kết quả chặng trước.
+# Mỗi chặng chạy cho cả S1 và S2 như nút Calculate.
+def _per_unit(fn, src):
+    return lambda ctx: {u: fn(ctx[src][u]) for u in UNITS}
+
+
+def _export(fmt):
+    def run(ctx):
+        m = ctx["ppa_segments_to_minutely[T]"]
+        path = os.path.join(ctx["tmp"], f"out_{fmt}.xlsx")
+        export_ppa_minutely_and_hourly_to_excel(m["S1"], m["S2"], path, "PPA", fmt=fmt)
+        return os.path.getsize(path)
+    return run
+
+
+STAGES = [
+    ("read_any", lambda ctx: read_any(ctx["path"])),
+    ("read_dispatch", lambda ctx: read_dispatch(ctx["path"], UNITS)),
+    ("make_unit_steps", lambda ctx: make_unit_steps(ctx["read_dispatch"])),
+    ("build_ppa_per_pair", _per_unit(build_ppa_per_pair, "make_unit_steps")),
+    ("build_epc_per_pair", _per_unit(build_epc_per_pair, "make_unit_steps")),
+    ("ppa_segments_to_minutely[T]", lambda ctx: {u: ppa_segments_to_minutely(ctx["build_ppa_per_pair"][u][0], freq="T")
+                                                 for u in UNITS}),
+    ("ppa_segments_to_minutely[S]", lambda ctx: {u: ppa_segments_to_minutely(ctx["build_ppa_per_pair"][u][0], freq="S")
+                                                 for u in UNITS}),
+    ("minutely_to_hourly_avg", _per_unit(lambda m: minutely_to_hourly_avg(m, freq="T", label="right"),
+                                         "ppa_segments_to_minutely[T]")),
+    ("segments_to_hourly", lambda ctx: {u: segments_to_hourly(ctx["build_ppa_per_pair"][u][0], **HOURLY_PARAMS)
+                                        for u in UNITS}),
+    ("merge_hour_with_contract", lambda ctx: {u: merge_hour_with_contract(ctx["segments_to_hourly"][u],
+                                                                          ctx["contract"][u]) for u in UNITS}),
+    ("export_xlsx", _export("xlsx")),
+    ("export_xlsx_fast", _export("xlsx_fast")),
+]
+STAGE_NAMES = [name for name, _ in STAGES]
+# chặng không chặng nào khác cần -> bỏ qua được (--skip)
+OPTIONAL = ["read_any", "build_epc_per_pair", "ppa_segments_to_minutely[S]", "minutely_to_hourly_avg",
+            "merge_hour_with_contract", "export_xlsx", "export_xlsx_fast"]
+
+
+def _rows(out) -> int:
+    """Số dòng kết quả của chặng (để đọc kèm thời gian)."""
+    if isinstance(out, pd.DataFrame):
+        return len(out)
+    if isinstance(out, dict):
+        return sum(_rows(v) for v in out.values())
+    if isinstance(out, tuple):
+        return _rows(out[1]) if len(out) == 2 and isinstance(out[1], pd.DataFrame) else 0   # (segments, summary)
+    return 0
+
+
+# ===================== Đo =====================
+def run_size(n: int, repeat: int, memory: bool, skip, gen_kw: dict, fmt: str, tmp: str) -> dict:
+    """Sinh dispatch n lệnh / tổ máy, chạy mọi chặng. Trả về {chặng: {time_s, median_s, peak_mb, rows}}."""
+    path = write_dispatch(synthetic_dispatch(n, UNITS, **gen_kw), os.path.join(tmp, f"dispatch_{n}.{fmt}"))
+    ctx = {"path": path, "tmp": tmp}
+    out = {}
+    for name, fn in STAGES:
+        if name in skip:
+            continue
+        times = []
+        for _ in range(repeat):
+            gc.collect()
+            t0 = time.perf_counter()
+            res = fn(ctx)
+            times.append(time.perf_counter() - t0)
+        peak = None
+        if memory:
+            res = None                  # kết quả lần trước không tính vào đỉnh
+            gc.collect()
+            tracemalloc.start()
+            res = fn(ctx)
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        ctx[name] = res
+        if name == "segments_to_hourly":
+            ctx["contract"] = {u: synthetic_contract(res[u], seed=gen_kw.get("seed", 0)) for u in UNITS}
+        out[name] = {"time_s": min(times), "median_s": float(np.median(times)),
+                     "peak_mb": peak, "rows": _rows(res)}
+    if "build_ppa_per_pair" in ctx:
+        out["_pairs"] = {u: ctx["build_ppa_per_pair"][u][1]["EndReason"].value_counts().to_dict() for u in UNITS}
+    return out
+
+
+def scaling_exponent(sizes, times) -> float:
+    """Độ dốc log-log (bình phương tối thiểu) của thời gian theo n; thiếu dữ liệu -> NaN."""
+    pts = [(s, t) for s, t in zip(sizes, times) if t and t > 0]
+    if len(pts) < 2:
+        return float("nan")
+    x, y = np.log([p[0] for p in pts]), np.log([p[1] for p in pts])
+    return float(np.polyfit(x, y, 1)[0])
+
+
+# ===================== Báo cáo =====================
+def report(results: dict, sizes) -> str:
+    lines = []
+    head = f"{'chặng':<30}" + "".join(f"{f'n={n}':>26}" for n in sizes) + f"{'mũ':>7}"
+    lines.append(head)
+    lines.append(" " * 30 + "".join(f"{'ms / MB đỉnh / dòng':>26}" for _ in sizes))
+    for name in STAGE_NAMES:
+        cells = [results.get(str(n), {}).get(name) for n in sizes]
+        if not any(cells):
+            continue
+        row = f"{name:<30}"
+        for c in cells:
+            if c is None:
+                row += f"{'-':>26}"
+                continue
+            mem = f"{c['peak_mb']:.1f}" if c.get("peak_mb") is not None else "-"
+            row += f"{c['time_s'] * 1e3:>9.1f} {mem:>7} {c['rows']:>9}"
+        exp = scaling_exponent(sizes, [c["time_s"] if c else None for c in cells])
+        lines.append(row + f"{exp:>7.2f}")
+    for n in sizes:
+        pairs = results.get(str(n), {}).get("_pairs")
+        if pairs:
+            lines.append(f"n={n} EndReason PPA: " + " ; ".join(f"{u} {v}" for u, v in pairs.items()))
+    return "\n".join(lines)
+
+
+def compare(results: dict, baseline: dict, tolerance: float, mem_tolerance: float, min_delta_ms: float):
+    """
+    So với baseline cùng cỡ / chặng. Chậm: thời gian > baseline * (1 + tolerance) và hơn min_delta_ms;
+    tốn bộ nhớ: đỉnh > baseline * (1 + mem_tolerance). Trả về (dòng báo cáo, số chặng vượt ngưỡng).
+    """
+    lines, n_bad = [], 0
+    for size, stages in results.items():
+        base_stages = baseline.get("results", {}).get(size, {})
+        for name in STAGE_NAMES:
+            cur, ref = stages.get(name), base_stages.get(name)
+            if cur is None or ref is None:
+                continue
+            ratio = cur["time_s"] / ref["time_s"] if ref["time_s"] > 0 else float("inf")
+            slow = ratio > 1 + tolerance and (cur["time_s"] - ref["time_s"]) * 1e3 > min_delta_ms
+            fat = (cur.get("peak_mb") is not None and ref.get("peak_mb")
+                   and cur["peak_mb"] > ref["peak_mb"] * (1 + mem_tolerance))
+            tag = "CHẬM" if slow else ("NHANH" if ratio < 1 / (1 + tolerance) else "ok")
+            if fat:
+                tag += " +RAM"
+            n_bad += bool(slow or fat)
+            mem = (f"  {ref['peak_mb']:.1f} -> {cur['peak_mb']:.1f} MB"
+                   if cur.get("peak_mb") is not None and ref.get("peak_mb") is not None else "")
+            lines.append(f"n={size:<6} {name:<30} {ref['time_s'] * 1e3:>9.1f} -> {cur['time_s'] * 1e3:>9.1f} ms"
+                         f"  x{ratio:5.2f}{mem}  {tag}")
+    return lines, n_bad
+
+
+def plot_scaling(results: dict, sizes, path: str) -> None:
+    """Đường thời gian theo n (log-log) của từng chặng ra file ảnh."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for name in STAGE_NAMES:
+        pts = [(n, results[str(n)][name]["time_s"]) for n in sizes if name in results.get(str(n), {})]
+        if pts:
+            ax.plot([p[0] for p in pts], [p[1] * 1e3 for p in pts], marker="o", label=name)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("Số lệnh / tổ máy")
+    ax.set_ylabel("ms")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend(fontsize=8)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def baseline_path(name: str) -> str:
+    """Tên baseline -> benchmarks/baselines/<tên>.json ; đã là đường dẫn .json thì giữ nguyên."""
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, name + ".json")
+
+
+def _meta(args, gen_kw: dict) -> dict:
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": platform.node(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+        "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+        "repeat": args.repeat, "format": args.format, "generator": gen_kw,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark các chặng PPA / EPC trên dispatch giả lập.")
+    ap.add_argument("-n", "--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES),
+                    help="số lệnh / tổ máy cho từng cỡ (mặc định 200 800 3200)")
+    ap.add_argument("-r", "--repeat", type=int, default=3, help="số lần chạy mỗi chặng, lấy min (mặc định 3)")
+    ap.add_argument("-f", "--format", default="xlsx", choices=["xlsx", "csv"], help="định dạng file dispatch đầu vào")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--cut-density", type=float, default=0.2, help="tỉ lệ lệnh bị lệnh sau cắt giữa ramp")
+    ap.add_argument("--gap-freq", type=float, default=0.3, help="tỉ lệ lệnh có gap trước lệnh kế tiếp")
+    ap.add_argument("--mw-range", nargs=2, type=float, default=[200.0, 660.0], metavar=("MIN", "MAX"))
+    ap.add_argument("--skip", nargs="+", default=[], choices=OPTIONAL, help="bỏ qua các chặng này")
+    ap.add_argument("--no-memory", action="store_true", help="không đo bộ nhớ (nhanh hơn)")
+    ap.add_argument("--json", help="ghi kết quả đầy đủ ra file JSON")
+    ap.add_argument("--plot", help="vẽ đường scaling (log-log) ra file ảnh, vd scaling.png")
+    ap.add_argument("--save-baseline", metavar="TÊN", help="lưu kết quả thành baseline TÊN")
+    ap.add_argument("--compare", metavar="TÊN", help="so với baseline TÊN (hoặc đường dẫn .json)")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="ngưỡng chậm hơn baseline (mặc định 0.25 = 25%%)")
+    ap.add_argument("--mem-tolerance", type=float, default=0.25, help="ngưỡng bộ nhớ đỉnh hơn baseline")
+    ap.add_argument("--min-delta-ms", type=float, default=5.0, help="bỏ qua chênh lệch nhỏ hơn (nhiễu đo)")
+    args = ap.parse_args(argv)
+
+    gen_kw = {"seed": args.seed, "cut_density": args.cut_density, "gap_freq": args.gap_freq,
+              "mw_min": args.mw_range[0], "mw_max": args.mw_range[1]}
+    sizes = sorted(set(args.sizes))
+    baseline = None
+    if args.compare:
+        with open(baseline_path(args.compare), encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        if baseline.get("meta", {}).get("generator") != gen_kw:
+            print(f"Cảnh báo: tham số sinh dữ liệu khác baseline ({baseline.get('meta', {}).get('generator')})",
+                  file=sys.stderr)
+
+    warnings.simplefilter("ignore", FutureWarning)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="dim_bench_") as tmp:
+        for n in sizes:
+            t0 = time.perf_counter()
+            results[str(n)] = run_size(n, max(args.repeat, 1), not args.no_memory, set(args.skip),
+                                       gen_kw, args.format, tmp)
+            print(f"n={n}: xong trong {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    print(report(results, sizes))
+    doc = {"meta": _meta(args, gen_kw), "results": results}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(doc, fh, ensure_ascii=False, indent=1)
+    if args.plot:
+        plot_scaling(results, sizes, args.plot)
+    if args.save_baseline:
+        path = baseline_path(args.save_baseline)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(doc, fh, ensure_ascii=False, indent=1)
+        print(f"Đã lưu baseline: {path}")
+    if baseline is not None:
+        lines, n_bad = compare(results, baseline, args.tolerance, args.mem_tolerance, args.min_delta_ms)
+        print(f"\nSo với baseline {args.compare} ({baseline.get('meta', {}).get('created', '?')}):")
+        print("\n".join(lines) if lines else "(không có chặng / cỡ chung)")
+        if n_bad:
+            print(f"{n_bad} chặng vượt ngưỡng.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+# equivalence.py
+# So khớp kết quả (differential testing) giữa bản tham chiếu (reference_engines) và engine ứng viên
+# cho các chặng tính tiền: cặp PPA / EPC, chuỗi phút, trung bình giờ.
+#   python -m benchmarks.equivalence                               # 50 ca ngẫu nhiên x PPA / EPC
+#   python -m benchmarks.equivalence data/2024-*.xlsx --random 0   # chỉ file dispatch thật
+#   python -m benchmarks.equivalence --random 500 --orders 400 --seed 7 --mw-tol 1e-6
+#   python -m benchmarks.equivalence --candidate my_engines:FAST   # engine ứng viên khác (dict như CANDIDATE)
+# Mỗi chặng ứng viên nhận CÙNG đầu vào với bản tham chiếu (segments / phút của bản tham chiếu)
+# -> chỗ lệch được quy đúng cho chặng gây ra. Báo chỗ lệch đầu tiên của mỗi chặng: cặp (idx_pair,
+# cột / điểm), phút hoặc giờ (thời điểm, giá trị tham chiếu / ứng viên). Có ca lệch -> exit 1;
+# --save-failing DIR ghi DF bậc thang của ca lệch ra .pkl, chạy lại được: python -m ... DIR/*.pkl
+import argparse
+import importlib
+import os
+import re
+import sys
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Optional, Sequence
+from tab_module.main_window_modules.data_utils import NO_COMPLETION, make_step_df, make_unit_steps, read_dispatch
+from tab_module.calculation_modules.segment_store import SegmentStore
+from tab_module.calculation_modules.ppa_minutely import ppa_segments_to_minutely
+from tab_module.calculation_modules.ppa_hourly import segments_to_hourly
+from tab_module.calculation_modules.export_utils import minutely_to_hourly_avg
+from tab_module.calculation_modules.ramp_profile import prepare_step_arrays
+from tab_module.calculation_modules.pipeline import BUILDERS, HOURLY_PARAMS, extend_unit
+from benchmarks import reference_engines as ref
+from benchmarks.synthetic_dispatch import synthetic_orders
+
+# ===================== Engine =====================
+# Engine = dict các chặng (thiếu chặng nào thì chặng đó không so):
+#   build[mode](df_step) -> (segments, summary)
+#   minutely(segments, freq) -> DF phút (Thời điểm, MW)
+#   hourly(minutely_df, freq, drop_incomplete, label) -> DF giờ
+#   segments_hourly(segments, freq, drop_incomplete, label) -> DF giờ (thẳng từ segments, so với hourly tham chiếu)
+#   extend(mode, df_base, df_full) -> dict seg / sum / hour / s0 (tính tiếp sau khi ghi thêm lệnh) hoặc None
+APPEND_ORDERS = 5      # chặng incremental: bỏ chừng này lệnh cuối làm lần tính trước rồi tính tiếp
+
+
+def _extend(mode: str, df_base: pd.DataFrame, df_full: pd.DataFrame):
+    """Tính đầy đủ df_base như lần Calculate trước, rồi tính tiếp cho df_full (extend_unit)."""
+    seg, summ = BUILDERS[mode](df_base)
+    base = {"seg": seg, "sum": summ, "hour": segments_to_hourly(seg, **HOURLY_PARAMS),
+            "pts": prepare_step_arrays(df_base)}
+    return extend_unit(mode, df_full, base)
+
+
+REFERENCE = {
+    "build": ref.REFERENCE_BUILDERS,
+    "minutely": lambda seg, freq: ref.ppa_segments_to_minutely(SegmentStore.from_frames(seg).to_frames(), freq=freq),
+    "hourly": ref.minutely_to_hourly_avg,
+}
+CANDIDATE = {
+    "build": BUILDERS,
+    "minutely": lambda seg, freq: ppa_segments_to_minutely(seg, freq=freq),
+    "hourly": minutely_to_hourly_avg,
+    "segments_hourly": segments_to_hourly,
+    "extend": _extend,
+}
+
+# Kịch bản dữ liệu giả lập (tham số synthetic_orders), xoay vòng theo ca
+SCENARIOS = {
+    "mixed": {},
+    "cut_in_hold": {"cut_in_hold_share": 0.5, "level_share": 0.3},
+    "flat": {"flat_share": 0.4},
+    "minute": {"minute_share": 1.0},
+    "same_time": {"same_time_share": 0.15},
+    "dense_cuts": {"cut_density": 0.6, "gap_freq": 0.1},
+    "levels": {"level_share": 0.8},
+    "epc_cuts": {"profile": "EPC", "cut_density": 0.4, "cut_in_hold_share": 0.2},
+}
+
+
+class Tolerance:
+    """Sai số cho phép: MW |a - b| <= mw_abs + mw_rel * |a| ; thời điểm |a - b| <= time_ns."""
+    __slots__ = ("mw_abs", "mw_rel", "time_ns")
+
+    def __init__(self, mw_abs: float = 1e-9, mw_rel: float = 0.0, time_ns: int = 0):
+        self.mw_abs, self.mw_rel, self.time_ns = float(mw_abs), float(mw_rel), int(time_ns)
+
+    def mw_bad(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+        both_nan = np.isnan(a) & np.isnan(b)
+        with np.errstate(invalid="ignore"):
+            ok = np.abs(a - b) <= self.mw_abs + self.mw_rel * np.abs(a)
+        return ~(ok | both_nan)
+
+    def time_bad(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+        nat = np.iinfo(np.int64).min
+        both_nat = (a == nat) & (b == nat)
+        one_nat = (a == nat) ^ (b == nat)
+        return one_nat | (~both_nat & (np.abs(a - b) > self.time_ns))
+
+
+class Divergence:
+    """Chỗ lệch đầu tiên của 1 chặng."""
+    __slots__ = ("case", "mode", "unit", "stage", "where", "column", "ref", "cand")
+
+    def __init__(self, case, mode, unit, stage, where, column, ref_value, cand_value):
+        self.case, self.mode, self.unit, self.stage = case, mode, unit, stage
+        self.where, self.column, self.ref, self.cand = where, column, ref_value, cand_value
+
+    def __str__(self) -> str:
+        return (f"[{self.case}] {self.mode} {self.unit} {self.stage}: {self.where}, {self.column}: "
+                f"tham chiếu={_fmt(self.ref)} ứng viên={_fmt(self.cand)}")
+
+
+class Case:
+    """1 DF bậc thang (1 tổ máy) đem so."""
+    __slots__ = ("name", "unit", "df_step")
+
+    def __init__(self, name: str, unit: str, df_step: pd.DataFrame):
+        self.name, self.unit, self.df_step = name, unit, df_step
+
+
+def _fmt(v) -> str:
+    if isinstance(v, (np.datetime64, pd.Timestamp)):
+        return str(pd.Timestamp(v))
+    if isinstance(v, (float, np.floating)):
+        return f"{float(v):.12g}"
+    return repr(v)
+
+
+def _ns(s: pd.Series) -> np.ndarray:
+    """Cột thời điểm -> int64 ns (NaT = min int64)."""
+    return pd.to_datetime(s, errors="coerce").to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def _first(mask: np.ndarray) -> Optional[int]:
+    hit = np.flatnonzero(mask)
+    return int(hit[0]) if len(hit) else None
+
+
+# ===================== So từng chặng =====================
+def compare_summary(a: pd.DataFrame, b: pd.DataFrame, tol: Tolerance):
+    """Dòng / cột lệch đầu tiên của 2 bảng summary: (dòng, cột, giá trị a, giá trị b) hoặc None."""
+    n = min(len(a), len(b))
+    best = None
+    for col in list(dict.fromkeys(list(a.columns) + list(b.columns))):
+        if col not in a.columns or col not in b.columns:
+            other = b if col not in a.columns else a
+            if other[col].notna().any():
+                r = int(np.flatnonzero(other[col].notna().to_numpy())[0])
+                va, vb = (None, other[col].iloc[r]) if col not in a.columns else (other[col].iloc[r], None)
+                best = min(best or (r, col, va, vb), (r, col, va, vb), key=lambda x: x[0])
+            continue
+        x, y = a[col].iloc[:n], b[col].iloc[:n]
+        if col.endswith("Time") or col in ("HoldStart", "HoldEnd"):
+            bad = tol.time_bad(_ns(x), _ns(y))
+        elif col.endswith("MW"):
+            bad = tol.mw_bad(pd.to_numeric(x, errors="coerce"), pd.to_numeric(y, errors="coerce"))
+        else:
+            xo, yo = x.astype(object).to_numpy(), y.astype(object).to_numpy()
+            na = pd.isna(xo) & pd.isna(yo)
+            bad = ~na & np.array([str(p) != str(q) for p, q in zip(xo, yo)], dtype=bool)
+        r = _first(bad)
+        if r is not None and (best is None or r < best[0]):
+            best = (r, col, x.iloc[r], y.iloc[r])
+    if len(a) != len(b) and (best is None or best[0] >= n):
+        best = (n, "số dòng", len(a), len(b))
+    return best
+
+
+def compare_pairs(ref_out, cand_out, tol: Tolerance):
+    """
+    (segments, summary) tham chiếu vs ứng viên -> (vị trí, cột, giá trị tham chiếu, ứng viên) của
+    cặp lệch sớm nhất (summary hoặc điểm trong segment) hoặc None.
+    """
+    seg_a, sum_a = SegmentStore.from_frames(ref_out[0]), ref_out[1].reset_index(drop=True)
+    seg_b, sum_b = SegmentStore.from_frames(cand_out[0]), cand_out[1].reset_index(drop=True)
+    found = []
+    s = compare_summary(sum_a, sum_b, tol)
+    if s is not None:
+        found.append((s[0], f"summary.{s[1]}", s[2], s[3]))
+
+    n = min(seg_a.n_segments, seg_b.n_segments)
+    len_bad = _first(seg_a.lengths[:n] != seg_b.lengths[:n])
+    k_len = len_bad if len_bad is not None else (n if seg_a.n_segments != seg_b.n_segments else None)
+    stop = k_len if k_len is not None else n
+    rows = int(seg_a.offsets[stop])              # các segment trước stop cùng số điểm
+    ev_a, ev_b = seg_a.event_labels(slice(0, rows)), seg_b.event_labels(slice(0, rows))
+    checks = [("Event", ev_a != ev_b, ev_a, ev_b),
+              ("Thời điểm", tol.time_bad(seg_a.t_ns[:rows], seg_b.t_ns[:rows]),
+               seg_a.t_ns[:rows].view("datetime64[ns]"), seg_b.t_ns[:rows].view("datetime64[ns]")),
+              ("MW", tol.mw_bad(seg_a.mw[:rows], seg_b.mw[:rows]), seg_a.mw[:rows], seg_b.mw[:rows])]
+    for col, bad, va, vb in checks:
+        r = _first(bad)
+        if r is not None:
+            k = int(seg_a.pair_id[r])
+            found.append((k, f"segment.{col} (điểm {r - int(seg_a.offsets[k])})", va[r], vb[r]))
+    if k_len is not None:
+        la = int(seg_a.lengths[k_len]) if k_len < seg_a.n_segments else None
+        lb = int(seg_b.lengths[k_len]) if k_len < seg_b.n_segments else None
+        found.append((k_len, "segment.số điểm", la, lb))
+    if not found:
+        return None
+    k, col, va, vb = min(found, key=lambda x: x[0])
+    label = sum_a["idx_pair"].iloc[k] if "idx_pair" in sum_a.columns and k < len(sum_a) else k
+    return f"cặp {label} (segment {k})", col, va, vb
+
+
+def compare_series(a: pd.DataFrame, b: pd.DataFrame, tol: Tolerance, value: str = "MW"):
+    """
+    DF (Thời điểm, MW) tham chiếu vs ứng viên -> (vị trí, cột, tham chiếu, ứng viên) của mốc lệch
+    đầu tiên hoặc None. Lệch mốc thời gian (thừa / thiếu tick) báo tại tick đầu tiên khác nhau.
+    """
+    ta, tb = _ns(a["Thời điểm"]) if len(a) else np.zeros(0, np.int64), _ns(b["Thời điểm"]) if len(b) else np.zeros(0, np.int64)
+    va = pd.to_numeric(a[value], errors="coerce").to_numpy(dtype=float) if len(a) else np.zeros(0)
+    vb = pd.to_numeric(b[value], errors="coerce").to_numpy(dtype=float) if len(b) else np.zeros(0)
+    n = min(len(ta), len(tb))
+    r_t = _first(tol.time_bad(ta[:n], tb[:n]))
+    r_v = _first(tol.mw_bad(va[:n], vb[:n]))
+    if r_t is not None and (r_v is None or r_t <= r_v):
+        return (f"dòng {r_t}", "Thời điểm", ta[r_t].view("datetime64[ns]"), tb[r_t].view("datetime64[ns]"))
+    if r_v is not None:
+        return f"{pd.Timestamp(ta[r_v])} (dòng {r_v})", value, va[r_v], vb[r_v]
+    if len(ta) != len(tb):
+        extra = ta if len(ta) > len(tb) else tb
+        return (f"dòng {n} ({pd.Timestamp(extra[n])}, "
+                f"{'chỉ tham chiếu' if len(ta) > len(tb) else 'chỉ ứng viên'} có)", "số dòng", len(ta), len(tb))
+    return None
+
+
+# ===================== Chạy 1 ca =====================
+def check_case(case: Case, modes: Sequence[str], reference: Dict, candidate: Dict, tol: Tolerance,
+               freqs: Sequence[str] = ("T",), timings: Optional[Dict[str, List[float]]] = None) -> List[Divergence]:
+    """So mọi chặng của 1 ca cho từng mode; trả về chỗ lệch đầu tiên của từng chặng lệch."""
+    out = []
+    timings = {} if timings is None else timings
+
+    def timed(fn, *args, **kw):
+        t0 = time.perf_counter()
+        res = fn(*args, **kw)
+        return res, time.perf_counter() - t0
+
+    def record(stage, ref_t, cand_t):
+        acc = timings.setdefault(stage, [0.0, 0.0])
+        acc[0] += ref_t
+        acc[1] += cand_t
+
+    def diverged(mode, stage, d):
+        if d is not None:
+            out.append(Divergence(case.name, mode, case.unit, stage, *d))
+
+    hour_kw = {"drop_incomplete": HOURLY_PARAMS["drop_incomplete"], "label": HOURLY_PARAMS["label"]}
+    for mode in modes:
+        if mode not in reference["build"] or mode not in candidate.get("build", {}):
+            continue
+        ref_pairs, t_ref = timed(reference["build"][mode], case.df_step)
+        cand_pairs, t_cand = timed(candidate["build"][mode], case.df_step)
+        record(f"{mode} pairs", t_ref, t_cand)
+        diverged(mode, "pairs", compare_pairs(ref_pairs, cand_pairs, tol))
+
+        seg = SegmentStore.from_frames(ref_pairs[0])
+        ref_hours = {}
+        for freq in freqs:
+            ref_min, t_ref_min = timed(reference["minutely"], seg, freq)
+            if "minutely" in candidate:
+                cand_min, t_cand = timed(candidate["minutely"], seg, freq)
+                record(f"{mode} minutely[{freq}]", t_ref_min, t_cand)
+                diverged(mode, f"minutely[{freq}]", compare_series(ref_min, cand_min, tol))
+            ref_hour, t_ref = timed(reference["hourly"], ref_min, freq=freq, **hour_kw)
+            if "hourly" in candidate:
+                cand_hour, t_cand = timed(candidate["hourly"], ref_min, freq=freq, **hour_kw)
+                record(f"{mode} hourly[{freq}]", t_ref, t_cand)
+                diverged(mode, f"hourly[{freq}]", compare_series(ref_hour, cand_hour, tol))
+            if "segments_hourly" in candidate:
+                cand_hour, t_cand = timed(candidate["segments_hourly"], seg, freq=freq, **hour_kw)
+                record(f"{mode} segments_hourly[{freq}]", t_ref_min + t_ref, t_cand)   # vs phút + giờ tham chiếu
+                diverged(mode, f"segments_hourly[{freq}]", compare_series(ref_hour, cand_hour, tol))
+            ref_hours[freq] = ref_hour
+
+        # ghi thêm APPEND_ORDERS lệnh (2 mốc / lệnh) -> tính tiếp phải ra đúng bản đầy đủ và chỉ dựng
+        # lại phần đuôi: mỗi mốc mới <= 2 dòng summary (cặp + gap pair), thêm cặp nối mốc cuối cũ
+        n_base = len(case.df_step) - 2 * APPEND_ORDERS
+        if "extend" in candidate and n_base >= 3:
+            got, t_cand = timed(candidate["extend"], mode, case.df_step.iloc[:n_base], case.df_step)
+            record(f"{mode} incremental", 0.0, t_cand)
+            if got is None:
+                diverged(mode, "incremental", ("tính tiếp", "kết quả", "tính lại đầy đủ", None))
+                continue
+            diverged(mode, "incremental", compare_pairs(ref_pairs, (got["seg"], got["sum"]), tol))
+            limit = 2 * (2 * APPEND_ORDERS + 1)
+            if len(got["sum"]) - got["s0"] > limit:
+                diverged(mode, "incremental", (f"s0={got['s0']}", "số cặp tính lại (tham chiếu = giới hạn)", limit,
+                                               len(got["sum"]) - got["s0"]))
+            if HOURLY_PARAMS["freq"] in ref_hours:
+                diverged(mode, "incremental.hour", compare_series(ref_hours[HOURLY_PARAMS["freq"]], got["hour"], tol))
+    return out
+
+
+# ===================== Nguồn ca =====================
+def workbook_cases(paths: Sequence[str], units: Sequence[str] = ("S1", "S2")) -> Iterator[Case]:
+    """File dispatch thật (.xlsx / .csv / ...) -> 1 ca / tổ máy; .pkl = DF bậc thang đã lưu (--save-failing)."""
+    for path in paths:
+        name = os.path.basename(path)
+        if path.lower().endswith(".pkl"):
+            yield Case(name, "-", pd.read_pickle(path))
+            continue
+        steps = make_unit_steps(read_dispatch(path, units))
+        for u, df in steps.items():
+            if len(df):
+                yield Case(name, u, df)
+
+
+def synthetic_case(k: int, n_orders: int, seed: int = 0) -> Case:
+    """Ca ngẫu nhiên thứ k: kịch bản SCENARIOS xoay vòng, seed + k, dải MW xê dịch ngẫu nhiên."""
+    scenario = list(SCENARIOS)[k % len(SCENARIOS)]
+    rng = np.random.default_rng(seed + k)
+    kw = {"mw_min": float(rng.choice([150.0, 200.0, 300.0])), "mw_max": float(rng.choice([480.0, 600.0, 660.0]))}
+    kw.update(SCENARIOS[scenario])
+    orders = synthetic_orders(n_orders, seed=seed + k, **kw)
+    orders.loc[1:, "Thời điểm hoàn thành"] = NO_COMPLETION     # như read_dispatch
+    return Case(f"synthetic#{k} {scenario} seed={seed + k}", "S1", make_step_df(orders))
+
+
+def load_engine(spec: str) -> Dict:
+    """"module:thuộc_tính" -> dict engine (xem CANDIDATE)."""
+    module, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module), attr or "CANDIDATE")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="So kết quả engine ứng viên với bản tham chiếu (cặp / phút / giờ).")
+    ap.add_argument("inputs", nargs="*", help="file dispatch thật hoặc .pkl DF bậc thang (--save-failing)")
+    ap.add_argument("--random", type=int, default=50, help="số ca dispatch ngẫu nhiên (mặc định 50)")
+    ap.add_argument("--orders", type=int, default=200, help="số lệnh mỗi ca ngẫu nhiên (mặc định 200)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("-m", "--mode", nargs="+", default=["PPA", "EPC"], type=str.upper, choices=sorted(BUILDERS))
+    ap.add_argument("--freq", nargs="+", default=["T"], help="tần suất chuỗi phút đem so (mặc định T)")
+    ap.add_argument("--candidate", help="engine ứng viên dạng module:thuộc_tính (mặc định engine hiện tại)")
+    ap.add_argument("--mw-tol", type=float, default=1e-9, help="sai số MW tuyệt đối cho phép")
+    ap.add_argument("--mw-rel", type=float, default=0.0, help="sai số MW tương đối cho phép")
+    ap.add_argument("--time-tol", type=float, default=0.0, help="sai số thời điểm cho phép (giây)")
+    ap.add_argument("--save-failing", metavar="DIR", help="ghi DF bậc thang của ca lệch ra DIR/*.pkl")
+    ap.add_argument("--max-fail", type=int, default=0, help="dừng sau chừng này ca lệch (0 = chạy hết)")
+    args = ap.parse_args(argv)
+
+    warnings.simplefilter("ignore", FutureWarning)   # bản tham chiếu dùng alias tần suất cũ ("1H", "T")
+    candidate = load_engine(args.candidate) if args.candidate else CANDIDATE
+    tol = Tolerance(args.mw_tol, args.mw_rel, int(round(args.time_tol * 1e9)))
+
+    def cases():
+        yield from workbook_cases(args.inputs)
+        for k in range(args.random):
+            yield synthetic_case(k, args.orders, args.seed)
+
+    timings, n_cases, failed = {}, 0, []
+    t0 = time.perf_counter()
+    for case in cases():
+        n_cases += 1
+        try:
+            divs = check_case(case, args.mode, REFERENCE, candidate, tol, args.freq, timings)
+        except Exception as ex:   # 1 bên lỗi, bên kia không -> cũng là lệch
+            divs = [Divergence(case.name, "/".join(args.mode), case.unit, "lỗi", type(ex).__name__, str(ex), None, None)]
+        if not divs:
+            continue
+        failed.append(case)
+        for d in divs:
+            print(d)
+        if args.save_failing:
+            os.makedirs(args.save_failing, exist_ok=True)
+            safe = re.sub(r"[^\w.=#-]+", "_", f"{case.name}_{case.unit}")
+            case.df_step.to_pickle(os.path.join(args.save_failing, safe + ".pkl"))
+        if args.max_fail and len(failed) >= args.max_fail:
+            break
+
+    print(f"\n{n_cases} ca, {len(failed)} ca lệch, {time.perf_counter() - t0:.1f}s")
+    for stage, (t_ref, t_cand) in timings.items():
+        if t_ref or t_cand:
+            speed = f"x{t_ref / t_cand:.1f}" if t_cand > 0 and t_ref > 0 else "-"
+            print(f"  {stage:<26} tham chiếu {t_ref:8.2f}s  ứng viên {t_cand:8.2f}s  {speed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
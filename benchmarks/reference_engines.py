@@ -0,0 +1,313 @@
+# reference_engines.py
+import math
+import pandas as pd
+from functools import partial
+from typing import List, Optional, Tuple
+from tab_module.calculation_modules.ppa_calculation import build_ppa_per_pair
+from tab_module.calculation_modules.epc_calculation import build_epc_per_pair
+
+# Bản tham chiếu ("golden") của các chặng tính tiền, dùng cho equivalence.py:
+#   - build_*_per_pair: engine="loop" (bản duyệt từng cặp, vẫn nằm trong code chính); sort mốc
+#     theo thời điểm bằng kind="stable" như prepare_step_arrays (mốc trùng thời điểm giữ thứ tự
+#     dòng -> ghi thêm lệnh không đảo các mốc trùng ở đầu file, incremental dùng lại được tiền tố)
+#   - ppa_segments_to_minutely, minutely_to_hourly_avg: bản gốc trước khi vector hóa,
+#     chép nguyên văn (Timestamp / date_range từng segment, groupby từng giờ) -> KHÔNG sửa,
+#     KHÔNG tối ưu; app không dùng module này.
+#     Khác bản gốc đúng 1 chỗ: sort_values(..., kind="stable") trong ppa_segments_to_minutely.
+#     Bản gốc dùng quicksort (numpy trên CPU có AVX-512 sort bằng SIMD, không ổn định) nên tick
+#     trùng giữa 2 segment / event trùng thời điểm lấy giá trị nào tùy máy; stable cố định quy ước
+#     "dòng sau thắng" (segment sau thắng) mà engine hiện tại tuân theo.
+
+REFERENCE_BUILDERS = {
+    "PPA": partial(build_ppa_per_pair, engine="loop"),
+    "EPC": partial(build_epc_per_pair, engine="loop"),
+}
+
+
+# ===== Helper: chuyển freq -> Timedelta an toàn ("T","S","H","30S","5T", Timedelta, ...) =====
+def _freq_to_timedelta(freq):
+    """
+    Chuyển freq như 'T','S','H','30S','5T' hoặc Timedelta thành pd.Timedelta.
+    Nếu freq chỉ là đơn vị (toàn chữ), tự động thêm '1' ở trước.
+    """
+    if isinstance(freq, pd.Timedelta):
+        return freq
+    if isinstance(freq, str):
+        f = freq.strip()
+        try:
+            return pd.to_timedelta(f)          # '30S','5T' OK
+        except Exception:
+            if f.isalpha():                    # 'T','S','H'...
+                return pd.to_timedelta("1" + f)
+            raise
+    return pd.to_timedelta(freq)
+
+def minutely_to_hourly_avg(minutely_df: pd.DataFrame,
+                           freq: str = "T",
+                           drop_incomplete: bool = True,
+                           return_energy: bool = False,
+                           label: str = "left") -> pd.DataFrame:
+    """
+    TÍNH THEO HÌNH THANG (không nội suy).
+    label="left": nhãn = đầu giờ -> [HH:00, HH+1:00)
+    label="right": nhãn = cuối giờ -> (HH-1:00, HH]
+    """
+    if label not in ("left", "right"):
+        raise ValueError("label phải là 'left' hoặc 'right'")
+    col_val = "MWh" if return_energy else "MW"
+
+    if (minutely_df is None or minutely_df.empty or
+        "Thời điểm" not in minutely_df.columns or
+        "MW" not in minutely_df.columns):
+        return pd.DataFrame(columns=["Thời điểm", col_val])
+
+    df = minutely_df.copy()
+    df["Thời điểm"] = pd.to_datetime(df["Thời điểm"], errors="coerce")
+    df["MW"] = pd.to_numeric(df["MW"], errors="coerce")
+    df = df.dropna(subset=["Thời điểm", "MW"]).sort_values("Thời điểm").reset_index(drop=True)
+    if df.empty:
+        return pd.DataFrame(columns=["Thời điểm", col_val])
+
+    s = df.set_index("Thời điểm")["MW"].sort_index()
+
+    hours, values = [], []
+    one_hour = pd.Timedelta("1H")
+    dt = _freq_to_timedelta(freq)
+    if dt <= pd.Timedelta(0):
+        raise ValueError("freq không hợp lệ.")
+    dt_hours = float(dt / pd.Timedelta(hours=1))
+
+    #for hour, grp in s.groupby(pd.Grouper(freq="H", label=label, closed=label)):# đang lấy từ 01-00
+    for hour, grp in s.groupby(pd.Grouper(freq="H", label=label, closed=label)):
+        # Xác định cửa sổ theo label
+        if label == "left":
+            left, right = hour, hour + one_hour       # [HH:00, HH+1:00)
+        else:
+            left, right = hour - one_hour, hour       # (HH-1:00, HH]
+
+        # CẮT CỬA SỔ BAO GỒM CẢ HAI BIÊN: [left, right]
+        window = s.loc[left:right]
+
+        # Nếu cần “đủ mẫu” theo bước freq (ví dụ "T"): kỳ vọng = 1H/dt + 1 (gồm cả 2 biên)
+        if drop_incomplete:
+            expected_ticks = int(pd.Timedelta("1H") / dt) + 1
+            if len(window) < expected_ticks:
+                continue
+
+        if window.empty:
+            continue
+
+        value = window.mean()  # TRUNG BÌNH GỒM CẢ MỐC HH:00 VÀ HH+1:00
+
+        # Gán nhãn: với label="right" → nhãn giờ = HH+1:00; với "left" → = HH:00
+        out_hour = hour
+        hours.append(out_hour)
+        values.append(float(value))
+
+
+    hourly_series = pd.Series(values, index=hours).sort_index()
+    if hourly_series.empty:
+        return pd.DataFrame(columns=["Thời điểm", col_val])
+
+    # if drop_incomplete:
+    #     expected_intervals = int(pd.Timedelta("1H") / dt)  # N khoảng
+    #     counts = s.resample("H", label=label, closed=label).count()  # đếm N tick trong cửa sổ
+    #     hourly_series = hourly_series[
+    #         counts.reindex(hourly_series.index).fillna(0).astype(int) >= expected_intervals
+    #     ]
+
+    out = hourly_series.reset_index()
+    out.columns = ["Thời điểm", col_val]
+    return out
+
+
+def ppa_segments_to_minutely(
+    segments: List[pd.DataFrame],
+    freq: str = "T",                   # "T" = 1 phút; ví dụ "30S", "5T"...
+    include_pair_idx: bool = False,    # gắn pair_idx cho từng mốc phút
+    include_edge_minutes: bool = True, # thêm mốc phút trùng EXACT với event trong segment
+    eps: float = 1e-6,                 # nhận diện flat: |m1 - m0| <= eps
+    gap_policy: str = "none",          # "none" | "nan" | "ffill" | "bridge_linear"
+) -> pd.DataFrame:
+    """
+    Chuyển các segments (đã CUT/SNAP) thành chuỗi phút theo tần suất 'freq'.
+
+    NGUYÊN TẮC CHÍNH (NO-BRIDGE):
+      - Bên trong MỖI segment:
+          * HOLD (m1≈m0): giữ phẳng.
+          * RAMP: nội suy tuyến tính theo CHÍNH 2 mốc của segment.
+      - GIỮA HAI segment (khoảng trống/gap): mặc định KHÔNG sinh dữ liệu.
+        Có thể bật qua 'gap_policy':
+          * "none"          : không tạo điểm trong gap.
+          * "nan"           : tạo điểm phút trong gap với MW = NaN.
+          * "ffill"         : tạo điểm phút trong gap và điền MW = MW cuối của segment trước.
+          * "bridge_linear" : nội suy tuyến tính từ (t_end,m_end) -> (t_start_next,m_start_next).
+
+    Ghi chú:
+      - Nếu hai segment CHẠM BIÊN (t_end == t_start_next) → không có gap.
+      - Nếu một mốc event trùng phút, tick ở biên sẽ thuộc segment tương ứng,
+        không để gap lấn vào (đã xử lý biên trái/phải cho an toàn).
+    """
+    # ---------- Helpers ----------
+    def _floor_tick(ts: pd.Timestamp, f: str) -> pd.Timestamp:
+        return pd.to_datetime(ts).floor(f)
+
+    def _ceil_tick(ts: pd.Timestamp, f: str) -> pd.Timestamp:
+        ts = pd.to_datetime(ts)
+        fl = ts.floor(f)
+        return ts if fl == ts else fl + pd.tseries.frequencies.to_offset(f)
+
+    def _freq_offset(f: str):
+        return pd.tseries.frequencies.to_offset(f)
+
+    def _normalize_segment(seg: pd.DataFrame) -> Optional[pd.DataFrame]:
+        if seg is None or getattr(seg, "empty", True):
+            return None
+        s = seg.copy()
+        s["Thời điểm"] = pd.to_datetime(s["Thời điểm"], errors="coerce")
+        s["MW"] = pd.to_numeric(s["MW"], errors="coerce")
+        s = s.dropna(subset=["Thời điểm", "MW"]).sort_values("Thời điểm", kind="stable").reset_index(drop=True)
+        return s if len(s) >= 2 else None
+
+    def _interp_segment(times: List[pd.Timestamp], mws: List[float], ticks: List[pd.Timestamp]) -> List[Tuple[pd.Timestamp, float]]:
+        """Nội suy ticks CHỈ dựa vào timeline của 1 segment."""
+        out = []
+        if len(times) < 2 or not ticks:
+            return out
+        k = 0
+        for tick in ticks:
+            while k + 1 < len(times) and tick > times[k+1]:
+                k += 1
+            if k + 1 >= len(times):
+                break
+            t0, t1 = times[k], times[k+1]
+            m0, m1 = mws[k],  mws[k+1]
+            if tick < t0:
+                val = m0
+            else:
+                dur = (t1 - t0).total_seconds()
+                if dur <= 0:
+                    val = m1
+                elif abs(m1 - m0) <= eps:     # HOLD phẳng
+                    val = m0 if tick < t1 else m1
+                else:                          # RAMP tuyến tính
+                    frac = (tick - t0).total_seconds() / dur
+                    if frac < 0: frac = 0.0
+                    if frac > 1: frac = 1.0
+                    val = m0 + (m1 - m0) * frac
+            out.append((tick, float(val)))
+        return out
+
+    def _gap_ticks(t_end: pd.Timestamp, t_start_next: pd.Timestamp, f: str) -> List[pd.Timestamp]:
+        """Sinh ticks trong gap (loại trừ chồng biên với 2 segment)."""
+        off = _freq_offset(f)
+        # Bên trái: nếu t_end trùng phút → bắt đầu từ t_end + off
+        left = _ceil_tick(t_end, f)
+        if _floor_tick(t_end, f) == t_end:
+            left = t_end + off
+        # Bên phải: nếu t_start_next trùng phút → kết thúc ở t_start_next - off
+        right = _floor_tick(t_start_next, f)
+        if _floor_tick(t_start_next, f) == t_start_next:
+            right = t_start_next - off
+        if right < left:
+            return []
+        return list(pd.date_range(start=left, end=right, freq=f))
+
+    # ---------- Chuẩn hóa toàn bộ segments ----------
+    norm = []
+    for i, seg in enumerate(segments):
+        s = _normalize_segment(seg)
+        if s is None:
+            continue
+        t0, t1 = s["Thời điểm"].iloc[0], s["Thời điểm"].iloc[-1]
+        norm.append((i, s, t0, t1))
+
+    if not norm:
+        cols = ["pair_idx", "Thời điểm", "MW"] if include_pair_idx else ["Thời điểm", "MW"]
+        return pd.DataFrame(columns=cols)
+
+    # Bảo toàn thứ tự input (pair_idx tăng dần)
+    rows: List[Tuple] = []
+
+    # ---------- Lấy mẫu phút TRONG từng segment ----------
+    for i, s, t0, t1 in norm:
+        start_tick = _ceil_tick(t0, freq)
+        end_tick   = _floor_tick(t1, freq)
+        ticks = list(pd.date_range(start=start_tick, end=end_tick, freq=freq)) if end_tick >= start_tick else []
+
+        if include_edge_minutes:
+            # chỉ thêm các event trùng EXACT mốc phút, và phải nằm trong phạm vi segment
+            edges = [t for t in s["Thời điểm"].tolist() if _floor_tick(t, freq) == t and t0 <= t <= t1]
+            ticks = sorted(set(ticks + edges))
+
+        times = s["Thời điểm"].tolist()
+        mws   = s["MW"].astype(float).tolist()
+        interp = _interp_segment(times, mws, ticks)
+
+        if include_pair_idx:
+            rows += [(i, t, v) for (t, v) in interp]
+        else:
+            rows += [(t, v) for (t, v) in interp]
+
+    # ---------- Xử lý GAP giữa các segment (tùy chọn) ----------
+    gp = (gap_policy or "none").lower()
+    if gp not in {"none", "nan", "ffill", "bridge_linear"}:
+        gp = "none"
+
+    if gp != "none":
+        for k in range(len(norm) - 1):
+            i, s_i, t0_i, t1_i = norm[k]
+            j, s_j, t0_j, t1_j = norm[k+1]
+            # Chỉ là gap khi t1_i < t0_j
+            if not (t1_i < t0_j):
+                continue
+
+            ticks_gap = _gap_ticks(t1_i, t0_j, freq)
+            if not ticks_gap:
+                continue
+
+            if gp == "nan":
+                if include_pair_idx:
+                    rows += [(i, t, math.nan) for t in ticks_gap]
+                else:
+                    rows += [(t, math.nan) for t in ticks_gap]
+
+            elif gp == "ffill":
+                mw_last = float(s_i["MW"].iloc[-1])
+                if include_pair_idx:
+                    rows += [(i, t, mw_last) for t in ticks_gap]
+                else:
+                    rows += [(t, mw_last) for t in ticks_gap]
+
+            elif gp == "bridge_linear":
+                tL, mL = s_i["Thời điểm"].iloc[-1], float(s_i["MW"].iloc[-1])
+                tR, mR = s_j["Thời điểm"].iloc[0],  float(s_j["MW"].iloc[0])
+                dur = (tR - tL).total_seconds()
+                for t in ticks_gap:
+                    if dur <= 0:
+                        val = mL
+                    else:
+                        frac = (t - tL).total_seconds() / dur
+                        if frac < 0: frac = 0.0
+                        if frac > 1: frac = 1.0
+                        val = mL + (mR - mL) * frac
+                    if include_pair_idx:
+                        rows.append((i, t, float(val)))  # gán về pair trước theo quy ước cũ
+                    else:
+                        rows.append((t, float(val)))
+
+    # ---------- Trả kết quả ----------
+    cols = ["pair_idx", "Thời điểm", "MW"] if include_pair_idx else ["Thời điểm", "MW"]
+    out = pd.DataFrame(rows, columns=cols)
+    if out.empty:
+        return out
+
+    if include_pair_idx:
+        out = (out.sort_values(["pair_idx", "Thời điểm"])
+                 .drop_duplicates(subset=["pair_idx", "Thời điểm"], keep="last")
+                 .reset_index(drop=True))
+    else:
+        out = (out.sort_values("Thời điểm", kind="stable")
+                 .drop_duplicates(subset=["Thời điểm"], keep="last")
+                 .reset_index(drop=True))
+    return out
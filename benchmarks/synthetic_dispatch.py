@@ -0,0 +1,170 @@
+# synthetic_dispatch.py
+import numpy as np
+import pandas as pd
+from typing import Optional, Sequence
+from tab_module.main_window_modules.data_utils import POSITION_INDEXES, REQUIRED_COLS
+from tab_module.calculation_modules.ppa_calculation import ppa_profile
+from tab_module.calculation_modules.epc_calculation import epc_profile
+from tab_module.calculation_modules.ramp_profile import NS_PER_SEC
+
+# Sinh file dispatch giả lập (cùng bố cục cột như file thật, đọc được bằng read_any / read_dispatch)
+# để đo hiệu năng / so kết quả mà không cần dữ liệu vận hành:
+#   - số lệnh, dải MW (mặc định băng qua 330 / 429 / 462), tỉ lệ lệnh rơi đúng mốc
+#   - mật độ cắt (lệnh sau tới khi lệnh trước chưa ramp xong / đang hold) và tần suất gap
+#   - lệnh phẳng (cùng MW), lệnh tròn phút, lệnh trùng thời điểm
+# Thời lượng ramp / hold ước lượng bằng chính RampProfile (ppa_profile / epc_profile), nên
+# "cắt" / "gap" sinh ra đúng là cắt / gap khi tính lại; số thật xem EndReason trong summary.
+
+LEVELS = (330.0, 429.0, 462.0)          # mốc hold / đổi tốc độ của PPA và EPC
+PROFILES = {"PPA": ppa_profile, "EPC": epc_profile}
+TIME_TEXT_FMT = "%d/%m/%Y %H:%M:%S"     # như file xuất từ hệ thống điều độ (dayfirst)
+COMPLETION_SEC = 60                     # "Thời điểm hoàn thành" = BĐTH + 60 s
+
+
+def _raw_columns() -> list:
+    """Tên cột bố cục file thật: REQUIRED_COLS ở đúng POSITION_INDEXES, còn lại cột phụ."""
+    cols = [f"Cột {i + 1}" for i in range(max(POSITION_INDEXES) + 1)]
+    for pos, name in zip(POSITION_INDEXES, REQUIRED_COLS):
+        cols[pos] = name
+    cols[0], cols[1] = "STT", "Ngày"
+    return cols
+
+
+def synthetic_orders(n_orders: int,
+                     seed: int = 0,
+                     start: str = "2024-12-01 00:00:00",
+                     mw_min: float = 200.0,
+                     mw_max: float = 660.0,
+                     level_share: float = 0.15,
+                     flat_share: float = 0.05,
+                     cut_density: float = 0.2,
+                     cut_in_hold_share: float = 0.05,
+                     gap_freq: float = 0.3,
+                     gap_sec: Sequence[int] = (5 * 60, 60 * 60),
+                     minute_share: float = 0.3,
+                     same_time_share: float = 0.0,
+                     profile: str = "PPA") -> pd.DataFrame:
+    """
+    Lệnh của 1 tổ máy (thứ tự thời gian). Mỗi lệnh:
+      - MW đích: level_share rơi đúng 1 mốc LEVELS, flat_share giữ MW lệnh trước,
+        còn lại đều trong [mw_min, mw_max] (3 số lẻ)
+      - lệnh kế tiếp tới sau lệnh này:
+          * cut_in_hold_share: giữa lúc hold (chỉ lệnh có hold)
+          * cut_density      : giữa lúc ramp (10–90% thời lượng ramp)
+          * gap_freq         : sau khi ramp xong gap_sec[0]..gap_sec[1] giây
+          * còn lại          : đúng lúc ramp xong (cặp chạm biên, không gap)
+      - minute_share: BĐTH làm tròn lên phút chẵn ; same_time_share: trùng BĐTH lệnh trước
+    Trả về DataFrame: Case, CS ra lệnh (MW), CS hoàn thành (MW), Thời điểm BĐTH,
+    Thời điểm hoàn thành (datetime64), Dừng lệnh ("x" ở lệnh bị cắt).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(n_orders)
+    levels = np.asarray(LEVELS, dtype=float)
+
+    mw = np.round(rng.uniform(mw_min, mw_max, n), 3)
+    kind = rng.random(n)
+    on_level = kind < level_share
+    mw[on_level] = rng.choice(levels, int(on_level.sum()))
+    flat = (kind >= level_share) & (kind < level_share + flat_share)
+    flat[0] = False
+    for i in np.flatnonzero(flat):      # lệnh phẳng nối tiếp nhau -> cùng MW gốc
+        mw[i] = mw[i - 1]
+
+    # thời lượng ramp / hold của từng lệnh tính từ MW lệnh trước (t0 = 0)
+    m0 = np.concatenate(([mw[0]], mw[:-1]))
+    traj = PROFILES[profile]().trajectories(np.zeros(n, dtype=np.int64), m0, mw)
+    ramp = traj.finish.astype(float) / NS_PER_SEC
+    has_hold = traj.has_hold.any(axis=1)
+    k = np.argmax(traj.has_hold, axis=1)
+    hold_start = traj.hold_start[np.arange(n), k] / NS_PER_SEC
+    hold_end = traj.hold_end[np.arange(n), k] / NS_PER_SEC
+
+    # khoảng tới lệnh kế tiếp
+    r = rng.random(n)
+    frac = rng.uniform(0.1, 0.9, n)
+    step = np.ceil(ramp)
+    in_hold = has_hold & (r < cut_in_hold_share)
+    in_ramp = ~in_hold & (ramp > 0) & (r >= cut_in_hold_share) & (r < cut_in_hold_share + cut_density)
+    gap = ~in_hold & ~in_ramp & (r >= cut_in_hold_share + cut_density) \
+        & (r < cut_in_hold_share + cut_density + gap_freq)
+    step[in_hold] = np.floor(hold_start + frac * (hold_end - hold_start))[in_hold]
+    step[in_ramp] = np.floor(frac * ramp)[in_ramp]
+    step[gap] += rng.integers(int(gap_sec[0]), int(gap_sec[1]) + 1, int(gap.sum()))
+    step = np.maximum(step, 1)
+    step[rng.random(n) < same_time_share] = 0
+
+    t = np.datetime64(pd.Timestamp(start), "s") + np.concatenate(([0], np.cumsum(step[:-1]))).astype("timedelta64[s]")
+    to_minute = (rng.random(n) < minute_share) & (step > 0)
+    t_min = t.astype("datetime64[m]")
+    t = np.where(to_minute & (t != t_min), (t_min + 1).astype("datetime64[s]"), t)
+    t = np.maximum.accumulate(t)        # làm tròn phút không đảo thứ tự lệnh
+
+    case = rng.choice(np.array(["A", "B", "1", "2"], dtype=object), n)
+    stop = np.full(n, None, dtype=object)
+    stop[in_hold | in_ramp] = "x"
+    return pd.DataFrame({
+        "Case": case,
+        "CS ra lệnh (MW)": mw,
+        "CS hoàn thành (MW)": mw,
+        "Thời điểm BĐTH": t.astype("datetime64[ns]"),
+        "Thời điểm hoàn thành": (t + np.timedelta64(COMPLETION_SEC, "s")).astype("datetime64[ns]"),
+        "Dừng lệnh": stop,
+    })
+
+
+def synthetic_dispatch(n_orders: int,
+                       units: Sequence[str] = ("S1", "S2"),
+                       seed: int = 0,
+                       time_as_text: bool = True,
+                       **order_kw) -> pd.DataFrame:
+    """
+    Bảng dispatch đủ bố cục file thật: n_orders lệnh / tổ máy (synthetic_orders, seed + i
+    cho tổ máy thứ i), các tổ máy xen kẽ theo BĐTH. time_as_text: thời điểm dạng chuỗi
+    dd/mm/YYYY HH:MM:SS như file xuất từ hệ thống (False -> datetime, như ô ngày của Excel).
+    """
+    parts = []
+    for i, u in enumerate(units):
+        part = synthetic_orders(n_orders, seed=seed + i, **order_kw)
+        part.insert(0, "Tổ máy", u)
+        parts.append(part)
+    df = pd.concat(parts, ignore_index=True)
+    df = df.sort_values("Thời điểm BĐTH", kind="stable").reset_index(drop=True)
+
+    cols = _raw_columns()
+    out = pd.DataFrame({c: pd.Series(np.nan, index=df.index, dtype=object) for c in cols})
+    for c in REQUIRED_COLS:
+        out[c] = df[c]
+    out["STT"] = np.arange(1, len(df) + 1)
+    out["Ngày"] = df["Thời điểm BĐTH"].dt.normalize()
+    if time_as_text:
+        for c in ("Ngày", "Thời điểm BĐTH", "Thời điểm hoàn thành"):
+            out[c] = out[c].dt.strftime("%d/%m/%Y" if c == "Ngày" else TIME_TEXT_FMT)
+    return out
+
+
+def write_dispatch(df: pd.DataFrame, path: str) -> str:
+    """Ghi bảng dispatch ra .csv (utf-8-sig) hoặc .xlsx (sheet đầu, dòng 1 là header)."""
+    if path.lower().endswith(".csv"):
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    elif path.lower().endswith(".xlsx"):
+        df.to_excel(path, index=False, engine="openpyxl")
+    else:
+        raise ValueError("Chỉ ghi .csv hoặc .xlsx")
+    return path
+
+
+def synthetic_contract(hour_df: pd.DataFrame, seed: int = 0, noise: float = 0.03,
+                       missing_share: float = 0.02) -> Optional[pd.DataFrame]:
+    """
+    Sub-Contract giả lập cho DF giờ (cột Thời điểm, MW): Time, Output Power = MW ± noise,
+    bỏ ngẫu nhiên missing_share số giờ (giờ không có trong hợp đồng).
+    """
+    if hour_df is None or hour_df.empty:
+        return None
+    rng = np.random.default_rng(seed)
+    mw = hour_df["MW"].to_numpy(dtype=float)
+    keep = rng.random(len(mw)) >= missing_share
+    return pd.DataFrame({
+        "Time": pd.to_datetime(hour_df["Thời điểm"]).to_numpy()[keep],
+        "Output Power": np.round(mw * (1 + rng.uniform(-noise, noise, len(mw))), 3)[keep],
+    })
@@ -1,11 +1,13 @@
 # main.py
 import sys
+import multiprocessing
 from PySide6.QtWidgets import QApplication
 from PySide6.QtGui import QPalette, QColor
 from PySide6.QtCore import Qt
 from main_tab_window import MainTabWindow
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()   # bản đóng gói (exe) + process pool tính song song theo tổ máy
     app = QApplication(sys.argv)
 
     # ===== Tạo palette pastel olive =====
@@ -0,0 +1,46 @@
+# calc_worker.py
+import threading
+import traceback
+from PySide6.QtCore import QObject, QRunnable, Signal
+from tab_module.calculation_modules.pipeline import PipelineCancelled
+
+
+class WorkerSignals(QObject):
+    """Tín hiệu từ worker về GUI (tự chuyển qua queued connection sang GUI thread)."""
+    progress = Signal(str, int, int)   # chặng, đã xong, tổng
+    result = Signal(object)
+    error = Signal(object)             # exception
+    cancelled = Signal()
+    finished = Signal()
+
+
+class CalcWorker(QRunnable):
+    """
+    Chạy fn(*args, progress=..., cancel=..., **kwargs) trên QThreadPool.
+    fn là hàm thuần của pipeline.py (không chạm widget); kết quả/lỗi/hủy báo về qua signals.
+    cancel() chỉ đặt cờ: fn dừng ở ranh giới chặng kế tiếp.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        try:
+            out = self.fn(*self.args, progress=self.signals.progress.emit, cancel=self._cancel, **self.kwargs)
+        except PipelineCancelled:
+            self.signals.cancelled.emit()
+        except Exception as ex:
+            traceback.print_exc()
+            self.signals.error.emit(ex)
+        else:
+            self.signals.result.emit(out)
+        finally:
+            self.signals.finished.emit()
@@ -0,0 +1,133 @@
+# contract_index.py
+import numpy as np
+import pandas as pd
+from typing import Optional, Union
+from tab_module.calculation_modules.segment_store import as_datetime64
+
+MINUTE_NS = 60 * 1_000_000_000
+HOUR_MIN = 60
+DENSE_MAX_HOURS = 20 * 366 * 24   # mảng giờ liền tối đa ~20 năm (mốc lỗi kiểu năm 1900 -> chỉ dùng searchsorted)
+
+
+def minute_keys(t: pd.Series) -> np.ndarray:
+    """Thời điểm (datetime, không NaT) -> int64 số phút kể từ epoch, bỏ giây như khóa '%H:%M %d/%m/%y' cũ."""
+    if getattr(t.dt, "tz", None) is not None:
+        t = t.dt.tz_localize(None)   # giờ địa phương như strftime
+    return t.to_numpy(dtype="datetime64[ns]").view(np.int64) // MINUTE_NS
+
+
+def _naive_ns(t: pd.Series) -> np.ndarray:
+    if getattr(t.dt, "tz", None) is not None:
+        t = t.dt.tz_localize(None)
+    return t.to_numpy(dtype="datetime64[ns]")
+
+
+class ContractIndex:
+    """
+    Sub-Contract của 1 tổ máy, chuẩn hóa 1 lần lúc import để so với DF giờ PPA/EPC.
+
+    Khớp đúng (tolerance=None), cùng kết quả với merge theo khóa chuỗi cũ:
+      - khóa = số phút kể từ epoch; mốc trùng -> giá trị khác NaN cuối cùng
+      - mốc tròn giờ nằm trong mảng giờ liền hourly[giờ - hour0] -> tra thẳng theo offset,
+        mốc lẻ phút tra searchsorted trên mảng khóa đã sort
+    Khớp gần đúng (tolerance = Timedelta hoặc số giây): lấy mốc hợp đồng gần nhất trong
+    ±tolerance (merge_asof nearest), cho file có thời điểm lệch vài giây.
+    """
+
+    __slots__ = ("available", "tolerance", "keys", "power", "hour0", "hourly", "times", "times_power")
+
+    def __init__(self, ct_df: Optional[pd.DataFrame] = None,
+                 tolerance: Union[None, float, str, pd.Timedelta] = None):
+        if isinstance(tolerance, (int, float)):
+            tolerance = pd.Timedelta(seconds=tolerance)
+        self.tolerance = None if tolerance is None else pd.Timedelta(tolerance)
+        self.available = (ct_df is not None and not ct_df.empty
+                          and "Time" in ct_df and "Output Power" in ct_df)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.power = np.zeros(0)
+        self.hour0, self.hourly = 0, None
+        self.times = np.zeros(0, dtype="datetime64[ns]")
+        self.times_power = np.zeros(0)
+        if not self.available:
+            return
+
+        t = ct_df["Time"]
+        if not pd.api.types.is_datetime64_any_dtype(t):
+            t = pd.to_datetime(t, errors="coerce", dayfirst=True)
+        p = pd.to_numeric(ct_df["Output Power"], errors="coerce").to_numpy(dtype=float)
+        ok = t.notna().to_numpy()
+        t, p = t[ok], p[ok]
+
+        # khớp đúng: giá trị cuối (khác NaN) theo phút
+        last = pd.Series(p).groupby(minute_keys(t)).last()
+        self.keys = last.index.to_numpy(dtype=np.int64)
+        self.power = last.to_numpy(dtype=float)
+        on_hour = self.keys % HOUR_MIN == 0
+        hk = self.keys[on_hour] // HOUR_MIN
+        if len(hk) and hk[-1] - hk[0] < DENSE_MAX_HOURS:
+            self.hour0 = int(hk[0])
+            self.hourly = np.full(int(hk[-1] - hk[0]) + 1, np.nan)
+            self.hourly[hk - hk[0]] = self.power[on_hour]
+
+        # khớp gần đúng: giá trị cuối (khác NaN) theo đúng thời điểm
+        if self.tolerance is not None:
+            last = pd.Series(p).groupby(_naive_ns(t)).last()
+            self.times = last.index.to_numpy(dtype="datetime64[ns]")
+            self.times_power = last.to_numpy(dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, t: pd.Series) -> np.ndarray:
+        """Output Power_CT cho từng thời điểm của t (datetime, không NaT); không có -> NaN."""
+        if self.tolerance is not None:
+            return self._lookup_asof(t)
+        k = minute_keys(t)
+        out = np.full(len(k), np.nan)
+        rest = np.ones(len(k), dtype=bool)
+        if self.hourly is not None:
+            on_hour = k % HOUR_MIN == 0
+            off = k // HOUR_MIN - self.hour0
+            hit = on_hour & (off >= 0) & (off < len(self.hourly))
+            out[hit] = self.hourly[off[hit]]
+            rest = ~on_hour
+        if rest.any() and len(self.keys):
+            kr = k[rest]
+            i = np.minimum(np.searchsorted(self.keys, kr), len(self.keys) - 1)
+            out[rest] = np.where(self.keys[i] == kr, self.power[i], np.nan)
+        return out
+
+    def _lookup_asof(self, t: pd.Series) -> np.ndarray:
+        out = np.full(len(t), np.nan)
+        if not len(self.times) or not len(t):
+            return out
+        left = pd.DataFrame({"t": _naive_ns(t), "_row": np.arange(len(t))}).sort_values("t", kind="stable")
+        right = pd.DataFrame({"t": self.times, "p": self.times_power})
+        got = pd.merge_asof(left, right, on="t", direction="nearest", tolerance=self.tolerance)
+        out[got["_row"].to_numpy()] = got["p"].to_numpy(dtype=float)
+        return out
+
+    def compare(self, hour_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        DF giờ -> bảng dashboard: Thời điểm, MW, Output Power_CT, Δ% (+ các cột còn lại).
+        Dòng thiếu thời điểm bị bỏ; chưa có hợp đồng -> trả nguyên hour_df.
+        """
+        if hour_df is None or hour_df.empty or not self.available:
+            return hour_df
+        out = hour_df.copy()
+        out["Thời điểm"] = as_datetime64(out["Thời điểm"])
+        out = out[out["Thời điểm"].notna()].reset_index(drop=True)
+        out["Output Power_CT"] = self.lookup(out["Thời điểm"])
+
+        # ==== chỉ tính Δ% ====
+        out["Δ%"] = (out["MW"] - out["Output Power_CT"]) / out["MW"] * 100
+        out.loc[out["MW"].abs() <= 1e-9, "Δ%"] = None
+
+        # sắp cột: Thời điểm, MW, Output Power_CT, Δ%
+        pref = [c for c in ["Thời điểm", "MW", "Output Power_CT", "Δ%"] if c in out.columns]
+        rest = [c for c in out.columns if c not in pref]
+        return out[pref + rest]
+
+    def __repr__(self) -> str:
+        mode = "exact" if self.tolerance is None else f"tolerance={self.tolerance}"
+        return f"ContractIndex(points={len(self.keys)}, {mode})"
@@ -1,6 +1,26 @@
 # epc_calculation.py
 import pandas as pd
 from datetime import timedelta
+from functools import lru_cache
+from tab_module.calculation_modules.segment_store import SegmentStore, as_datetime64
+from tab_module.calculation_modules.ramp_profile import RampProfile, build_profile_per_pair
+
+
+@lru_cache(maxsize=None)
+def epc_profile(hold_up_at_429_sec: int = 30 * 60, hold_down_at_429_sec: int = 30 * 60) -> RampProfile:
+    """
+    EPC 429/429 (tốc độ theo vùng 330 của điểm đầu chặng):
+      - Lên : 0.11 MW/s nếu chặng bắt đầu dưới 330, 0.22 từ 330; băng 429 -> hold_up_at_429_sec
+      - Xuống: 0.11 MW/s nếu chặng bắt đầu dưới 330, 0.22 từ 330; băng 429 -> hold_down_at_429_sec
+    """
+    return RampProfile(
+        "EPC",
+        rate_bands=(330.0,),
+        up_rates=(0.11, 0.22),
+        down_rates=(0.11, 0.22),
+        up_stops=((429.0, hold_up_at_429_sec),),
+        down_stops=((429.0, hold_down_at_429_sec),),
+    )
 
 
 def build_epc_per_pair(
@@ -10,10 +30,49 @@ def build_epc_per_pair(
     snap_tolerance_sec: int = 0,          # (để tương thích chữ ký; không ảnh hưởng cut)
     flag_col: str = "Dừng lệnh",          # (không ảnh hưởng đến cut)
     make_gap_pairs: bool = True,          # Khâu nối gap phẳng (hiếm gặp khi universal cut)
-    gap_min_sec: int = 1                  # Ngưỡng tối thiểu tạo gap pair
+    gap_min_sec: int = 1,                 # Ngưỡng tối thiểu tạo gap pair
+    engine: str = "numpy",                # "numpy" (engine chung ramp_profile) | "loop" (bản tham chiếu)
+):
+    """
+    EPC 429/429 – cùng quy tắc với bản loop bên dưới, tính bằng engine chung
+    ramp_profile với epc_profile() (engine="numpy") hoặc duyệt từng cặp (engine="loop").
+
+    Trả về:
+      - segments: SegmentStore (bảng cột; vẫn dùng được như List[pd.DataFrame]
+                  với cột ["Event","MW","Thời điểm"])
+      - summary : pd.DataFrame tổng hợp
+    """
+    if engine == "loop":
+        return _build_epc_per_pair_loop(
+            df_step,
+            hold_up_at_429_sec=hold_up_at_429_sec,
+            hold_down_at_429_sec=hold_down_at_429_sec,
+            snap_tolerance_sec=snap_tolerance_sec,
+            flag_col=flag_col,
+            make_gap_pairs=make_gap_pairs,
+            gap_min_sec=gap_min_sec,
+        )
+    if engine != "numpy":
+        raise ValueError("engine phải là 'numpy' hoặc 'loop'")
+    return build_profile_per_pair(
+        df_step,
+        epc_profile(int(hold_up_at_429_sec), int(hold_down_at_429_sec)),
+        make_gap_pairs=make_gap_pairs,
+        gap_min_sec=gap_min_sec,
+    )
+
+
+def _build_epc_per_pair_loop(
+    df_step: pd.DataFrame,
+    hold_up_at_429_sec: int = 30 * 60,
+    hold_down_at_429_sec: int = 30 * 60,
+    snap_tolerance_sec: int = 0,
+    flag_col: str = "Dừng lệnh",
+    make_gap_pairs: bool = True,
+    gap_min_sec: int = 1
 ):
     """
-    EPC 429/429:
+    BẢN THAM CHIẾU (duyệt từng cặp). EPC 429/429:
     - Tính các segment (start/hold/finish/...) cho từng cặp liên tiếp.
     - UNIVERSAL CUT: nếu finish_t dự kiến > t_next thì cắt ngay tại t_next,
       cập nhật 'finish' = (t_next, MW theo quỹ đạo tại t_next) và push event 'cut_by_overwrite'.
@@ -22,16 +81,17 @@ def build_epc_per_pair(
 
     Yêu cầu df_step có cột: 'Thời điểm' (datetime), 'MW' (numeric).
     Trả về:
-      - segments: List[pd.DataFrame] với cột ["Event","MW","Thời điểm"]
+      - segments: SegmentStore (bảng cột; vẫn dùng được như List[pd.DataFrame]
+                  với cột ["Event","MW","Thời điểm"])
       - summary : pd.DataFrame tổng hợp
     """
     # ===== Tiền xử lý =====
     if df_step.empty or "MW" not in df_step or "Thời điểm" not in df_step:
-        return [], pd.DataFrame()
+        return SegmentStore.empty(), pd.DataFrame()
 
     df = df_step.copy()
     df["MW"] = pd.to_numeric(df["MW"], errors="coerce")
-    df["Thời điểm"] = pd.to_datetime(df["Thời điểm"], errors="coerce")
+    df["Thời điểm"] = as_datetime64(df["Thời điểm"])
 
     def _to_bool(x):
         if pd.isna(x): return False
@@ -44,9 +104,9 @@ def build_epc_per_pair(
     else:
         df["_FLAG_TRUE"] = False
 
-    df = df.dropna(subset=["MW", "Thời điểm"]).sort_values("Thời điểm").reset_index(drop=True)
+    df = df.dropna(subset=["MW", "Thời điểm"]).sort_values("Thời điểm", kind="stable").reset_index(drop=True)
     if len(df) < 2:
-        return [], pd.DataFrame()
+        return SegmentStore.empty(), pd.DataFrame()
 
     # ===== Helper =====
     def ramp_dt(delta_mw, rate):  # rate: MW/s
@@ -310,4 +370,4 @@ def build_epc_per_pair(
                 })
 
     summary = pd.DataFrame(summary_rows)
-    return segments, summary
+    return SegmentStore.from_frames(segments), summary
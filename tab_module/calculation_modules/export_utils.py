@@ -1,5 +1,12 @@
 # export_utils.py
+import csv
+import gzip
+import importlib.util
+import zipfile
+from xml.sax.saxutils import escape as xml_escape
+import numpy as np
 import pandas as pd
+from tab_module.calculation_modules.segment_store import as_datetime64
 
 # ===== Helper: chuyển freq -> Timedelta an toàn ("T","S","H","30S","5T", Timedelta, ...) =====
 def _freq_to_timedelta(freq):
@@ -28,6 +35,13 @@ def minutely_to_hourly_avg(minutely_df: pd.DataFrame,
     TÍNH THEO HÌNH THANG (không nội suy).
     label="left": nhãn = đầu giờ -> [HH:00, HH+1:00)
     label="right": nhãn = cuối giờ -> (HH-1:00, HH]
+
+    Cửa sổ mỗi giờ lấy CẢ HAI biên [left, right]:
+      - return_energy=False: MW  = trung bình các mẫu trong cửa sổ
+      - return_energy=True : MWh = tích phân hình thang giữa các mẫu liên tiếp
+                             cách nhau <= freq (không bắc cầu qua chỗ thiếu dữ liệu)
+    Tính 1 lần cho mọi giờ bằng searchsorted + tổng tích lũy (prefix sum),
+    không duyệt groupby từng giờ.
     """
     if label not in ("left", "right"):
         raise ValueError("label phải là 'left' hoặc 'right'")
@@ -38,64 +52,61 @@ def minutely_to_hourly_avg(minutely_df: pd.DataFrame,
         "MW" not in minutely_df.columns):
         return pd.DataFrame(columns=["Thời điểm", col_val])
 
-    df = minutely_df.copy()
-    df["Thời điểm"] = pd.to_datetime(df["Thời điểm"], errors="coerce")
-    df["MW"] = pd.to_numeric(df["MW"], errors="coerce")
-    df = df.dropna(subset=["Thời điểm", "MW"]).sort_values("Thời điểm").reset_index(drop=True)
+    df = pd.DataFrame({
+        "Thời điểm": as_datetime64(minutely_df["Thời điểm"]),
+        "MW": pd.to_numeric(minutely_df["MW"], errors="coerce"),
+    })
+    df = df.dropna(subset=["Thời điểm", "MW"]).sort_values("Thời điểm", kind="stable")
     if df.empty:
         return pd.DataFrame(columns=["Thời điểm", col_val])
 
-    s = df.set_index("Thời điểm")["MW"].sort_index()
-
-    hours, values = [], []
-    one_hour = pd.Timedelta("1H")
     dt = _freq_to_timedelta(freq)
     if dt <= pd.Timedelta(0):
         raise ValueError("freq không hợp lệ.")
-    dt_hours = float(dt / pd.Timedelta(hours=1))
-
-    #for hour, grp in s.groupby(pd.Grouper(freq="H", label=label, closed=label)):# đang lấy từ 01-00
-    for hour, grp in s.groupby(pd.Grouper(freq="H", label=label, closed=label)):
-        # Xác định cửa sổ theo label
-        if label == "left":
-            left, right = hour, hour + one_hour       # [HH:00, HH+1:00)
-        else:
-            left, right = hour - one_hour, hour       # (HH-1:00, HH]
-
-        # CẮT CỬA SỔ BAO GỒM CẢ HAI BIÊN: [left, right]
-        window = s.loc[left:right]
-
-        # Nếu cần “đủ mẫu” theo bước freq (ví dụ "T"): kỳ vọng = 1H/dt + 1 (gồm cả 2 biên)
-        if drop_incomplete:
-            expected_ticks = int(pd.Timedelta("1H") / dt) + 1
-            if len(window) < expected_ticks:
-                continue
-
-        if window.empty:
-            continue
 
-        value = window.mean()  # TRUNG BÌNH GỒM CẢ MỐC HH:00 VÀ HH+1:00
-
-        # Gán nhãn: với label="right" → nhãn giờ = HH+1:00; với "left" → = HH:00
-        out_hour = hour
-        hours.append(out_hour)
-        values.append(float(value))
-
-
-    hourly_series = pd.Series(values, index=hours).sort_index()
-    if hourly_series.empty:
+    t = df["Thời điểm"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    v = df["MW"].to_numpy(dtype=float)
+    one_hour = pd.Timedelta("1H").value
+
+    # Giờ được duyệt giống pd.Grouper(freq="H", label=label, closed=label) (kể cả giờ rỗng)
+    if label == "left":
+        lo, hi = t[0] // one_hour, t[-1] // one_hour
+    else:
+        lo, hi = -(-t[0] // one_hour) - 1, -(-t[-1] // one_hour) - 1
+    left = np.arange(lo, hi + 1, dtype=np.int64) * one_hour
+
+    # CỬA SỔ BAO GỒM CẢ HAI BIÊN: [left, left + 1H] -> dòng [i0, i1)
+    i0 = np.searchsorted(t, left, side="left")
+    i1 = np.searchsorted(t, left + one_hour, side="right")
+    n_win = i1 - i0
+
+    keep = n_win > 0
+    if drop_incomplete:
+        # kỳ vọng = 1H/dt + 1 (gồm cả 2 biên)
+        expected_ticks = int(pd.Timedelta("1H") / dt) + 1
+        keep &= n_win >= expected_ticks
+    if not keep.any():
         return pd.DataFrame(columns=["Thời điểm", col_val])
-
-    # if drop_incomplete:
-    #     expected_intervals = int(pd.Timedelta("1H") / dt)  # N khoảng
-    #     counts = s.resample("H", label=label, closed=label).count()  # đếm N tick trong cửa sổ
-    #     hourly_series = hourly_series[
-    #         counts.reindex(hourly_series.index).fillna(0).astype(int) >= expected_intervals
-    #     ]
-
-    out = hourly_series.reset_index()
-    out.columns = ["Thời điểm", col_val]
-    return out
+    i0, i1, n_win = i0[keep], i1[keep], n_win[keep]
+
+    if return_energy:
+        # diện tích hình thang giữa 2 mẫu liên tiếp (giờ); khoảng > dt coi như thiếu dữ liệu
+        step = np.diff(t)
+        area = np.where(step <= dt.value, (v[:-1] + v[1:]) / 2 * (step / one_hour), 0.0)
+        cum = np.concatenate(([0.0], np.cumsum(area)))
+        values = cum[i1 - 1] - cum[i0]
+    else:
+        # trừ mức trung bình trước khi cộng dồn để giữ độ chính xác trên chuỗi dài
+        center = float(v.mean())
+        cum = np.concatenate(([0.0], np.cumsum(v - center)))
+        values = center + (cum[i1] - cum[i0]) / n_win
+
+    # Gán nhãn: với label="right" → nhãn giờ = HH+1:00; với "left" → = HH:00
+    hours = left[keep] + (one_hour if label == "right" else 0)
+    return pd.DataFrame({
+        "Thời điểm": hours.view("datetime64[ns]"),
+        col_val: values,
+    })
 
 
 # ========= Helper: reorder cột để "Thời điểm","MW" lên đầu =========
@@ -105,6 +116,30 @@ def _reorder(df: pd.DataFrame) -> pd.DataFrame:
     rest = [c for c in cols if c not in pref]
     return df[pref + rest]
 
+# ========= 4 block của file xuất: (nhãn hàng 1, cột bắt đầu, DF) =========
+def _export_blocks(df_s1, df_s2, freq="T", drop_incomplete=True, label="right"):
+    """
+    Phút S1 -> A, S2 -> D ; giờ (tính từ phút với label) S1 -> G, S2 -> J.
+    Dùng chung cho mọi định dạng xuất để bố cục / nhãn giống hệt nhau.
+    """
+    # Chuẩn hóa phút
+    df_s1_min = _reorder(df_s1.copy()) if df_s1 is not None else pd.DataFrame(columns=["Thời điểm","MW"])
+    df_s2_min = _reorder(df_s2.copy()) if df_s2 is not None else pd.DataFrame(columns=["Thời điểm","MW"])
+
+    # Tính giờ từ phút (TRUYỀN label xuống hàm tính)
+    df_s1_hr = _reorder(minutely_to_hourly_avg(
+        df_s1_min, freq=freq, drop_incomplete=drop_incomplete, label=label
+    ))
+    df_s2_hr = _reorder(minutely_to_hourly_avg(
+        df_s2_min, freq=freq, drop_incomplete=drop_incomplete, label=label
+    ))
+    return [
+        ("S1 (minutely)", 0, df_s1_min),                 # A
+        ("S2 (minutely)", 3, df_s2_min),                 # D
+        (f"S1 (hourly avg, {label})", 6, df_s1_hr),      # G
+        (f"S2 (hourly avg, {label})", 9, df_s2_hr),      # J
+    ]
+
 # ========= Ghi CẢ phút + giờ =========
 def export_ppa_minutely_to_excel(df_s1: pd.DataFrame,
                                  df_s2: pd.DataFrame,
@@ -121,34 +156,259 @@ def export_ppa_minutely_to_excel(df_s1: pd.DataFrame,
           S1 -> G2 (G: Thời điểm, H: MW/MWh)
           S2 -> J2 (J: Thời điểm, K: MW/MWh)
     """
-    # Chuẩn hóa phút
-    df_s1_min = _reorder(df_s1.copy()) if df_s1 is not None else pd.DataFrame(columns=["Thời điểm","MW"])
-    df_s2_min = _reorder(df_s2.copy()) if df_s2 is not None else pd.DataFrame(columns=["Thời điểm","MW"])
-
-    # Tính giờ từ phút (TRUYỀN label xuống hàm tính)
-    df_s1_hr = _reorder(minutely_to_hourly_avg(
-        df_s1_min, freq=freq, drop_incomplete=drop_incomplete, label=label
-    ))
-    df_s2_hr = _reorder(minutely_to_hourly_avg(
-        df_s2_min, freq=freq, drop_incomplete=drop_incomplete, label=label
-    ))
+    blocks = _export_blocks(df_s1, df_s2, freq=freq, drop_incomplete=drop_incomplete, label=label)
 
     # Ghi Excel
     with pd.ExcelWriter(filepath, engine="openpyxl") as writer:
-        # ----- Blocks phút -----
-        df_s1_min.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1, startcol=0)  # A2
-        df_s2_min.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1, startcol=3)  # D2
-
-        # ----- Blocks giờ -----
-        df_s1_hr.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1, startcol=6)   # G2
-        df_s2_hr.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1, startcol=9)   # J2
+        # ----- 4 block (phút A2/D2, giờ G2/J2) -----
+        for _, col, df in blocks:
+            df.to_excel(writer, sheet_name=sheet_name, index=False, startrow=1, startcol=col)
 
         # ----- Nhãn hàng 1 cho 4 block -----
         ws = writer.book[sheet_name]
-        ws.cell(row=1, column=1,  value="S1 (minutely)")                # A1
-        ws.cell(row=1, column=4,  value="S2 (minutely)")                # D1
-        ws.cell(row=1, column=7,  value=f"S1 (hourly avg, {label})")    # G1
-        ws.cell(row=1, column=10, value=f"S2 (hourly avg, {label})")    # J1
+        for title, col, _ in blocks:
+            ws.cell(row=1, column=col + 1, value=title)   # A1 / D1 / G1 / J1
+
+
+# ========= Xuất nhanh / định dạng khác =========
+# fmt -> đuôi file. "xlsx": ExcelWriter openpyxl như cũ (header có định dạng) ;
+# "xlsx_fast": cùng bố cục, ghi thẳng XML của sheet theo chunk dòng (không tạo cell openpyxl) ;
+# "csv" / "csv_gz": cùng lưới ô như sheet (hàng 1 nhãn, hàng 2 tên cột), ghi dần ra file ;
+# "parquet" / "feather": bảng dài Block, Thời điểm, MW (cần pyarrow / fastparquet)
+EXPORT_FORMATS = {
+    "xlsx": ".xlsx",
+    "xlsx_fast": ".xlsx",
+    "csv": ".csv",
+    "csv_gz": ".csv.gz",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+CSV_CHUNK_ROWS = 100_000
+
+
+def export_formats() -> list:
+    """Các định dạng xuất dùng được trong môi trường hiện tại."""
+    has_arrow = importlib.util.find_spec("pyarrow") is not None
+    has_parquet = has_arrow or importlib.util.find_spec("fastparquet") is not None
+    return [f for f in EXPORT_FORMATS
+            if (f != "parquet" or has_parquet) and (f != "feather" or has_arrow)]
+
+
+def format_from_path(filepath: str) -> str:
+    """Đoán định dạng theo đuôi file (.csv.gz trước .csv); không khớp -> 'xlsx'."""
+    name = str(filepath).lower()
+    for fmt, ext in sorted(EXPORT_FORMATS.items(), key=lambda kv: -len(kv[1])):
+        if name.endswith(ext):
+            return fmt
+    return "xlsx"
+
+
+def _sheet_chunks(blocks, chunk_rows: int):
+    """
+    Lưới ô của sheet (cột 0.. ; ô trống = NaN/NaT) theo từng chunk dòng: (dòng đầu, DF chunk).
+    Mỗi chunk dựng thẳng từ iloc của 4 block -> không giữ cả lưới trong RAM.
+    """
+    n = max(len(df) for _, _, df in blocks)
+    width = max(col + len(df.columns) for _, col, df in blocks)
+    for i in range(0, n, chunk_rows):
+        m = min(chunk_rows, n - i)
+        cols = {j: pd.Series(np.nan, index=range(m), dtype=float) for j in range(width)}
+        for _, col, df in blocks:
+            for j, c in enumerate(df.columns):
+                s = df[c].iloc[i:i + m].reset_index(drop=True).reindex(range(m))
+                if len(df) < n and s.dtype.kind in "iub":    # như reindex cả cột: block ngắn -> float
+                    s = s.astype(float)
+                cols[col + j] = s
+        yield i, pd.DataFrame(cols)
+
+
+def _sheet_header(blocks):
+    """2 dòng đầu của sheet: nhãn block (hàng 1) và tên cột (hàng 2)."""
+    width = max(col + len(df.columns) for _, col, df in blocks)
+    row1, row2 = [None] * width, [None] * width
+    for title, col, df in blocks:
+        row1[col] = title
+        row2[col:col + len(df.columns)] = [str(c) for c in df.columns]
+    return row1, row2
+
+
+def _write_csv(blocks, filepath: str, compress: bool = False):
+    row1, row2 = _sheet_header(blocks)
+    opener = gzip.open if compress else open
+    with opener(filepath, "wt", newline="", encoding="utf-8-sig") as fh:
+        w = csv.writer(fh)
+        w.writerow(["" if v is None else v for v in row1])
+        w.writerow(["" if v is None else v for v in row2])
+        for _, part in _sheet_chunks(blocks, CSV_CHUNK_ROWS):
+            part.to_csv(fh, header=False, index=False)
+
+
+# ----- xlsx ghi thẳng XML theo luồng (không tạo đối tượng cell, RAM ~ 1 chunk dòng) -----
+# Số ghi bằng repr (đủ chữ số để đọc lại đúng float) ; openpyxl ghi "%.16g" nên ~1/4 ô MW / ngày
+# khác ở chữ số cuối (265.77091746856695 vs 265.7709174685669), cùng giá trị tới 16 chữ số.
+XLSX_CHUNK_ROWS = 20_000
+_DAY_NS = 86_400 * 1_000_000_000
+_EXCEL_EPOCH_DAYS = -25_569                      # 1899-12-30 tính theo ngày kể từ 1970-01-01
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        f'<Relationships xmlns="{_NS_PKG}">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/_rels/workbook.xml.rels": (
+        f'<Relationships xmlns="{_NS_PKG}">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_NS_REL}/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # style 0: mặc định ; 1: ngày giờ (như ExcelWriter của pandas) ; 2: đậm (hàng tên cột)
+    "xl/styles.xml": (
+        f'<styleSheet xmlns="{_NS_MAIN}">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'),
+}
+
+
+def _col_letter(j: int) -> str:
+    out = ""
+    j += 1
+    while j:
+        j, r = divmod(j - 1, 26)
+        out = chr(65 + r) + out
+    return out
+
+
+def _excel_serial(s: pd.Series) -> np.ndarray:
+    """datetime64 -> số ngày Excel (cùng cách tính với openpyxl, kể cả quy ước trước 1900-03-01)."""
+    ns = s.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    days = ns // _DAY_NS - _EXCEL_EPOCH_DAYS
+    days = np.where((days > 0) & (days <= 60), days - 1, days)
+    rem = ns % _DAY_NS
+    frac = (rem // 1_000_000_000 + (rem % 1_000_000_000) // 1000 / 10**6) / 86_400
+    return days + frac
+
+
+def _cell_xml(v, ref: str) -> str:
+    if v is None or v is pd.NaT or v is pd.NA or (isinstance(v, float) and v != v):
+        return ""
+    if isinstance(v, (bool, np.bool_)):
+        return f'<c r="{ref}" t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return f'<c r="{ref}"><v>{v!r}</v></c>' if np.isfinite(v) else ""
+    if isinstance(v, (pd.Timestamp, np.datetime64)):
+        return f'<c r="{ref}" s="1"><v>{_excel_serial(pd.Series([v]))[0]!r}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{xml_escape(str(v))}</t></is></c>'
+
+
+def _column_xml(s: pd.Series, letter: str, rows: range) -> list:
+    """1 cột của 1 chunk -> list chuỗi <c> (ô trống -> "")."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        ok = s.notna().to_numpy()
+        vals = _excel_serial(s.fillna(pd.Timestamp(0))).tolist()
+        return [f'<c r="{letter}{r}" s="1"><v>{v!r}</v></c>' if o else ""
+                for r, v, o in zip(rows, vals, ok)]
+    if s.dtype.kind in "fiu":
+        vals = s.to_numpy(dtype=float)
+        ok = np.isfinite(vals)
+        vals = s.tolist()
+        return [f'<c r="{letter}{r}"><v>{v!r}</v></c>' if o else ""
+                for r, v, o in zip(rows, vals, ok)]
+    return [_cell_xml(v, f"{letter}{r}") for r, v in zip(rows, s.tolist())]
+
+
+def _write_xlsx_fast(blocks, filepath: str, sheet_name: str = "PPA"):
+    """Ghi lưới 4 block ra .xlsx: sheet XML sinh theo chunk và nén thẳng vào file zip."""
+    row1, row2 = _sheet_header(blocks)
+    letters = [_col_letter(j) for j in range(len(row1))]
+    sheet = xml_escape(str(sheet_name)[:31], {'"': "&quot;"})
+    head = "".join(
+        f'<row r="{r}">' + "".join(
+            f'<c r="{letters[j]}{r}" t="inlineStr"{style}><is><t>{xml_escape(v)}</t></is></c>'
+            for j, v in enumerate(vals) if v is not None) + "</row>"
+        for r, vals, style in ((1, row1, ""), (2, row2, ' s="2"')))
+
+    with zipfile.ZipFile(filepath, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_STATIC.items():
+            zf.writestr(name, _XML_HEAD + xml)
+        zf.writestr("xl/workbook.xml",
+                    f'{_XML_HEAD}<workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}"><sheets>'
+                    f'<sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as fh:
+            fh.write(f'{_XML_HEAD}<worksheet xmlns="{_NS_MAIN}"><sheetData>{head}'.encode("utf-8"))
+            for i, part in _sheet_chunks(blocks, XLSX_CHUNK_ROWS):
+                rows = range(i + 3, i + 3 + len(part))
+                cells = [_column_xml(part[c], letters[j], rows) for j, c in enumerate(part.columns)]
+                fh.write("".join(f'<row r="{r}">{"".join(c)}</row>'
+                                 for r, *c in zip(rows, *cells)).encode("utf-8"))
+            fh.write(b"</sheetData></worksheet>")
+
+
+def _long_table(blocks) -> pd.DataFrame:
+    """4 block -> bảng dài (Block = nhãn hàng 1 của block) cho Parquet / Feather."""
+    titles = [t for t, _, _ in blocks]
+    parts = [df.assign(Block=title) for title, _, df in blocks if len(df)]
+    if not parts:
+        return pd.DataFrame({"Block": pd.Categorical([], categories=titles),
+                             "Thời điểm": pd.Series(dtype="datetime64[ns]"), "MW": pd.Series(dtype=float)})
+    out = pd.concat(parts, ignore_index=True)
+    out["Block"] = pd.Categorical(out["Block"], categories=titles)
+    out["Thời điểm"] = as_datetime64(out["Thời điểm"])
+    return out[["Block"] + [c for c in out.columns if c != "Block"]]
+
+
+def export_ppa_minutely(df_s1: pd.DataFrame,
+                        df_s2: pd.DataFrame,
+                        filepath: str,
+                        sheet_name: str = "PPA",
+                        freq: str = "T",
+                        drop_incomplete: bool = True,
+                        label: str = "right",
+                        fmt: str = None):
+    """
+    Như export_ppa_minutely_to_excel nhưng chọn được định dạng (EXPORT_FORMATS);
+    fmt=None -> đoán theo đuôi file (format_from_path).
+    """
+    fmt = fmt or format_from_path(filepath)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Định dạng xuất không hỗ trợ: {fmt} (chọn: {', '.join(EXPORT_FORMATS)})")
+    if fmt == "xlsx":
+        return export_ppa_minutely_to_excel(df_s1, df_s2, filepath, sheet_name=sheet_name, freq=freq,
+                                            drop_incomplete=drop_incomplete, label=label)
+    if fmt not in export_formats():
+        raise ImportError(f"Xuất {fmt} cần cài thêm pyarrow (pip install pyarrow).")
+
+    blocks = _export_blocks(df_s1, df_s2, freq=freq, drop_incomplete=drop_incomplete, label=label)
+    if fmt == "xlsx_fast":
+        _write_xlsx_fast(blocks, filepath, sheet_name=sheet_name)
+    elif fmt in ("csv", "csv_gz"):
+        _write_csv(blocks, filepath, compress=fmt == "csv_gz")
+    elif fmt == "parquet":
+        _long_table(blocks).to_parquet(filepath, index=False)
+    else:
+        _long_table(blocks).reset_index(drop=True).to_feather(filepath)
 
 
 # ========= Alias: tham số tường minh =========
@@ -157,15 +417,17 @@ def export_ppa_minutely_and_hourly_to_excel(df_s1_minutely: pd.DataFrame,
                                             filepath: str,
                                             sheet_name: str = "PPA",
                                             freq: str = "T",
-                                            drop_incomplete: bool = True):
-    """Alias tường minh."""
-    return export_ppa_minutely_to_excel(
+                                            drop_incomplete: bool = True,
+                                            fmt: str = "xlsx"):
+    """Alias tường minh (fmt: xem EXPORT_FORMATS; None -> theo đuôi file)."""
+    return export_ppa_minutely(
         df_s1=df_s1_minutely,
         df_s2=df_s2_minutely,
         filepath=filepath,
         sheet_name=sheet_name,
         freq=freq,
-        drop_incomplete=drop_incomplete
+        drop_incomplete=drop_incomplete,
+        fmt=fmt
     )
 
 # export_utils.py
@@ -0,0 +1,156 @@
+# incremental.py
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+from tab_module.calculation_modules.segment_store import SegmentStore
+from tab_module.calculation_modules.ramp_profile import RampProfile, build_profile_points
+from tab_module.calculation_modules.ppa_minutely import ppa_segments_to_minutely
+from tab_module.calculation_modules.ppa_hourly import HOUR_NS, segments_to_hourly
+
+# Tính lại phần đuôi khi file dispatch chỉ được ghi thêm lệnh mới.
+# Với universal cut, cặp i chỉ phụ thuộc mốc i và i+1 (mốc = dòng của prepare_step_arrays, đã sort
+# stable: mốc trùng thời điểm giữ thứ tự dòng, ghi thêm lệnh không đảo thứ tự các mốc cũ):
+#   - L mốc đầu trùng lần trước -> cặp 0..L-2 giữ nguyên, chỉ tính lại từ cặp L-1
+#   - segments theo thứ tự thời gian, không chồng nhau -> tick / giờ trước mốc đầu của phần
+#     tính lại (T) không đổi; chỉ tính lại tick >= T và các giờ có cửa sổ chạm T
+# Các hàm extend_* trả về đúng kết quả như tính lại từ đầu (cùng giá trị, cùng dtype).
+
+SUMMARY_EXTRA = ("IsGap", "GapSec")   # cột chỉ có khi có gap pair
+
+
+def common_prefix(t_old, mw_old, t_new, mw_new) -> int:
+    """Số mốc đầu giống hệt nhau (thời điểm và MW)."""
+    n = min(len(t_old), len(t_new))
+    diff = (t_old[:n] != t_new[:n]) | ~((mw_old[:n] == mw_new[:n]) | (np.isnan(mw_old[:n]) & np.isnan(mw_new[:n])))
+    hit = np.flatnonzero(diff)
+    return int(hit[0]) if len(hit) else n
+
+
+def _time_ordered(store: SegmentStore) -> bool:
+    first, last = store.first_last()
+    ok = store.lengths > 0
+    t0, t1 = store.t_ns[first[ok]], store.t_ns[last[ok]]
+    return bool(np.all(np.diff(t0) >= 0) and np.all(np.diff(t1) >= 0) and np.all(t1[:-1] <= t0[1:]))
+
+
+def _splice_column(old: Optional[pd.Series], n_old: int, new: Optional[pd.Series], n_new: int) -> object:
+    # cùng dtype -> nối mảng ; khác dtype / thiếu cột -> để DataFrame suy kiểu lại trên list như bản đầy đủ
+    if old is not None and new is not None and old.dtype == new.dtype:
+        return np.concatenate([old.to_numpy()[:n_old], new.to_numpy()])
+    head = old.iloc[:n_old].tolist() if old is not None else [np.nan] * n_old
+    tail = new.tolist() if new is not None else [np.nan] * n_new
+    return head + tail
+
+
+def splice_summary(old: pd.DataFrame, n_old: int, new: pd.DataFrame) -> pd.DataFrame:
+    """n_old dòng đầu của summary cũ + summary phần đuôi, như summary tính 1 lượt."""
+    base = [c for c in new.columns if c not in SUMMARY_EXTRA]
+    cols = {c: _splice_column(old[c], n_old, new[c], len(new)) for c in base}
+    has_gap = (("IsGap" in old.columns and old["IsGap"].iloc[:n_old].eq(True).any())
+               or "IsGap" in new.columns)
+    if has_gap:
+        for c in SUMMARY_EXTRA:
+            cols[c] = _splice_column(old[c] if c in old.columns else None, n_old,
+                                     new[c] if c in new.columns else None, len(new))
+    return pd.DataFrame(cols)
+
+
+def splice_segments(old: SegmentStore, n_old: int, new: SegmentStore) -> SegmentStore:
+    """n_old segment đầu của store cũ + các segment mới."""
+    r = int(old.offsets[n_old])
+    lens = np.concatenate([old.lengths[:n_old], new.lengths])
+    return SegmentStore.from_lengths(lens,
+                                     np.concatenate([old.event[:r], new.event]),
+                                     np.concatenate([old.mw[:r], new.mw]),
+                                     np.concatenate([old.t_ns[:r], new.t_ns]),
+                                     old.event_names)
+
+
+def extend_pairs(prev_pts: Tuple[np.ndarray, np.ndarray],
+                 prev_segments: SegmentStore,
+                 prev_summary: pd.DataFrame,
+                 t_all: np.ndarray, mw_all: np.ndarray,
+                 profile: RampProfile,
+                 make_gap_pairs: bool = True,
+                 gap_min_sec: int = 1):
+    """
+    (segments, summary, s0) cho mốc mới, dùng lại các cặp của lần trước còn nguyên:
+    s0 = số segment đầu giữ lại. Không dùng lại được (đổi từ mốc đầu, file bị cắt bớt,
+    segments không theo thứ tự thời gian) -> None, gọi tính lại từ đầu.
+    """
+    L = common_prefix(prev_pts[0], prev_pts[1], t_all, mw_all)
+    i0 = L - 1                      # cặp đầu tiên phải tính lại
+    if i0 < 1 or i0 >= len(t_all) - 1:   # đổi từ mốc đầu / file bị cắt bớt -> tính lại từ đầu
+        return None
+    if "idx_pair" not in prev_summary.columns or len(prev_summary) != prev_segments.n_segments:
+        return None
+    # dòng summary / segment của cặp i0 (mỗi dòng summary ứng với 1 segment, cùng thứ tự);
+    # chỉ ghi thêm -> i0 là cặp mới (mốc cuối cũ -> mốc mới đầu tiên), giữ mọi segment cũ
+    labels = prev_summary["idx_pair"].to_numpy(dtype=object)
+    main = np.flatnonzero([not isinstance(v, str) for v in labels])
+    if i0 > len(main):
+        return None
+    s0 = int(main[i0]) if i0 < len(main) else len(labels)
+    tail_seg, tail_sum = build_profile_points(t_all[i0:], mw_all[i0:], profile,
+                                              make_gap_pairs, gap_min_sec, first_pair=i0)
+    segments = splice_segments(prev_segments, s0, tail_seg)
+    if not _time_ordered(segments):
+        return None
+    return segments, splice_summary(prev_summary, s0, tail_sum), s0
+
+
+def _recompute_from(segments: SegmentStore, s0: int) -> Optional[int]:
+    """Thời điểm T (ns) bắt đầu segment s0 = biên tính lại; không có segment từ s0 -> None."""
+    if s0 >= segments.n_segments:
+        return None
+    return int(segments.t_ns[segments.offsets[s0]])
+
+
+def extend_hourly(prev_hour: pd.DataFrame, segments: SegmentStore, s0: int,
+                  freq: str = "T", drop_incomplete: bool = True, label: str = "left") -> pd.DataFrame:
+    """
+    DF giờ của segments (đã ghép) khi s0 segment đầu giống lần trước:
+    giữ các giờ có cửa sổ [left, left+1H] kết thúc trước T, tính lại phần còn lại.
+    """
+    T = _recompute_from(segments, s0)
+    if T is None:
+        return segments_to_hourly(segments, freq=freq, drop_incomplete=drop_incomplete, label=label)
+    left_min = (-(-T // HOUR_NS) - 1) * HOUR_NS          # cửa sổ đầu tiên chạm T
+    # segment đầu có tick trong cửa sổ left_min (segments theo thứ tự thời gian)
+    first, last = segments.first_last()
+    s_start = int(np.searchsorted(np.where(last >= 0, segments.t_ns[last], -1) >= left_min, True))
+    tail = segments_to_hourly(segments.take(np.arange(s_start, segments.n_segments)),
+                              freq=freq, drop_incomplete=drop_incomplete, label=label)
+    shift = HOUR_NS if label == "right" else 0
+    if len(tail):
+        t_tail = tail["Thời điểm"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        tail = tail[t_tail - shift >= left_min]
+    if len(prev_hour):
+        t_prev = prev_hour["Thời điểm"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        head = prev_hour[t_prev - shift < left_min]
+    else:
+        head = prev_hour
+    if not len(head):
+        return tail.reset_index(drop=True)
+    if not len(tail):
+        return head.reset_index(drop=True)
+    return pd.concat([head, tail], ignore_index=True)
+
+
+def extend_minutely(prev_min: pd.DataFrame, segments: SegmentStore, s0: int,
+                    freq: str = "T", include_pair_idx: bool = False) -> pd.DataFrame:
+    """DF phút của segments khi s0 segment đầu giống lần trước: giữ tick < T, tính lại tick >= T."""
+    T = _recompute_from(segments, s0)
+    if include_pair_idx or T is None:
+        return ppa_segments_to_minutely(segments, freq=freq, include_pair_idx=include_pair_idx)
+    tail = ppa_segments_to_minutely(segments.take(np.arange(s0, segments.n_segments)), freq=freq)
+    if len(prev_min):
+        t_prev = prev_min["Thời điểm"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        head = prev_min[t_prev < T]
+    else:
+        head = prev_min
+    if not len(head):
+        return tail.reset_index(drop=True)
+    if not len(tail):
+        return head.reset_index(drop=True)
+    return pd.concat([head, tail], ignore_index=True)
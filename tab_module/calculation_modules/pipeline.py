@@ -0,0 +1,325 @@
+# pipeline.py
+import inspect
+import multiprocessing
+import os
+import threading
+import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, Union
+from tab_module.calculation_modules.ppa_calculation import build_ppa_per_pair, ppa_profile
+from tab_module.calculation_modules.epc_calculation import build_epc_per_pair, epc_profile
+from tab_module.calculation_modules.ramp_profile import prepare_step_arrays
+from tab_module.calculation_modules.ppa_minutely import ppa_segments_to_minutely
+from tab_module.calculation_modules.ppa_hourly import segments_to_hourly
+from tab_module.calculation_modules.export_utils import export_ppa_minutely_and_hourly_to_excel
+from tab_module.calculation_modules.contract_index import ContractIndex
+from tab_module.calculation_modules.result_cache import ResultCache
+from tab_module.calculation_modules.incremental import extend_hourly, extend_minutely, extend_pairs
+
+# Pipeline Calculate PPA / EPC tách khỏi GUI (không import Qt): chạy được trong worker
+# thread hoặc script. Mỗi hàm nhận:
+#   progress(stage: str, done: int, total: int) -> báo tiến độ theo chặng
+#   cancel: threading.Event -> được set thì dừng ở ranh giới chặng kế tiếp (PipelineCancelled)
+
+BUILDERS = {
+    "PPA": build_ppa_per_pair,
+    "EPC": build_epc_per_pair,   # EPC 429/429
+}
+# Profile ramp/hold theo tham số của build_*_per_pair (cho tính tiếp phần đuôi, incremental.py)
+PROFILES = {
+    "PPA": lambda p: ppa_profile(int(p["hold_up_at_330_sec"]), int(p["hold_down_at_462_sec"])),
+    "EPC": lambda p: epc_profile(int(p["hold_up_at_429_sec"]), int(p["hold_down_at_429_sec"])),
+}
+ProgressFn = Callable[[str, int, int], None]
+Contract = Union[pd.DataFrame, ContractIndex]   # Sub-Contract thô hoặc đã dựng chỉ mục
+
+
+class PipelineCancelled(Exception):
+    """Người dùng hủy giữa chừng."""
+
+
+class _Stages:
+    def __init__(self, total: int, progress: Optional[ProgressFn], cancel: Optional[threading.Event]):
+        self.total = total
+        self.done = 0
+        self.progress = progress
+        self.cancel = cancel
+
+    def check(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise PipelineCancelled()
+
+    def step(self, text: str):
+        self.done += 1
+        if self.progress is not None:
+            self.progress(text, self.done, self.total)
+        self.check()
+
+
+# ===================== Ghép Sub-Contract =====================
+def merge_hour_with_contract(hour_df: pd.DataFrame, ct: Optional[Contract]) -> pd.DataFrame:
+    """
+    Ghép Sub-Contract vào hourly, tính duy nhất cột Δ% (xem ContractIndex.compare).
+    ct nên là ContractIndex dựng sẵn lúc import; DataFrame thô thì dựng tạm ở đây.
+    """
+    if hour_df is None or hour_df.empty:
+        return hour_df
+    if not isinstance(ct, ContractIndex):
+        ct = ContractIndex(ct)
+    return ct.compare(hour_df)
+
+
+# ===================== Tính segments + giờ + ghép hợp đồng =====================
+# Dưới ngưỡng này (tổng số dòng bậc thang) chạy tuần tự: khởi động process con tốn hơn phần tính
+PARALLEL_MIN_ROWS = 50_000
+_POOL = None
+_POOL_WORKERS = 0
+
+
+# Tham số cố định của các chặng sau build_*_per_pair (nằm trong khóa ResultCache)
+HOURLY_PARAMS = {"freq": "T", "drop_incomplete": True, "label": "right"}
+MINUTELY_PARAMS = {"freq": "T", "include_pair_idx": False}
+
+
+def unit_params(mode: str) -> Dict[str, object]:
+    """Tham số của 1 lần tính tổ máy: mặc định của build_*_per_pair (hold, gap, ...) + HOURLY_PARAMS."""
+    params = {name: p.default for name, p in inspect.signature(BUILDERS[mode]).parameters.items()
+              if p.default is not inspect.Parameter.empty}
+    params.update({f"hourly_{k}": v for k, v in HOURLY_PARAMS.items()})
+    return params
+
+
+def compute_unit(mode: str, df: pd.DataFrame, ct: Optional[Contract] = None) -> Dict[str, object]:
+    """
+    1 tổ máy: build_*_per_pair -> segments_to_hourly (label="right") -> ghép Sub-Contract.
+    Trả về dict: seg, sum, hour, view. Hàm top-level để chạy được trong process con.
+    """
+    seg, summ = BUILDERS[mode](df)
+    hour = segments_to_hourly(seg, **HOURLY_PARAMS)
+    return {"seg": seg, "sum": summ, "hour": hour, "view": merge_hour_with_contract(hour, ct)}
+
+
+def extend_unit(mode: str, df: pd.DataFrame, base: Dict[str, object],
+                params: Optional[Dict[str, object]] = None) -> Optional[Dict[str, object]]:
+    """
+    Tính tiếp từ kết quả base (seg, sum, hour, pts) của lần trước khi df chỉ khác ở phần cuối
+    (ghi thêm lệnh): chỉ dựng lại các cặp / giờ từ mốc đầu tiên thay đổi.
+    Trả về dict: seg, sum, hour, pts, s0 (số segment giữ nguyên); không tính tiếp được -> None.
+    """
+    params = params or unit_params(mode)
+    if base is None or base.get("pts") is None or params.get("engine", "numpy") != "numpy":
+        return None
+    pts = prepare_step_arrays(df)
+    if pts is None:
+        return None
+    got = extend_pairs(base["pts"], base["seg"], base["sum"], pts[0], pts[1], PROFILES[mode](params),
+                       make_gap_pairs=params["make_gap_pairs"], gap_min_sec=params["gap_min_sec"])
+    if got is None:
+        return None
+    seg, summ, s0 = got
+    hour = extend_hourly(base["hour"], seg, s0, **HOURLY_PARAMS)
+    return {"seg": seg, "sum": summ, "hour": hour, "pts": pts, "s0": s0}
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    # Giữ pool giữa các lần tính (spawn + import pandas ở process con chỉ tốn 1 lần)
+    global _POOL, _POOL_WORKERS
+    if _POOL is None or _POOL_WORKERS < workers:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _POOL_WORKERS = workers
+    return _POOL
+
+
+def _reset_pool():
+    global _POOL, _POOL_WORKERS
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+    _POOL, _POOL_WORKERS = None, 0
+
+
+def compute_units(mode: str,
+                  units: Dict[str, pd.DataFrame],
+                  contracts: Optional[Dict[str, Contract]] = None,
+                  workers: Optional[int] = None,
+                  progress: Optional[ProgressFn] = None,
+                  cancel: Optional[threading.Event] = None,
+                  cache: Optional[ResultCache] = None) -> Dict[str, Dict[str, object]]:
+    """
+    compute_unit cho mọi tổ máy {unit: DF bậc thang};
+    contracts: {unit: ContractIndex hoặc DataFrame Sub-Contract} (tùy chọn).
+    Các tổ máy độc lập -> workers > 1: mỗi tổ máy 1 tác vụ trên ProcessPoolExecutor.
+      workers=None: tự chọn (song song khi > 1 tổ máy, nhiều CPU và tổng số dòng >= PARALLEL_MIN_ROWS)
+      workers<=1  : tuần tự trong process hiện tại
+    cache: tổ máy đã tính với cùng dữ liệu + tham số lấy thẳng seg/sum/hour từ cache
+    (chỉ ghép lại Sub-Contract), tổ máy tính mới được lưu vào cache ngay khi xong.
+    Dữ liệu khác lần tính gần nhất của tổ máy chỉ ở phần cuối (ghi thêm lệnh) -> extend_unit
+    tính lại các cặp / giờ cuối trong process hiện tại thay vì tính lại từ đầu.
+    Trả về {unit: dict của compute_unit + "key" (khóa cache, None nếu không dùng)}, theo thứ tự units.
+    """
+    if mode not in BUILDERS:
+        raise ValueError("mode phải là 'PPA' hoặc 'EPC'")
+    contracts = contracts or {}
+    names = list(units)
+    keys, hits, bases = {u: None for u in names}, {}, {}
+    if cache is not None:
+        params = unit_params(mode)
+        lineages = {u: cache.lineage(u, mode, params) for u in names}
+        for u in names:
+            keys[u] = cache.key(mode, units[u], params)
+            got = cache.get(keys[u])
+            if got is not None:
+                hits[u] = got
+                continue
+            prev = cache.latest(lineages[u])
+            base = cache.get(prev) if prev else None
+            if base is not None and base.get("pts") is not None:
+                bases[u] = (prev, base)
+    todo = [u for u in names if u not in hits and u not in bases]
+    out = {}
+
+    def _done(u, res, base_key=None):
+        if cache is not None:
+            if u not in hits:
+                if res.get("pts") is None:
+                    res["pts"] = prepare_step_arrays(units[u])
+                cache.put(keys[u], {"seg": res["seg"], "sum": res["sum"], "hour": res["hour"],
+                                    "pts": res["pts"],
+                                    "base": (base_key, res["s0"]) if base_key else None})
+            cache.set_latest(lineages[u], keys[u])
+        res["key"] = keys[u]
+        out[u] = res
+
+    # tổng số chặng: cache / tính tiếp 1 chặng mỗi tổ máy ; tính mới cộng thêm khi biết số worker
+    st = _Stages(len(hits) + len(bases), progress, cancel)
+    st.check()
+    for u, got in hits.items():
+        _done(u, dict(got, view=merge_hour_with_contract(got["hour"], contracts.get(u))))
+        st.step(f"{u}: lấy từ cache ({len(got['sum'])} cặp lệnh)")
+    for u, (prev, base) in bases.items():
+        res = extend_unit(mode, units[u], base, params)
+        if res is None:          # không tính tiếp được -> tính lại từ đầu như tổ máy mới
+            todo.append(u)
+            st.step(f"{u}: không tính tiếp được, tính lại từ đầu")
+            continue
+        res["view"] = merge_hour_with_contract(res["hour"], contracts.get(u))
+        _done(u, res, prev)
+        st.step(f"{u}: tính lại {len(res['sum']) - res['s0']}/{len(res['sum'])} cặp cuối")
+    todo = [u for u in names if u in todo]
+
+    if workers is None:
+        big = sum(len(units[u]) for u in todo) >= PARALLEL_MIN_ROWS
+        workers = min(len(todo), os.cpu_count() or 1) if big else 1
+    workers = max(1, min(int(workers), len(todo) or 1))
+    st.total += (3 if workers <= 1 else 1) * len(todo)
+
+    if workers <= 1:
+        for u in todo:
+            seg, summ = BUILDERS[mode](units[u])
+            st.step(f"{u}: {len(summ)} cặp lệnh")
+            hour = segments_to_hourly(seg, **HOURLY_PARAMS)
+            st.step(f"{u}: {len(hour)} giờ")
+            _done(u, {"seg": seg, "sum": summ, "hour": hour,
+                      "view": merge_hour_with_contract(hour, contracts.get(u))})
+            st.step(f"{u}: ghép Sub-Contract")
+        return {u: out[u] for u in names}
+
+    pool = _get_pool(workers)
+    futures = {pool.submit(compute_unit, mode, units[u], contracts.get(u)): u for u in todo}
+    pending = set(futures)
+    try:
+        while pending:
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                u = futures[fut]
+                _done(u, fut.result())
+                st.step(f"{u}: {len(out[u]['sum'])} cặp lệnh, {len(out[u]['hour'])} giờ")
+            st.check()
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    finally:
+        for fut in pending:
+            fut.cancel()
+    return {u: out[u] for u in names}
+
+
+def compute_hourly(mode: str,
+                   df1: pd.DataFrame,
+                   df2: pd.DataFrame,
+                   ct1: Optional[Contract] = None,
+                   ct2: Optional[Contract] = None,
+                   workers: Optional[int] = None,
+                   progress: Optional[ProgressFn] = None,
+                   cancel: Optional[threading.Event] = None,
+                   cache: Optional[ResultCache] = None) -> Dict[str, object]:
+    """
+    compute_units cho đúng cặp S1/S2.
+    Trả về dict: seg1, sum1, seg2, sum2, s1_hour, s2_hour, s1_view, s2_view, key1, key2.
+    """
+    res = compute_units(mode, {"S1": df1, "S2": df2}, {"S1": ct1, "S2": ct2},
+                        workers=workers, progress=progress, cancel=cancel, cache=cache)
+    out = {}
+    for u in ("1", "2"):
+        r = res["S" + u]
+        out["seg" + u], out["sum" + u] = r["seg"], r["sum"]
+        out[f"s{u}_hour"], out[f"s{u}_view"] = r["hour"], r["view"]
+        out["key" + u] = r["key"]
+    return out
+
+
+# ===================== Xuất file (phút + giờ) =====================
+def _extend_minutely(cache: ResultCache, key: str, seg) -> Optional[pd.DataFrame]:
+    """DF phút của tổ máy key dựng tiếp từ DF phút của lần tính gốc (nếu có trong cache)."""
+    entry = cache.get(key)
+    base = entry.get("base") if entry is not None else None
+    if not base:
+        return None
+    prev = cache.get(ResultCache.derived(base[0], "min", MINUTELY_PARAMS))
+    if prev is None:
+        return None
+    return extend_minutely(prev, seg, base[1], **MINUTELY_PARAMS)
+
+
+def export_minutely_and_hourly(seg1, seg2, path: str, sheet_name: str,
+                               progress: Optional[ProgressFn] = None,
+                               cancel: Optional[threading.Event] = None,
+                               cache: Optional[ResultCache] = None,
+                               keys=(None, None),
+                               fmt: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Dựng DF phút từ segments (chỉ cần khi xuất) rồi ghi file (bố cục A/D/G/J như Excel).
+    fmt: định dạng xuất (export_utils.EXPORT_FORMATS: xlsx, xlsx_fast, csv, csv_gz, parquet,
+    feather); None -> theo đuôi file.
+    cache + keys (khóa tổ máy từ compute_units): DF phút đã dựng trước đó được dùng lại;
+    tổ máy được tính tiếp từ lần trước -> chỉ dựng lại các phút từ segment đầu tiên thay đổi.
+    Trả về dict: s1_min, s2_min.
+    """
+    st = _Stages(3, progress, cancel)
+    st.check()
+    out = {}
+    for u, seg, key in (("1", seg1, keys[0]), ("2", seg2, keys[1])):
+        mkey = ResultCache.derived(key, "min", MINUTELY_PARAMS) if cache is not None and key else None
+        minutely = cache.get(mkey) if mkey else None
+        if minutely is None:
+            minutely = _extend_minutely(cache, key, seg) if mkey else None
+            if minutely is None:
+                minutely = ppa_segments_to_minutely(seg, **MINUTELY_PARAMS)
+            if mkey:
+                cache.put(mkey, minutely)
+        out[f"s{u}_min"] = minutely
+        st.step(f"S{u}: {len(minutely)} phút")
+    export_ppa_minutely_and_hourly_to_excel(
+        df_s1_minutely=out["s1_min"],
+        df_s2_minutely=out["s2_min"],
+        filepath=path,
+        sheet_name=sheet_name,
+        freq="T",
+        drop_incomplete=True,
+        fmt=fmt
+    )
+    if progress is not None:
+        progress(f"Đã ghi {len(out['s1_min']) + len(out['s2_min'])} dòng phút", 3, 3)
+    return out
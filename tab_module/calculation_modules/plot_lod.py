@@ -0,0 +1,187 @@
+# plot_lod.py
+import numpy as np
+import matplotlib.dates as mdates
+import mplcursors
+from typing import Callable, Optional, Sequence, Tuple
+from tab_module.calculation_modules.segment_store import SegmentStore
+
+# Vẽ chuỗi dài theo mức chi tiết (level of detail):
+#   - nhiều segment -> 1 đường duy nhất, ngắt bằng NaN giữa các segment (1 Line2D thay vì N)
+#   - chỉ vẽ các điểm M4 (đầu / cuối / min / max mỗi cột pixel) trong khoảng x đang nhìn,
+#     tính lại mỗi lần zoom / pan / đổi cỡ cửa sổ -> hình giống khi vẽ đủ điểm (lệch <= 1 pixel)
+#   - tooltip: mplcursors bám các điểm đang hiện, chữ chỉ dựng cho điểm đang hover
+
+POINTS_PER_BIN = 4          # M4: đầu, cuối, min, max
+DEFAULT_BINS = 2000         # số cột tối thiểu (trục thường hẹp hơn -> vẫn đủ chi tiết)
+
+
+def m4_indices(x: np.ndarray, y: np.ndarray, lo: float, hi: float, n_bins: int,
+               monotonic: bool = True) -> np.ndarray:
+    """
+    Chỉ số các điểm cần vẽ của (x, y có thể NaN) trong khung [lo, hi] với n_bins cột.
+    Mỗi cột chia thành các đoạn liền nét (NaN ngắt thật = đoạn mới); mỗi đoạn giữ
+    điểm đầu, cuối, min, max. NaN nằm giữa 2 điểm trùng nhau (segment nối tiếp tại điểm cắt)
+    không làm đứt nét -> bỏ qua, nên số điểm giữ lại chỉ tăng theo số chỗ đứt nét thật.
+    monotonic (x tăng dần): chỉ xét khung + 1 điểm ngoài mỗi biên; ngược lại điểm ngoài khung
+    gom vào 2 cột biên. Ít điểm -> trả về đủ.
+    """
+    n = len(x)
+    if monotonic:
+        i0 = max(int(np.searchsorted(x, lo, side="left")) - 1, 0)
+        i1 = min(int(np.searchsorted(x, hi, side="right")) + 1, n)
+    else:
+        i0, i1 = 0, n
+    if i1 - i0 <= POINTS_PER_BIN * n_bins or hi <= lo:
+        return np.arange(i0, i1)
+    xs, ys = x[i0:i1], y[i0:i1]
+    nan = np.isnan(ys)
+    joined = np.zeros(len(ys), dtype=bool)
+    joined[1:-1] = nan[1:-1] & (ys[:-2] == ys[2:]) & (xs[:-2] == xs[2:])
+    pos = np.flatnonzero(~joined)
+    xs, ys, nan = xs[pos], ys[pos], nan[pos]
+
+    # floor (không phải astype cắt về 0): điểm ngay trái lo rơi vào cột biên -1, không lẫn vào cột 0
+    b = np.clip(np.floor((xs - lo) / (hi - lo) * n_bins).astype(np.int64), -1, n_bins)
+    brk = np.ones(len(xs), dtype=bool)
+    brk[1:] = (b[1:] != b[:-1]) | nan[1:] | nan[:-1]
+    g = np.cumsum(brk)                                       # nhóm = (cột, đoạn liền nét)
+    first = np.flatnonzero(brk)
+    last = np.concatenate((first[1:] - 1, [len(xs) - 1]))
+    by_min = np.lexsort((np.where(nan, np.inf, ys), g))     # trong mỗi nhóm: y tăng dần
+    by_max = np.lexsort((np.where(nan, -np.inf, ys), g))
+    arg_min = by_min[first]                                  # g tăng dần -> nhóm theo cùng thứ tự
+    arg_max = by_max[last]
+    keep = np.unique(np.concatenate((first, last, arg_min, arg_max)))
+    return pos[keep] + i0
+
+
+def nan_joined(store: SegmentStore, indices: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Các segment đã chọn -> 1 chuỗi (t_ns, mw, row) ngắt bằng 1 điểm NaN sau mỗi segment.
+    row: dòng tương ứng trong store (-1 ở điểm ngắt); t của điểm ngắt = t điểm trước (x vẫn tăng dần).
+    """
+    idx = np.unique(np.asarray(indices, dtype=np.int64))          # theo thứ tự segment = thứ tự thời gian
+    idx = idx[(idx >= 0) & (idx < store.n_segments)]
+    lens = store.lengths[idx]
+    idx, lens = idx[lens > 0], lens[lens > 0]
+    if not len(idx):
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    out_start = np.cumsum(lens + 1) - (lens + 1)
+    rows = np.full(int((lens + 1).sum()), -1, dtype=np.int64)
+    pos = np.arange(int(lens.sum())) + np.repeat(out_start - (np.cumsum(lens) - lens), lens)
+    rows[pos] = np.arange(int(lens.sum())) + np.repeat(store.offsets[idx] - (np.cumsum(lens) - lens), lens)
+    t = np.empty(len(rows), dtype=np.int64)
+    t[pos] = store.t_ns[rows[pos]]
+    gap = out_start + lens                                   # vị trí điểm ngắt
+    t[gap] = t[gap - 1]
+    mw = np.full(len(rows), np.nan)
+    mw[pos] = store.mw[rows[pos]]
+    return t, mw, rows
+
+
+class LodLine:
+    """
+    1 đường (x = thời điểm datetime64/int64 ns, y có thể NaN để ngắt) vẽ theo M4:
+    chỉ giữ các điểm cần cho khung x hiện tại, tự vẽ lại khi zoom / pan.
+    tip(i) -> chuỗi tooltip cho điểm i của dữ liệu đầy đủ (gọi lúc hover).
+    Marker chỉ hiện khi mọi điểm trong khung đều được vẽ (zoom đủ gần).
+    """
+
+    def __init__(self, ax, t, y, tip: Optional[Callable[[int], str]] = None,
+                 marker: str = "o", **line_kw):
+        self.ax = ax
+        self.tip = tip
+        self.marker = marker
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.sorted = True
+        self.idx = np.zeros(0, dtype=np.int64)   # điểm đang vẽ (chỉ số trong dữ liệu đầy đủ)
+        self.shown = self.idx                    # điểm đang vẽ có y (đích của tooltip)
+        ax.xaxis_date()
+        self.line, = ax.plot([], [], **line_kw)
+        self.pts = ax.scatter([], [], s=1, alpha=0)   # scatter ẩn: cursor chỉ bám vào điểm
+        self.cursor = None
+        self.set_data(t, y, tip)
+        if tip is not None:
+            self.cursor = mplcursors.cursor(self.pts, hover=True)
+            self.cursor.connect("add", self._on_add)
+        self._cid = ax.callbacks.connect("xlim_changed", self._on_xlim)
+        self._cid_resize = ax.figure.canvas.mpl_connect("resize_event", lambda _e: self._on_xlim(ax))
+
+    def set_data(self, t, y, tip: Optional[Callable[[int], str]] = None, autoscale: bool = True) -> None:
+        """
+        Thay dữ liệu, dùng lại Line2D / scatter / cursor (không tạo artist mới).
+        autoscale: mở rộng giới hạn dữ liệu của trục theo toàn dải; False -> giữ khung hiện tại.
+        """
+        self.x = mdates.date2num(np.asarray(t).astype("datetime64[ns]"))
+        self.y = np.asarray(y, dtype=float)
+        self.sorted = bool(np.all(np.diff(self.x) >= 0))
+        if tip is not None:
+            self.tip = tip
+        if self.cursor is not None:   # chỉ số điểm đổi -> bỏ tooltip đang mở
+            for sel in list(self.cursor.selections):
+                self.cursor.remove_selection(sel)
+        if not len(self.x):
+            self.idx = self.shown = np.zeros(0, dtype=np.int64)
+            self.line.set_data([], [])
+            self.pts.set_offsets(np.zeros((0, 2)))
+            return
+        if not autoscale:
+            self.update(*self.ax.get_xlim())
+            return
+        self.update(self.x.min(), self.x.max())   # M4 trên toàn dải đã gồm min/max -> autoscale đúng
+        lim = self.data_limits()
+        if lim is not None:
+            self.ax.update_datalim([(lim[0], lim[2]), (lim[1], lim[3])])
+            self.ax.autoscale_view()
+
+    def data_limits(self) -> Optional[Tuple[float, float, float, float]]:
+        """(x min, x max, y min, y max) của dữ liệu đầy đủ; không có điểm -> None."""
+        ok = ~np.isnan(self.y)
+        if not ok.any():
+            return None
+        return float(self.x.min()), float(self.x.max()), float(self.y[ok].min()), float(self.y[ok].max())
+
+    def set_visible(self, visible: bool) -> None:
+        was = self.line.get_visible()
+        self.line.set_visible(visible)
+        self.pts.set_visible(visible)
+        if visible and not was:   # lúc ẩn không tính lại khi zoom -> bắt kịp khung hiện tại
+            self.update(*self.ax.get_xlim())
+
+    @property
+    def n_bins(self) -> int:
+        # theo bề rộng cả figure (>= bề rộng trục, kể cả sau tight_layout) -> mỗi cột <= 1 pixel
+        return max(int(self.ax.figure.bbox.width), DEFAULT_BINS)
+
+    def update(self, lo: float, hi: float) -> None:
+        if not len(self.x):
+            return
+        self.idx = m4_indices(self.x, self.y, lo, hi, self.n_bins, monotonic=self.sorted)
+        x = self.x[self.idx]
+        self.line.set_data(x, self.y[self.idx])
+        if self.sorted:
+            n_view = int(np.searchsorted(self.x, hi, side="right") - np.searchsorted(self.x, lo, side="left"))
+        else:
+            n_view = int(np.count_nonzero((self.x >= lo) & (self.x <= hi)))
+        full = n_view == np.count_nonzero((x >= lo) & (x <= hi))   # không bỏ điểm nào trong khung
+        self.line.set_marker(self.marker if full else "")
+        self.shown = self.idx[~np.isnan(self.y[self.idx])]
+        self.pts.set_offsets(np.column_stack([self.x[self.shown], self.y[self.shown]]))
+
+    def _on_xlim(self, ax) -> None:
+        if self.line.get_visible():
+            self.update(*ax.get_xlim())
+
+    def _on_add(self, sel) -> None:
+        i = int(self.shown[sel.index])
+        sel.annotation.set_text(self.tip(i))
+        sel.annotation.get_bbox_patch().set(fc="white", alpha=0.9)
+
+    def remove(self) -> None:
+        self.ax.callbacks.disconnect(self._cid)
+        self.ax.figure.canvas.mpl_disconnect(self._cid_resize)
+        if self.cursor is not None:
+            self.cursor.remove()
+        self.line.remove()
+        self.pts.remove()
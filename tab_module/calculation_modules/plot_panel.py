@@ -0,0 +1,233 @@
+# plot_panel.py
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg, NavigationToolbar2QT
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QLabel, QPushButton
+from typing import Dict, Optional, Sequence, Tuple
+from tab_module.calculation_modules.segment_store import SegmentStore
+from tab_module.calculation_modules.plot_lod import LodLine, nan_joined
+from tab_module.calculation_modules.plot_ppa import cut_points, pair_tooltip, pick_segments
+
+# Khung vẽ nhúng trong tab Calculation (thay cho 1 cửa sổ plt.show() mỗi lần bấm Draw):
+#   - 1 Figure / 1 trục dựng 1 lần; mỗi lớp (mode, tổ máy) giữ 1 LodLine + vạch cắt, vẽ lại bằng set_data
+#   - artist của các lớp là animated: nền (trục, lưới, nhãn) chụp lại sau mỗi lần vẽ đầy đủ;
+#     bật/tắt lớp, Draw lại cùng dữ liệu -> restore nền + vẽ các lớp + blit (không vẽ lại cả figure)
+#   - vẽ đầy đủ chỉ khi khung đổi (dữ liệu mới, zoom / pan, đổi cỡ)
+
+UNIT_COLORS = {"S1": "C0", "S2": "C1"}   # màu theo tổ máy
+MODE_STYLES = {"PPA": "-", "EPC": "--"}  # nét theo mode
+
+
+class _Layer:
+    """Artist + dữ liệu của 1 lớp (mode, tổ máy); artist dựng 1 lần, dùng lại khi đổi dữ liệu."""
+    __slots__ = ("lod", "cuts", "cut_pts", "segments", "summary", "indices", "title")
+
+
+class PlotPanel(QWidget):
+    """
+    Khung vẽ PPA / EPC của S1 / S2 chồng lên nhau trên cùng 1 trục.
+    show_pairs(mode, unit, segments, indices) vẽ / thay 1 lớp; checkbox bật / tắt theo tổ máy và mode.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.figure = Figure(figsize=(10, 4))
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.toolbar = NavigationToolbar2QT(self.canvas, self)
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_xlabel("Thời điểm")
+        self.ax.set_ylabel("MW")
+        self.ax.grid(True, alpha=0.3)
+        self.ax.xaxis_date()
+
+        self._layers: Dict[Tuple[str, str], _Layer] = {}
+        self._active: Optional[Tuple[str, str]] = None   # lớp vẽ gần nhất (đích của "Chọn cụm…")
+        self._legend = None
+        self._shown = ()                                  # lớp đang hiện (khóa), đổi -> dựng lại chú giải
+        self._bg = None                                   # nền đã chụp (None -> cần vẽ đầy đủ)
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        row = QHBoxLayout()
+        self.chk_units = {}
+        self.chk_modes = {}
+        for name, boxes in [(u, self.chk_units) for u in UNIT_COLORS] + [(m, self.chk_modes) for m in MODE_STYLES]:
+            chk = QCheckBox(name)
+            chk.setChecked(True)
+            chk.toggled.connect(self._on_toggle)
+            boxes[name] = chk
+            row.addWidget(chk)
+        self.btn_pick = QPushButton("Chọn cụm…")
+        self.btn_pick.setEnabled(False)
+        self.btn_pick.clicked.connect(self.pick_pairs)
+        row.addWidget(self.btn_pick)
+        self.lbl_info = QLabel("—")
+        row.addWidget(self.lbl_info, 1)
+        row.addWidget(self.toolbar)
+        layout.addLayout(row)
+        layout.addWidget(self.canvas, 1)
+
+    # ================= Lớp =================
+    def _new_layer(self, mode: str, unit: str) -> _Layer:
+        color, style = UNIT_COLORS.get(unit, "C2"), MODE_STYLES.get(mode, "-")
+        layer = _Layer()
+        layer.lod = LodLine(self.ax, np.zeros(0, dtype="datetime64[ns]"), np.zeros(0), tip=lambda i: "",
+                            linewidth=1.5, color=color, linestyle=style, animated=True)
+        # vạch dọc tại điểm bị đè (trục y theo khung: 0..1) + dấu x
+        layer.cuts = LineCollection([], colors=color, linestyles="--", alpha=0.4,
+                                    transform=self.ax.get_xaxis_transform(), animated=True)
+        self.ax.add_collection(layer.cuts, autolim=False)
+        layer.cut_pts = self.ax.scatter([], [], marker="x", s=40, color=color, animated=True)
+        layer.segments, layer.summary, layer.indices, layer.title = None, None, np.zeros(0, dtype=np.int64), ""
+        self._layers[(mode, unit)] = layer
+        return layer
+
+    def show_pairs(self, mode: str, unit: str, segments: SegmentStore,
+                   indices: Optional[Sequence[int]] = None, title: str = "", activate: bool = True,
+                   summary: Optional[pd.DataFrame] = None) -> None:
+        """
+        Vẽ các cụm indices của segments vào lớp (mode, unit); summary (nếu có) cho hộp thoại chọn cụm.
+        indices None: giữ lựa chọn cũ nếu cùng segments, không thì mọi cụm.
+        Cùng segments + cùng lựa chọn -> chỉ bật lớp (blit), không tính lại.
+        """
+        key = (mode, unit)
+        layer = self._layers.get(key)
+        same = layer is not None and layer.segments is segments
+        if indices is None and same:
+            idx = layer.indices
+        elif indices is None:
+            idx = np.arange(segments.n_segments)
+        else:
+            idx = np.unique(np.asarray(indices, dtype=np.int64))
+        changed = not (same and (idx is layer.indices or np.array_equal(layer.indices, idx)))
+        if changed:
+            t, mw, rows = nan_joined(segments, idx)
+            tip = pair_tooltip(segments, rows)
+            if layer is None:
+                layer = self._new_layer(mode, unit)
+            layer.lod.set_data(t, mw, lambda i, _tip=tip, _name=title or f"{mode} {unit}": f"{_name}\n{_tip(i)}",
+                               autoscale=False)
+            t_cut, mw_cut = cut_points(segments, rows)
+            x_cut = mdates.date2num(t_cut)
+            layer.cuts.set_segments(np.stack([np.column_stack([x_cut, np.zeros(len(x_cut))]),
+                                              np.column_stack([x_cut, np.ones(len(x_cut))])], axis=1))
+            layer.cut_pts.set_offsets(np.column_stack([x_cut, mw_cut]))
+            layer.segments, layer.indices = segments, idx
+        if changed or summary is not None:
+            layer.summary = summary
+        layer.title = title or layer.title or f"{mode} {unit}"
+        if activate:
+            self._active = key
+            for chk in (self.chk_units.get(unit), self.chk_modes.get(mode)):
+                if chk is not None and not chk.isChecked():
+                    chk.blockSignals(True)
+                    chk.setChecked(True)
+                    chk.blockSignals(False)
+        self._refresh(rescale=changed)
+
+    def has_layer(self, mode: str, unit: str) -> bool:
+        layer = self._layers.get((mode, unit))
+        return layer is not None and layer.segments is not None
+
+    def clear(self, mode: Optional[str] = None) -> None:
+        """Bỏ dữ liệu các lớp (của 1 mode hoặc tất cả); artist giữ lại để dùng tiếp."""
+        for (m, u), layer in self._layers.items():
+            if mode is None or m == mode:
+                layer.lod.set_data(np.zeros(0, dtype="datetime64[ns]"), np.zeros(0), autoscale=False)
+                layer.cuts.set_segments([])
+                layer.cut_pts.set_offsets(np.zeros((0, 2)))
+                layer.segments, layer.summary, layer.indices = None, None, np.zeros(0, dtype=np.int64)
+        self._refresh()
+
+    def pick_pairs(self) -> None:
+        """Chọn lại cụm cho lớp vẽ gần nhất (hộp thoại, lựa chọn hiện tại đã tick sẵn)."""
+        layer = self._layers.get(self._active)
+        if layer is None or layer.segments is None:
+            return
+        indices = pick_segments(layer.segments, parent=self, title=f"Chọn cụm – {layer.title}",
+                                checked=layer.indices.tolist(), summary=layer.summary)
+        if indices is None:
+            return
+        self.show_pairs(*self._active, layer.segments, indices, layer.title)
+
+    # ================= Hiển thị =================
+    def _visible(self, key: Tuple[str, str]) -> bool:
+        mode, unit = key
+        layer = self._layers[key]
+        return (len(layer.lod.x) > 0 and self.chk_units.get(unit) is not None and self.chk_units[unit].isChecked()
+                and self.chk_modes.get(mode) is not None and self.chk_modes[mode].isChecked())
+
+    def _on_toggle(self, _checked: bool) -> None:
+        self._refresh()
+
+    def _refresh(self, rescale: bool = False) -> None:
+        shown = tuple(key for key in self._layers if self._visible(key))
+        for key, layer in self._layers.items():
+            v = key in shown
+            layer.lod.set_visible(v)
+            layer.cuts.set_visible(v)
+            layer.cut_pts.set_visible(v)
+        redraw = rescale or shown != self._shown
+        if redraw:
+            # chú giải animated: vẽ cùng các lớp khi blit
+            if self._legend is not None:
+                self._legend.remove()
+                self._legend = None
+            if shown:
+                lines = [self._layers[k].lod.line for k in shown]
+                self._legend = self.ax.legend(lines, [self._layers[k].title for k in shown], loc="upper right")
+                self._legend.set_animated(True)
+            self._shown = shown
+
+        layer = self._layers.get(self._active)
+        self.btn_pick.setEnabled(layer is not None and layer.segments is not None)
+        if layer is not None and layer.segments is not None:
+            self.lbl_info.setText(f"{layer.title}: {len(layer.indices)}/{layer.segments.n_segments} cụm")
+        else:
+            self.lbl_info.setText("—")
+
+        if not redraw:
+            return                    # cùng dữ liệu, cùng lớp đang hiện -> hình không đổi
+        if rescale and self._rescale():
+            self.canvas.draw_idle()   # khung đổi -> vẽ đầy đủ (draw_event chụp lại nền)
+        else:
+            self._blit()
+
+    def _rescale(self) -> bool:
+        """Khung = toàn dải các lớp đang hiện; Home của toolbar = khung này."""
+        lims = [l.lod.data_limits() for k, l in self._layers.items() if self._visible(k)]
+        lims = np.array([lim for lim in lims if lim is not None])
+        if not len(lims):
+            return False
+        self.ax.set_autoscale_on(True)
+        self.ax.ignore_existing_data_limits = True
+        self.ax.update_datalim([(lims[:, 0].min(), lims[:, 2].min()), (lims[:, 1].max(), lims[:, 3].max())])
+        self.ax.autoscale_view()
+        self.toolbar.update()
+        return True
+
+    # ================= Blit =================
+    def _on_draw(self, _event) -> None:
+        self._bg = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_layers()
+
+    def _draw_layers(self) -> None:
+        for key, layer in self._layers.items():
+            if layer.lod.line.get_visible():
+                self.ax.draw_artist(layer.cuts)
+                self.ax.draw_artist(layer.lod.line)
+                self.ax.draw_artist(layer.cut_pts)
+        if self._legend is not None:
+            self.ax.draw_artist(self._legend)
+
+    def _blit(self) -> None:
+        if self._bg is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._bg)
+        self._draw_layers()
+        self.canvas.blit(self.figure.bbox)
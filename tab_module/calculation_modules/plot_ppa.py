@@ -1,65 +1,126 @@
 # plot_ppa.py
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from PySide6.QtWidgets import (
-    QMessageBox, QDialog, QVBoxLayout, QListWidget, QListWidgetItem,
-    QDialogButtonBox, QHBoxLayout, QPushButton, QLabel
+    QMessageBox, QDialog, QVBoxLayout, QTableView, QAbstractItemView, QComboBox, QDateTimeEdit,
+    QLineEdit, QDialogButtonBox, QHBoxLayout, QPushButton, QLabel
 )
-from PySide6.QtCore import Qt
-import mplcursors
-from typing import List, Tuple, Union, Optional
-
-# ========== Tiện ích ==========
-def _normalize_segment(df: pd.DataFrame) -> pd.DataFrame:
-    seg = df.copy()
-    seg["Thời điểm"] = pd.to_datetime(seg["Thời điểm"], errors="coerce")
-    seg = seg.dropna(subset=["MW", "Thời điểm"]).reset_index(drop=True)
-    seg = seg.sort_values("Thời điểm")
-    return seg
-
-def _pair_label(i: int, seg: pd.DataFrame) -> str:
-    try:
-        s = float(seg.loc[seg["Event"] == "start", "MW"].iloc[0])
-    except Exception:
-        s = float(seg["MW"].iloc[0])
-    try:
-        f = float(seg.loc[seg["Event"] == "finish", "MW"].iloc[-1])
-    except Exception:
-        f = float(seg["MW"].iloc[-1])
-    trend = "↑" if f > s else ("↓" if f < s else "→")
-    return f"Pair {i}: {s:.1f} {trend} {f:.1f}"
+from PySide6.QtCore import QDate, QDateTime, QItemSelection, QItemSelectionModel, QTime
+from typing import Callable, List, Sequence, Tuple, Union, Optional
+from tab_module.calculation_modules.segment_store import SegmentStore, EVENT_CODES
+from tab_module.calculation_modules.plot_lod import LodLine, nan_joined
+from tab_module.main_window_modules.pair_model import NAT_NS, PairTableModel, pair_table
 
 # ========== Hộp thoại chọn cụm ==========
+_ALL = "Tất cả"
+_DIRECTIONS = [_ALL, "↑", "↓", "→"]
+_HOLD = {_ALL: None, "Có hold": True, "Không hold": False}
+
+
+def _to_qdatetime(t_ns: int) -> QDateTime:
+    t = pd.Timestamp(int(t_ns))
+    return QDateTime(QDate(t.year, t.month, t.day), QTime(t.hour, t.minute, t.second))
+
+
+def _from_qdatetime(q: QDateTime) -> int:
+    d, t = q.date(), q.time()
+    return pd.Timestamp(d.year(), d.month(), d.day(), t.hour(), t.minute(), t.second()).value
+
+
+def parse_pair_ranges(text: str) -> List[Tuple[int, int]]:
+    """ "10-200, 350" -> [(10, 200), (350, 350)] ; sai cú pháp -> ValueError."""
+    out = []
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        a, sep, b = part.partition("-")
+        lo = int(a)
+        hi = int(b) if sep else lo
+        out.append((min(lo, hi), max(lo, hi)))
+    return out
+
+
 class SegmentPickerDialog(QDialog):
-    def __init__(self, segments: List[pd.DataFrame], parent=None, title="Chọn cụm ppa để vẽ"):
+    """
+    Chọn cụm để vẽ trên bảng cụm ảo (PairTableModel, dựng 1 lần từ summary):
+      - lọc theo khoảng thời gian, hướng (↑ / ↓ / →), EndReason, InsideHold
+      - chọn theo khoảng: kéo / Shift+click, Ctrl+click thêm bớt, hoặc gõ "10-200, 350"
+    Đổi bộ lọc -> chọn mọi cụm đang hiện. selected_indices = index segment đã chọn (tăng dần).
+    """
+
+    def __init__(self, segments: Union[SegmentStore, List[pd.DataFrame]], parent=None, title="Chọn cụm ppa để vẽ",
+                 checked: Optional[Sequence[int]] = None, summary: Optional[pd.DataFrame] = None):
         super().__init__(parent)
         self.setWindowTitle(title)
-        self._segments = segments
+        self.resize(760, 560)
+        self._segments = SegmentStore.from_frames(segments)
+        self._table = pair_table(self._segments, summary)
         self.selected_indices: List[int] = []
 
         layout = QVBoxLayout(self)
-        layout.addWidget(QLabel("Chọn các cụm (pair) muốn vẽ:", self))
-
-        self.listw = QListWidget(self)
-        for i, seg in enumerate(self._segments):
-            label = _pair_label(i, _normalize_segment(seg))
-            item = QListWidgetItem(label)
-            # Cho phép tick chọn
-            item.setFlags(item.flags() | Qt.ItemIsUserCheckable | Qt.ItemIsSelectable | Qt.ItemIsEnabled)
-            item.setCheckState(Qt.Checked)  # Checked mặc định
-            self.listw.addItem(item)
-        layout.addWidget(self.listw)
-
-        # Buttons: Chọn hết / Bỏ chọn
-        row_btns = QHBoxLayout()
+        layout.addWidget(QLabel("Chọn các cụm (pair) muốn vẽ: kéo / Shift+click chọn khoảng, Ctrl+click thêm bớt.", self))
+
+        # ----- Bộ lọc -----
+        start_ns = self._table["start_ns"].to_numpy()
+        finish_ns = self._table["finish_ns"].to_numpy()
+        ok_start, ok_finish = start_ns[start_ns != NAT_NS], finish_ns[finish_ns != NAT_NS]
+        t_min = int(ok_start.min()) if len(ok_start) else pd.Timestamp.now().floor("D").value
+        t_max = int(ok_finish.max()) if len(ok_finish) else t_min
+        row_time = QHBoxLayout()
+        self.dt_from = QDateTimeEdit(_to_qdatetime(t_min), self)
+        self.dt_to = QDateTimeEdit(_to_qdatetime(-(-t_max // 10**9) * 10**9), self)   # làm tròn lên giây
+        for w, name in ((self.dt_from, "Từ"), (self.dt_to, "Đến")):
+            w.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+            w.setCalendarPopup(True)
+            row_time.addWidget(QLabel(name, self))
+            row_time.addWidget(w)
+        layout.addLayout(row_time)
+
+        row_filter = QHBoxLayout()
+        self.cmb_dir = QComboBox(self)
+        self.cmb_dir.addItems(_DIRECTIONS)
+        self.cmb_reason = QComboBox(self)
+        self.cmb_reason.addItems([_ALL] + sorted(r for r in self._table["end_reason"].unique() if r))
+        self.cmb_hold = QComboBox(self)
+        self.cmb_hold.addItems(list(_HOLD))
+        for w, name in ((self.cmb_dir, "Hướng"), (self.cmb_reason, "EndReason"), (self.cmb_hold, "InsideHold")):
+            row_filter.addWidget(QLabel(name, self))
+            row_filter.addWidget(w, 1)
+        layout.addLayout(row_filter)
+
+        # ----- Bảng cụm (model ảo) -----
+        self.model = PairTableModel(self._table, self)
+        self.view = QTableView(self)
+        self.view.setModel(self.model)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.verticalHeader().setDefaultSectionSize(self.view.fontMetrics().height() + 6)
+        self.view.horizontalHeader().setStretchLastSection(True)
+        # header cột dùng selection riêng (luôn rỗng): với selection chung, mỗi lần vẽ header
+        # Qt dò từng dòng xem cả cột có được chọn không (~1s khi chọn hết vài chục nghìn cụm)
+        self.view.horizontalHeader().setSelectionModel(QItemSelectionModel(self.model, self.view))
+        layout.addWidget(self.view, 1)
+
+        # ----- Chọn theo khoảng số cụm -----
+        row_range = QHBoxLayout()
+        self.edit_range = QLineEdit(self)
+        self.edit_range.setPlaceholderText("Khoảng cụm, vd 10-200, 350")
+        self.edit_range.returnPressed.connect(self._select_ranges)
+        btn_range = QPushButton("Chọn khoảng")
+        btn_range.clicked.connect(self._select_ranges)
         btn_all = QPushButton("Chọn hết")
         btn_none = QPushButton("Bỏ chọn")
-        row_btns.addWidget(btn_all)
-        row_btns.addWidget(btn_none)
-        layout.addLayout(row_btns)
-
         btn_all.clicked.connect(self._select_all)
         btn_none.clicked.connect(self._clear_all)
+        row_range.addWidget(self.edit_range, 1)
+        for b in (btn_range, btn_all, btn_none):
+            row_range.addWidget(b)
+        layout.addLayout(row_range)
+
+        self.lbl_count = QLabel(self)
+        layout.addWidget(self.lbl_count)
 
         # OK / Cancel
         btn_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
@@ -67,22 +128,115 @@ class SegmentPickerDialog(QDialog):
         btn_box.rejected.connect(self.reject)
         layout.addWidget(btn_box)
 
+        self.view.selectionModel().selectionChanged.connect(self._update_count)
+        for w in (self.dt_from, self.dt_to):
+            w.dateTimeChanged.connect(self._apply_filter)
+        for w in (self.cmb_dir, self.cmb_reason, self.cmb_hold):
+            w.currentIndexChanged.connect(self._apply_filter)
+
+        # mặc định: chọn hết (hoặc đúng các cụm đã chọn lần trước)
+        if checked is None:
+            self._select_all()
+        else:
+            self._select_positions(np.unique(np.asarray(list(checked), dtype=np.int64)))
+        self.view.resizeColumnsToContents()
+
+    # ----- Lọc -----
+    def filter_mask(self) -> np.ndarray:
+        """Dòng nào của bảng cụm qua bộ lọc hiện tại (vector hóa trên cả bảng)."""
+        tb = self._table
+        lo, hi = _from_qdatetime(self.dt_from.dateTime()), _from_qdatetime(self.dt_to.dateTime())
+        start, finish = tb["start_ns"].to_numpy(), tb["finish_ns"].to_numpy()
+        # cụm chạm khoảng [lo, hi] ; thiếu thời điểm -> không lọc theo thời gian
+        mask = ((finish >= lo) | (finish == NAT_NS)) & ((start <= hi) | (start == NAT_NS))
+        if self.cmb_dir.currentText() != _ALL:
+            mask &= tb["trend"].to_numpy() == self.cmb_dir.currentText()
+        if self.cmb_reason.currentText() != _ALL:
+            mask &= tb["end_reason"].to_numpy() == self.cmb_reason.currentText()
+        hold = _HOLD[self.cmb_hold.currentText()]
+        if hold is not None:
+            mask &= tb["inside_hold"].to_numpy() == hold
+        return mask
+
+    def _apply_filter(self, *_):
+        self.model.set_rows(np.flatnonzero(self.filter_mask()))
+        self._select_all()
+
+    # ----- Chọn -----
+    def _select_positions(self, pos: np.ndarray):
+        """Chọn các dòng đang hiện ở vị trí pos (tăng dần), gom thành khoảng liền nhau."""
+        sel = QItemSelection()
+        if len(pos):
+            breaks = np.flatnonzero(np.diff(pos) != 1)
+            tops = np.concatenate(([pos[0]], pos[breaks + 1]))
+            bottoms = np.concatenate((pos[breaks], [pos[-1]]))
+            last_col = self.model.columnCount() - 1
+            for a, b in zip(tops.tolist(), bottoms.tolist()):
+                sel.select(self.model.index(a, 0), self.model.index(b, last_col))
+        self.view.selectionModel().select(sel, QItemSelectionModel.ClearAndSelect)
+        self._update_count()
+
+    def selected_positions(self) -> np.ndarray:
+        ranges = self.view.selectionModel().selection()
+        parts = [np.arange(r.top(), r.bottom() + 1) for r in ranges]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
     def _select_all(self):
-        for i in range(self.listw.count()):
-            self.listw.item(i).setCheckState(Qt.Checked)
+        self._select_positions(np.arange(self.model.rowCount()))
 
     def _clear_all(self):
-        for i in range(self.listw.count()):
-            self.listw.item(i).setCheckState(Qt.Unchecked)
+        self._select_positions(np.zeros(0, dtype=np.int64))
+
+    def _select_ranges(self):
+        try:
+            ranges = parse_pair_ranges(self.edit_range.text())
+        except ValueError:
+            QMessageBox.warning(self, "Khoảng không hợp lệ", "Nhập dạng: 10-200, 350")
+            return
+        pair_no = self._table["pair_no"].to_numpy()[self.model.rows]
+        hit = np.zeros(len(pair_no), dtype=bool)
+        for lo, hi in ranges:
+            hit |= (pair_no >= lo) & (pair_no <= hi)
+        self._select_positions(np.flatnonzero(hit))
+
+    def _update_count(self, *_):
+        n_sel = len(self.selected_positions())
+        self.lbl_count.setText(f"Đã chọn {n_sel} / {self.model.rowCount()} cụm đang hiện "
+                               f"(tổng {len(self._table)})")
 
     def _accept(self):
-        sel = []
-        for i in range(self.listw.count()):
-            if self.listw.item(i).checkState() == Qt.Checked:
-                sel.append(i)
-        self.selected_indices = sel
+        self.selected_indices = self.model.rows[self.selected_positions()].tolist()
         self.accept()
 
+def pick_segments(segments: SegmentStore, parent=None, title: str = "Chọn cụm ppa để vẽ",
+                  checked: Optional[Sequence[int]] = None,
+                  summary: Optional[pd.DataFrame] = None) -> Optional[List[int]]:
+    """Hộp thoại chọn cụm -> danh sách index đã chọn ; Cancel -> None."""
+    dlg = SegmentPickerDialog(segments, parent=parent, title=title, checked=checked, summary=summary)
+    if dlg.exec() != QDialog.Accepted:
+        return None  # người dùng bấm Cancel
+    return dlg.selected_indices
+
+# ========== Điểm vẽ của các cụm đã chọn ==========
+def pair_tooltip(segments: SegmentStore, rows: np.ndarray) -> Callable[[int], str]:
+    """tip(i) cho điểm i của chuỗi nan_joined (rows); chữ chỉ dựng cho điểm đang hover."""
+    pair_of = np.searchsorted(segments.offsets, rows, side="right") - 1
+
+    def _tip(i):
+        r = int(rows[i])
+        ev = segments.event_labels(slice(r, r + 1))[0]
+        t = pd.Timestamp(int(segments.t_ns[r]))
+        return (f"Pair {int(pair_of[i])} · {ev}\n"
+                f"Thời điểm: {t.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"MW: {float(segments.mw[r]):.2f}")
+    return _tip
+
+def cut_points(segments: SegmentStore, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(thời điểm datetime64, MW) các điểm bị lệnh sau đè (cut_by_overwrite) trong rows."""
+    r_sel = rows[rows >= 0]
+    r_cut = r_sel[segments.event[r_sel] == EVENT_CODES["cut_by_overwrite"]]
+    return segments.t_ns[r_cut].view("datetime64[ns]"), segments.mw[r_cut]
+
 # ========== Vẽ nhiều cụm (có chọn) ==========
 def draw_ppa(segments_or_result, title: str, parent=None,
              indices=None,
@@ -91,37 +245,46 @@ def draw_ppa(segments_or_result, title: str, parent=None,
 
     """
     Vẽ ppa nhiều cụm với lựa chọn:
-      - segments_or_result: list[pd.DataFrame] hoặc (segments, summary)
+      - segments_or_result: SegmentStore, list[pd.DataFrame] hoặc (segments, summary)
       - indices: danh sách index cụm muốn vẽ. Nếu None -> bật hộp thoại chọn.
-      - show_hold_lines: vẽ vạch dọc tại hold_start / hold_end (nếu có).
+      - show_cut_lines: vẽ vạch dọc + dấu x tại điểm bị lệnh sau đè (cut_by_overwrite).
       - return_fig_ax: nếu True trả về (fig, ax) thay vì chỉ plt.show().
 
     Mỗi segment (DF) kỳ vọng cột: ["Event", "MW", "Thời điểm"] với các event:
     start / hold_start? / hold_end? / finish.
     """
-    # Chuẩn hoá segments
+    # Chuẩn hoá segments -> SegmentStore (list cũ được chuẩn hóa 1 lần)
+    summary = None
     if isinstance(segments_or_result, tuple):
-        segments = segments_or_result[0] or []
+        segments = segments_or_result[0]
+        summary = segments_or_result[1] if len(segments_or_result) > 1 else None
     else:
-        segments = segments_or_result or []
+        segments = segments_or_result
+    segments = SegmentStore.from_frames(segments)
 
-    if not segments or all(s is None or getattr(s, "empty", True) for s in segments):
+    if not segments or len(segments.t_ns) == 0:
         if parent:
             QMessageBox.warning(parent, "Chưa có dữ liệu", f"{title} đang rỗng.")
         return None
 
     # Nếu không truyền indices -> bật hộp thoại chọn
     if indices is None:
-        dlg = SegmentPickerDialog(segments, parent=parent, title="Chọn cụm ppa để vẽ")
-        if dlg.exec() != QDialog.Accepted:
+        indices = pick_segments(segments, parent=parent, summary=summary)
+        if indices is None:
             return None  # người dùng bấm Cancel
-        indices = dlg.selected_indices
 
     if not indices:
         if parent:
             QMessageBox.information(parent, "Thông báo", "Chưa chọn cụm nào để vẽ.")
         return None
 
+    # Các cụm đã chọn -> 1 đường ngắt NaN, vẽ theo mức chi tiết (plot_lod)
+    t_all, mw_all, rows = nan_joined(segments, indices)
+    if not len(t_all):
+        if parent:
+            QMessageBox.information(parent, "Thông báo", "Các cụm đã chọn không có điểm để vẽ.")
+        return None
+
     # Vẽ
     fig, ax = plt.subplots(figsize=(10, 5))
     ax.set_title(title)
@@ -129,59 +292,17 @@ def draw_ppa(segments_or_result, title: str, parent=None,
     ax.set_ylabel("MW")
     ax.grid(True, alpha=0.3)
 
-    xs_all, ys_all, tips_all = [], [], []
+    lod = LodLine(ax, t_all, mw_all, tip=pair_tooltip(segments, rows), linewidth=1.5, label=title)
 
-    for i in indices:
-        if i < 0 or i >= len(segments):
-            continue
-        seg = segments[i]
-        if seg is None or getattr(seg, "empty", True):
-            continue
-        seg = _normalize_segment(seg)
+    if show_cut_lines:
+        t_cut, mw_cut = cut_points(segments, rows)
+        if len(t_cut):
+            # vạch đứng nét đứt tại điểm bị đè + marker x (1 collection cho mọi điểm cắt)
+            ax.vlines(t_cut, 0, 1, transform=ax.get_xaxis_transform(), linestyles="--", alpha=0.6)
+            ax.scatter(t_cut, mw_cut, marker="x", s=40)
 
-        # Hướng
-        try:
-            s = float(seg.loc[seg["Event"] == "start", "MW"].iloc[0])
-        except Exception:
-            s = float(seg["MW"].iloc[0])
-        try:
-            f = float(seg.loc[seg["Event"] == "finish", "MW"].iloc[-1])
-        except Exception:
-            f = float(seg["MW"].iloc[-1])
-
-        direction = "Up" if f > s else ("Down" if f < s else "Flat")
-        ax.plot(seg["Thời điểm"], seg["MW"], marker="o", linewidth=1.5, label=f"Pair {i} · {direction}")
-
-        if show_cut_lines:
-            cut_times = pd.to_datetime(seg.loc[seg["Event"] == "cut_by_overwrite", "Thời điểm"], errors="coerce").dropna()
-            for tcut in cut_times:
-                ax.axvline(tcut, linestyle="--", alpha=0.6)    # vạch đứng nét đứt tại điểm bị đè
-                # (tuỳ chọn) đánh dấu thêm marker cho dễ thấy:
-                ax.scatter([tcut], [seg.loc[seg["Thời điểm"] == tcut, "MW"].astype(float).iloc[0]],
-                        marker="x", s=40)
-
-        # Tooltip từng điểm
-        for _, r in seg.iterrows():
-            xs_all.append(pd.to_datetime(r["Thời điểm"]))
-            ys_all.append(float(r["MW"]))
-            ev = str(r.get("Event", "point"))
-            tips_all.append(
-                f"Pair {i} · {ev}\n"
-                f"Thời điểm: {pd.to_datetime(r['Thời điểm']).strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"MW: {float(r['MW']):.2f}"
-            )
-
-    # Scatter ẩn để cursor chỉ bám vào điểm
-    pts = ax.scatter(xs_all, ys_all, s=1, alpha=0)
-    cursor = mplcursors.cursor(pts, hover=True)
-
-    @cursor.connect("add")
-    def _on_add(sel):
-        idx = sel.index
-        sel.annotation.set_text(tips_all[idx])
-        sel.annotation.get_bbox_patch().set(fc="white", alpha=0.9)
-
-    fig._cursor = cursor
+    fig._cursor = lod.cursor
+    fig._lod = lod
     #ax.legend() #bảng chú thích
     fig.tight_layout()
 
@@ -198,11 +319,11 @@ def draw_ppa_df(df, title: str, parent=None):
       - list[pd.DataFrame]  -> vẽ nhiều cụm (mở hộp thoại chọn)
       - (segments, summary) -> vẽ nhiều cụm (mở hộp thoại chọn)
     """
-    # Nếu là tuple/list -> giao cho draw_ppa (cho phép chọn cụm)
+    # Nếu là tuple/list/store -> giao cho draw_ppa (cho phép chọn cụm)
     if isinstance(df, tuple):
-        segments = df[0] or []
-        return draw_ppa(segments, title=title, parent=parent, indices=None)
-    if isinstance(df, list):
+        segments = df[0] if df[0] is not None else []
+        return draw_ppa((segments,) + tuple(df[1:2]), title=title, parent=parent, indices=None)
+    if isinstance(df, (list, SegmentStore)):
         return draw_ppa(df, title=title, parent=parent, indices=None)
 
     # Còn lại: 1 DataFrame (hành vi cũ)
@@ -210,4 +331,4 @@ def draw_ppa_df(df, title: str, parent=None):
         if parent:
             QMessageBox.warning(parent, "Chưa có dữ liệu", f"{title} đang rỗng.")
         return
-    return draw_ppa([df], title=title, parent=parent, indices=[0], show_hold_lines=True, return_fig_ax=False)
+    return draw_ppa([df], title=title, parent=parent, indices=[0], return_fig_ax=False)
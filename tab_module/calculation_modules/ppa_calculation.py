@@ -1,6 +1,9 @@
 # ppa_calculation.py
 import pandas as pd
 from datetime import timedelta
+from functools import lru_cache
+from tab_module.calculation_modules.segment_store import SegmentStore, as_datetime64
+from tab_module.calculation_modules.ramp_profile import RampProfile, build_profile_per_pair
 
 
 def build_ppa_per_pair(
@@ -10,10 +13,55 @@ def build_ppa_per_pair(
     snap_tolerance_sec: int = 0,          # (không còn dùng cho cut, giữ lại để tương thích chữ ký)
     flag_col: str = "Dừng lệnh",          # (không còn ảnh hưởng đến cut)
     make_gap_pairs: bool = True,          # Bật khâu nối gap (chỉ có ý nghĩa nếu finish_t < t_next)
-    gap_min_sec: int = 1                  # Ngưỡng tối thiểu tạo gap pair
+    gap_min_sec: int = 1,                 # Ngưỡng tối thiểu tạo gap pair
+    engine: str = "numpy",                # "numpy" (vector hóa) | "loop" (bản tham chiếu từng cặp)
 ):
     """
     Tính danh sách các segment (start/hold/finish/...) cho từng cặp lệnh kế tiếp.
+
+    engine:
+      - "numpy": engine chung ramp_profile với ppa_profile(): tính ramp/hold/finish/
+                 universal cut cho TẤT CẢ các cặp cùng lúc trên mảng int64 (ns) /
+                 float64 (MW). Kết quả trùng khớp bản "loop".
+      - "loop" : bản tham chiếu duyệt từng cặp (giữ lại để đối chiếu).
+
+    Returns:
+      - segments: SegmentStore (bảng cột; vẫn dùng được như List[pd.DataFrame])
+      - summary : pd.DataFrame tóm tắt cho từng cặp
+    """
+    if engine == "loop":
+        segments, summary = _build_ppa_per_pair_loop(
+            df_step,
+            hold_up_at_330_sec=hold_up_at_330_sec,
+            hold_down_at_462_sec=hold_down_at_462_sec,
+            snap_tolerance_sec=snap_tolerance_sec,
+            flag_col=flag_col,
+            make_gap_pairs=make_gap_pairs,
+            gap_min_sec=gap_min_sec,
+        )
+        return SegmentStore.from_frames(segments), summary
+    if engine != "numpy":
+        raise ValueError("engine phải là 'numpy' hoặc 'loop'")
+    return build_profile_per_pair(
+        df_step,
+        ppa_profile(int(hold_up_at_330_sec), int(hold_down_at_462_sec)),
+        make_gap_pairs=make_gap_pairs,
+        gap_min_sec=gap_min_sec,
+    )
+
+
+def _build_ppa_per_pair_loop(
+    df_step: pd.DataFrame,
+    hold_up_at_330_sec: int = 30 * 60,
+    hold_down_at_462_sec: int = 30 * 60,
+    snap_tolerance_sec: int = 0,
+    flag_col: str = "Dừng lệnh",
+    make_gap_pairs: bool = True,
+    gap_min_sec: int = 1
+):
+    """
+    BẢN THAM CHIẾU (duyệt từng cặp).
+    Tính danh sách các segment (start/hold/finish/...) cho từng cặp lệnh kế tiếp.
     Triết lý mới: UNIVERSAL CUT -> hễ có lệnh kế tiếp (mốc t_next) xuất hiện TRƯỚC thời điểm finish_t
     thì dừng cặp hiện tại NGAY TẠI t_next (cắt đuôi), bất kể flag TRUE/FALSE.
 
@@ -33,7 +81,7 @@ def build_ppa_per_pair(
 
     # Chuẩn hóa kiểu dữ liệu
     df["MW"] = pd.to_numeric(df["MW"], errors="coerce")
-    df["Thời điểm"] = pd.to_datetime(df["Thời điểm"], errors="coerce")
+    df["Thời điểm"] = as_datetime64(df["Thời điểm"])
 
     # Chuẩn hóa cờ (để giữ tương thích, nhưng không ảnh hưởng đến cut)
     def _to_bool(x):
@@ -50,7 +98,7 @@ def build_ppa_per_pair(
     else:
         df["_FLAG_TRUE"] = False
 
-    df = df.dropna(subset=["MW", "Thời điểm"]).sort_values("Thời điểm").reset_index(drop=True)
+    df = df.dropna(subset=["MW", "Thời điểm"]).sort_values("Thời điểm", kind="stable").reset_index(drop=True)
     if len(df) < 2:
         return [], pd.DataFrame()
 
@@ -305,3 +353,22 @@ def build_ppa_per_pair(
 
     summary = pd.DataFrame(summary_rows)
     return segments, summary
+
+
+
+# ===================== Profile PPA (engine chung ramp_profile) =====================
+@lru_cache(maxsize=None)
+def ppa_profile(hold_up_at_330_sec: int = 30 * 60, hold_down_at_462_sec: int = 30 * 60) -> RampProfile:
+    """
+    PPA 330/462:
+      - Lên : 0.11 MW/s dưới 330, 0.22 từ 330; băng 330 -> hold_up_at_330_sec
+      - Xuống: 0.22 MW/s; băng 462 -> hold_down_at_462_sec; 330 chỉ chia chặng
+    """
+    return RampProfile(
+        "PPA",
+        rate_bands=(330.0,),
+        up_rates=(0.11, 0.22),
+        down_rates=(0.22, 0.22),
+        up_stops=((330.0, hold_up_at_330_sec),),
+        down_stops=((462.0, hold_down_at_462_sec), (330.0, None)),
+    )
@@ -0,0 +1,152 @@
+# ppa_hourly.py
+import numpy as np
+import pandas as pd
+from typing import List, Union
+from tab_module.calculation_modules.segment_store import SegmentStore
+from tab_module.calculation_modules.ppa_minutely import ppa_segments_to_minutely, tick_pieces, GAP_POLICIES
+from tab_module.calculation_modules.export_utils import _freq_to_timedelta, minutely_to_hourly_avg
+
+HOUR_NS = 3_600 * 1_000_000_000
+
+
+def _ceil_div(a, b):
+    return -((-a) // b)
+
+
+def _run_edge_sum(a, b, base, slope, hours, dt_ns: int) -> np.ndarray:
+    """
+    Với mỗi cửa sổ [H, H+1H] (H trong hours): tổng MW tại 2 đầu của mọi đoạn tick
+    liên tục nằm trong cửa sổ (đoạn bị cửa sổ cắt -> đầu đoạn là tick biên cửa sổ).
+    Hình thang trên lưới đều: năng lượng = dt * (tổng tick - 1/2 * tổng này).
+    """
+    order = np.argsort(a, kind="stable")
+    a, b, base, slope = a[order], b[order], base[order], slope[order]
+    joined = b[:-1] + 1 == a[1:]               # 2 mảnh kề nhau -> cùng 1 đoạn
+    is_start = np.concatenate(([True], ~joined))
+    is_end = np.concatenate((~joined, [True]))
+    n = np.concatenate((a[is_start], b[is_end]))
+    w = np.concatenate((base[is_start], (base + slope * (b - a))[is_end]))
+    order = np.argsort(n, kind="stable")
+    n, cum = n[order], np.concatenate(([0.0], np.cumsum(w[order])))
+
+    def value_at(k):
+        i = np.maximum(np.searchsorted(a, k, side="right") - 1, 0)
+        inside = (a[i] <= k) & (k <= b[i])
+        return inside, np.where(inside, base[i] + slope[i] * (k - a[i]), 0.0)
+
+    f = _ceil_div(hours * HOUR_NS, dt_ns)      # tick đầu / cuối của cửa sổ
+    g = ((hours + 1) * HOUR_NS) // dt_ns
+    out = cum[np.searchsorted(n, g, side="right")] - cum[np.searchsorted(n, f, side="left")]
+    for k, outer in ((f, f - 1), (g, g + 1)):
+        inside, val = value_at(k)
+        out += np.where(inside & value_at(outer)[0], val, 0.0)
+    return out
+
+
+# ===================== Segments -> giờ (không dựng chuỗi phút) =====================
+def segments_to_hourly(
+    segments: Union[SegmentStore, List[pd.DataFrame]],
+    freq: str = "T",
+    drop_incomplete: bool = True,
+    return_energy: bool = False,
+    label: str = "left",
+    eps: float = 1e-6,
+    gap_policy: str = "none",
+) -> pd.DataFrame:
+    """
+    Tương đương minutely_to_hourly_avg(ppa_segments_to_minutely(segments, ...), ...)
+    nhưng tính thẳng từ breakpoint của segments: mỗi chặng là hàm tuyến tính trên
+    lưới tick nên tổng các tick trong 1 giờ có công thức đóng (cấp số cộng).
+    Bộ nhớ ~ số segment + số giờ, không phụ thuộc số phút.
+
+    Giữ nguyên quy ước hiện tại:
+      - cửa sổ giờ [left, right] gồm CẢ HAI biên, trung bình các tick trong cửa sổ
+        (return_energy=True: MWh hình thang giữa các tick liền kề trong cửa sổ)
+      - drop_incomplete: bỏ giờ có ít hơn 1H/freq + 1 tick
+      - label="left": nhãn đầu giờ ; label="right": nhãn cuối giờ
+      - gap_policy: "none"/"nan" không có tick trong gap ; "ffill"/"bridge_linear" có
+    Segments không theo thứ tự thời gian -> tự quay về đường phút.
+    """
+    if label not in ("left", "right"):
+        raise ValueError("label phải là 'left' hoặc 'right'")
+    col_val = "MWh" if return_energy else "MW"
+    empty = pd.DataFrame(columns=["Thời điểm", col_val])
+
+    dt = _freq_to_timedelta(freq)
+    if dt <= pd.Timedelta(0):
+        raise ValueError("freq không hợp lệ.")
+    gp = (gap_policy or "none").lower()
+    if gp not in GAP_POLICIES:
+        gp = "none"
+
+    store = SegmentStore.from_frames(segments)
+    # "nan": tick NaN trong gap bị bỏ khi tính giờ -> như "none"
+    pieces = tick_pieces(store, freq=freq, eps=eps, gap_policy="none" if gp == "nan" else gp, own_ticks=True)
+    if pieces is None:
+        minutely = ppa_segments_to_minutely(store, freq=freq, eps=eps, gap_policy=gp)
+        return minutely_to_hourly_avg(minutely, freq=freq, drop_incomplete=drop_incomplete,
+                                      return_energy=return_energy, label=label)
+    if len(pieces) == 0:
+        return empty
+    a, b = pieces.a, pieces.b
+    base = pieces.value(np.arange(len(pieces)), a)   # MW tại tick đầu mảnh
+    slope = pieces.slope()
+
+    # ---------- Cắt mảnh theo ranh giới giờ ----------
+    dt_ns = dt.value
+    ha, hb = (a * dt_ns) // HOUR_NS, (b * dt_ns) // HOUR_NS
+    n_frag = hb - ha + 1
+    src = np.repeat(np.arange(len(a)), n_frag)
+    h = ha[src] + (np.arange(len(src)) - np.repeat(np.cumsum(n_frag) - n_frag, n_frag))
+    p = np.maximum(a[src], _ceil_div(h * HOUR_NS, dt_ns))
+    q = np.minimum(b[src], _ceil_div((h + 1) * HOUR_NS, dt_ns) - 1)
+    keep = p <= q
+    src, h, p, q = src[keep], h[keep], p[keep], q[keep]
+
+    cnt = (q - p + 1).astype(float)
+    off = (p - a[src]).astype(float)
+    tick_sum = cnt * base[src] + slope[src] * (cnt * off + cnt * (cnt - 1) / 2)
+
+    # ---------- Gom theo giờ nửa mở [H, H+1) + tick đúng mốc H ----------
+    h0 = int(h.min()) - 1                    # chừa 1 ô trước cho label="right"
+    size = int(h.max()) - h0 + 2
+    idx = h - h0
+    cnt_h = np.bincount(idx, weights=cnt, minlength=size)
+    sum_h = np.bincount(idx, weights=tick_sum, minlength=size)
+    on_hour = p * dt_ns == h * HOUR_NS
+    b_cnt = np.zeros(size)
+    b_val = np.zeros(size)
+    b_cnt[idx[on_hour]] = 1.0
+    b_val[idx[on_hour]] = base[src[on_hour]] + slope[src[on_hour]] * off[on_hour]
+
+    # Giờ được duyệt giống pd.Grouper(freq="H", label, closed=label) (kể cả giờ rỗng)
+    t_first, t_last = int(p.min()) * dt_ns, int(q.max()) * dt_ns
+    if label == "left":
+        lo, hi = t_first // HOUR_NS, t_last // HOUR_NS
+    else:
+        lo, hi = _ceil_div(t_first, HOUR_NS) - 1, _ceil_div(t_last, HOUR_NS) - 1
+    left = np.arange(lo - h0, hi - h0 + 1)
+
+    # Cửa sổ [left, left+1H] = giờ nửa mở của left + tick đúng mốc left+1H
+    n_win = cnt_h[left] + b_cnt[left + 1]
+    s_win = sum_h[left] + b_val[left + 1]
+    keep = n_win > 0
+    if drop_incomplete:
+        expected_ticks = int(pd.Timedelta("1H") / dt) + 1
+        keep &= n_win >= expected_ticks
+    if not keep.any():
+        return empty
+
+    win = left[keep] + h0
+    if return_energy:
+        edges = _run_edge_sum(a, b, base, slope, win, dt_ns)
+        values = (dt_ns / HOUR_NS) * (s_win[keep] - 0.5 * edges)
+    else:
+        values = s_win[keep] / n_win[keep]
+
+    hours = win + (1 if label == "right" else 0)
+    out = pd.DataFrame({
+        "Thời điểm": (hours * HOUR_NS).view("datetime64[ns]"),
+        col_val: values,
+    })
+    return out
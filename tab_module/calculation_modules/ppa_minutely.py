@@ -1,11 +1,170 @@
 # ppa_minutely.py
-import math
+import numpy as np
 import pandas as pd
-from typing import List, Optional, Tuple
+from typing import List, Optional, Union
+from tab_module.calculation_modules.segment_store import SegmentStore
+from tab_module.calculation_modules.ramp_profile import total_seconds
+from tab_module.calculation_modules.export_utils import _freq_to_timedelta
 
+GAP_POLICIES = ("none", "nan", "ffill", "bridge_linear")
+
+
+def _ceil_div(a, b):
+    return -((-a) // b)
+
+
+# ===================== Mảnh tick (dùng chung cho phút và giờ) =====================
+class TickPieces:
+    """
+    Chuỗi tick của các segments, mô tả theo MẢNH trên lưới tick n (thời điểm = n * dt_ns).
+    Mảnh k phủ tick a[k]..b[k]; giá trị tại tick n đúng như _interp_segment bản loop:
+        frac = total_seconds(n*dt - t_ref) / dur  (kẹp [0, 1])
+        MW   = m0 + (m1 - m0) * frac              (mảnh phẳng: m1 = m0)
+      - pid  : segment (index trong store) sở hữu tick (gap: segment phía trước)
+      - rank : thứ tự dòng gốc (segment theo index, rồi tới gap) -> dòng sau thắng khi trùng tick
+    """
+
+    __slots__ = ("dt_ns", "pid", "rank", "a", "b", "t_ref", "m0", "m1", "dur")
+
+    def __init__(self, dt_ns, pid, rank, a, b, t_ref, m0, m1, dur):
+        self.dt_ns = int(dt_ns)
+        self.pid = np.asarray(pid, dtype=np.int64)
+        self.rank = np.asarray(rank, dtype=np.int64)
+        self.a = np.asarray(a, dtype=np.int64)
+        self.b = np.asarray(b, dtype=np.int64)
+        self.t_ref = np.asarray(t_ref, dtype=np.int64)
+        self.m0 = np.asarray(m0, dtype=float)
+        self.m1 = np.asarray(m1, dtype=float)
+        self.dur = np.asarray(dur, dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.a)
+
+    def take(self, idx) -> "TickPieces":
+        return TickPieces(self.dt_ns, *(getattr(self, f)[idx] for f in self.__slots__[1:]))
+
+    def value(self, k, n) -> np.ndarray:
+        """MW tại tick n của mảnh k (vector)."""
+        frac = total_seconds(n * self.dt_ns - self.t_ref[k]) / self.dur[k]
+        frac = np.clip(frac, 0.0, 1.0)
+        m0 = self.m0[k]
+        return m0 + (self.m1[k] - m0) * frac
+
+    def slope(self) -> np.ndarray:
+        """Độ dốc MW/tick của từng mảnh (mảnh phẳng = 0)."""
+        return (self.m1 - self.m0) * (self.dt_ns / 1e9) / self.dur
+
+    def expand(self):
+        """Trải mọi tick: (k mảnh, n tick) theo thứ tự mảnh."""
+        lens = self.b - self.a + 1
+        k = np.repeat(np.arange(len(lens)), lens)
+        n = np.arange(len(k), dtype=np.int64) - np.repeat(np.cumsum(lens) - lens, lens)
+        n += self.a[k]
+        return k, n
+
+
+def tick_pieces(segments: Union[SegmentStore, List[pd.DataFrame]],
+                freq: str = "T",
+                eps: float = 1e-6,
+                gap_policy: str = "none",
+                own_ticks: bool = False) -> Optional[TickPieces]:
+    """
+    Tách segments (>= 2 mốc) thành các mảnh tick theo đúng quy tắc biên của bản loop:
+      - tick NẰM TRONG chặng (t_r < tick < t_{r+1}): HOLD (|ΔMW| <= eps) giữ m_r, RAMP nội suy
+      - tick TRÙNG mốc event: lấy cuối chặng kết thúc tại mốc đó (đầu segment: chặng 0)
+      - gap giữa 2 segment liên tiếp (t_end < t_start_next, không tính 2 biên):
+        "nan" -> NaN, "ffill" -> MW cuối segment trước, "bridge_linear" -> nội suy; "none" -> không có
+    own_ticks=True: cắt sẵn tick chung cho segment sau (mảnh rời nhau); chỉ làm được khi
+    segments theo thứ tự thời gian, ngược lại trả về None.
+    """
+    dt = _freq_to_timedelta(freq)
+    if dt <= pd.Timedelta(0):
+        raise ValueError("freq không hợp lệ.")
+    dt_ns = int(dt.value)
+    store = SegmentStore.from_frames(segments)
+    lens = store.lengths
+    seg_ok = np.flatnonzero(lens >= 2)
+    if len(seg_ok) == 0:
+        z = np.zeros(0)
+        return TickPieces(dt_ns, z, z, z, z, z, z, z, z)
+
+    t, mw, pid = store.t_ns, store.mw, store.pair_id
+    first_r, last_r = store.offsets[seg_ok], store.offsets[seg_ok + 1] - 1
+    t0, t1 = t[first_r], t[last_r]
+    pos = np.full(store.n_segments, -1, dtype=np.int64)
+    pos[seg_ok] = np.arange(len(seg_ok))
+    row_ok = lens[pid] >= 2
+    row_pos = np.maximum(pos[pid], 0)
+
+    if own_ticks:
+        if np.any(np.diff(t0) < 0) or np.any(np.diff(t1) < 0):
+            return None
+        n_hi = t1 // dt_ns
+        n_hi[:-1] = np.minimum(n_hi[:-1], _ceil_div(t0[1:], dt_ns) - 1)
+        hi_row = n_hi[row_pos]
+    else:
+        hi_row = np.full(len(t), np.iinfo(np.int64).max)
+
+    parts = []
+
+    def _add(r_pid, rank, a, b, t_ref, m0, m1, dur):
+        keep = a <= b
+        parts.append(tuple(np.asarray(x)[keep] for x in (r_pid, rank, a, b, t_ref, m0, m1, dur)))
+
+    # --- Tick nằm TRONG một chặng ---
+    r = np.flatnonzero((pid[:-1] == pid[1:]) & row_ok[:-1] & (t[:-1] < t[1:]))
+    m0, m1 = mw[r], mw[r + 1]
+    dur = total_seconds(t[r + 1] - t[r])
+    ramp = (np.abs(m1 - m0) > eps) & (dur > 0)
+    flat_mw = np.where(dur > 0, m0, m1)
+    _add(pid[r], row_pos[r], t[r] // dt_ns + 1, np.minimum(_ceil_div(t[r + 1], dt_ns) - 1, hi_row[r]),
+         t[r], np.where(ramp, m0, flat_mw), np.where(ramp, m1, flat_mw), np.where(ramp, dur, 1.0))
+
+    # --- Tick trùng đúng mốc event (dòng đầu của nhóm cùng thời điểm) ---
+    seg_head = np.ones(len(t), dtype=bool)
+    seg_head[1:] = pid[1:] != pid[:-1]
+    new_time = np.ones(len(t), dtype=bool)
+    new_time[1:] = t[1:] != t[:-1]
+    r = np.flatnonzero(row_ok & (t % dt_ns == 0) & (seg_head | new_time))
+    n = t[r] // dt_ns
+    head = seg_head[r]
+    nxt = np.minimum(r + 1, len(t) - 1)
+    prv = np.maximum(r - 1, 0)
+    # đầu segment: chặng 0 tại frac=0 (2 mốc đầu trùng giờ -> MW mốc thứ 2)
+    v_head = np.where(t[nxt] == t[r], mw[nxt], mw[r])
+    # giữa segment: cuối chặng (r-1, r) -> frac = 1 (HOLD hoặc dur = 0 -> MW mốc r)
+    dur = total_seconds(t[r] - t[prv])
+    ramp = ~head & (np.abs(mw[r] - mw[prv]) > eps) & (dur > 0)
+    flat_mw = np.where(head, v_head, mw[r])
+    _add(pid[r], row_pos[r], n, np.minimum(n, hi_row[r]),
+         np.where(ramp, t[prv], t[r]), np.where(ramp, mw[prv], flat_mw),
+         np.where(ramp, mw[r], flat_mw), np.where(ramp, dur, 1.0))
+
+    # --- Gap giữa 2 segment liên tiếp ---
+    gp = (gap_policy or "none").lower()
+    if gp in ("nan", "ffill", "bridge_linear") and len(seg_ok) > 1:
+        k = np.flatnonzero(t1[:-1] < t0[1:])
+        t_l, t_r = t1[k], t0[k + 1]
+        m_l, m_r = mw[last_r[k]], mw[first_r[k + 1]]
+        dur = total_seconds(t_r - t_l)
+        if gp == "nan":
+            m_l = m_r = np.full(len(k), np.nan)
+            dur = np.ones(len(k))
+        else:
+            bridge = (gp == "bridge_linear") & (dur > 0)
+            m_r = np.where(bridge, m_r, m_l)
+            dur = np.where(bridge, dur, 1.0)
+        _add(seg_ok[k], len(seg_ok) + k, t_l // dt_ns + 1, _ceil_div(t_r, dt_ns) - 1,
+             t_l, m_l, m_r, dur)
+
+    cols = [np.concatenate([p[i] for p in parts]) for i in range(8)]
+    return TickPieces(dt_ns, *cols)
+
+
+# ===================== Segments -> chuỗi phút =====================
 def ppa_segments_to_minutely(
-    segments: List[pd.DataFrame],
-    freq: str = "T",                   # "T" = 1 phút; ví dụ "30S", "5T"...
+    segments: Union[SegmentStore, List[pd.DataFrame]],
+    freq: str = "T",                   # "T" = 1 phút; ví dụ "30S", "5T", "S"...
     include_pair_idx: bool = False,    # gắn pair_idx cho từng mốc phút
     include_edge_minutes: bool = True, # thêm mốc phút trùng EXACT với event trong segment
     eps: float = 1e-6,                 # nhận diện flat: |m1 - m0| <= eps
@@ -13,6 +172,8 @@ def ppa_segments_to_minutely(
 ) -> pd.DataFrame:
     """
     Chuyển các segments (đã CUT/SNAP) thành chuỗi phút theo tần suất 'freq'.
+    'segments' là SegmentStore (đầu ra gốc của build_*_per_pair, đã chuẩn hóa sẵn)
+    hoặc List[pd.DataFrame] kiểu cũ (được chuẩn hóa 1 lần qua SegmentStore.from_frames).
 
     NGUYÊN TẮC CHÍNH (NO-BRIDGE):
       - Bên trong MỖI segment:
@@ -29,167 +190,50 @@ def ppa_segments_to_minutely(
       - Nếu hai segment CHẠM BIÊN (t_end == t_start_next) → không có gap.
       - Nếu một mốc event trùng phút, tick ở biên sẽ thuộc segment tương ứng,
         không để gap lấn vào (đã xử lý biên trái/phải cho an toàn).
-    """
-    # ---------- Helpers ----------
-    def _floor_tick(ts: pd.Timestamp, f: str) -> pd.Timestamp:
-        return pd.to_datetime(ts).floor(f)
-
-    def _ceil_tick(ts: pd.Timestamp, f: str) -> pd.Timestamp:
-        ts = pd.to_datetime(ts)
-        fl = ts.floor(f)
-        return ts if fl == ts else fl + pd.tseries.frequencies.to_offset(f)
+      - Trùng tick giữa 2 segment: dòng sau (segment sau, rồi tới gap) thắng.
+      - Mốc event trùng phút luôn nằm sẵn trên lưới tick của segment, nên
+        include_edge_minutes chỉ giữ lại cho tương thích.
 
-    def _freq_offset(f: str):
-        return pd.tseries.frequencies.to_offset(f)
-
-    def _normalize_segment(seg: pd.DataFrame) -> Optional[pd.DataFrame]:
-        if seg is None or getattr(seg, "empty", True):
-            return None
-        s = seg.copy()
-        s["Thời điểm"] = pd.to_datetime(s["Thời điểm"], errors="coerce")
-        s["MW"] = pd.to_numeric(s["MW"], errors="coerce")
-        s = s.dropna(subset=["Thời điểm", "MW"]).sort_values("Thời điểm").reset_index(drop=True)
-        return s if len(s) >= 2 else None
-
-    def _interp_segment(times: List[pd.Timestamp], mws: List[float], ticks: List[pd.Timestamp]) -> List[Tuple[pd.Timestamp, float]]:
-        """Nội suy ticks CHỈ dựa vào timeline của 1 segment."""
-        out = []
-        if len(times) < 2 or not ticks:
-            return out
-        k = 0
-        for tick in ticks:
-            while k + 1 < len(times) and tick > times[k+1]:
-                k += 1
-            if k + 1 >= len(times):
-                break
-            t0, t1 = times[k], times[k+1]
-            m0, m1 = mws[k],  mws[k+1]
-            if tick < t0:
-                val = m0
-            else:
-                dur = (t1 - t0).total_seconds()
-                if dur <= 0:
-                    val = m1
-                elif abs(m1 - m0) <= eps:     # HOLD phẳng
-                    val = m0 if tick < t1 else m1
-                else:                          # RAMP tuyến tính
-                    frac = (tick - t0).total_seconds() / dur
-                    if frac < 0: frac = 0.0
-                    if frac > 1: frac = 1.0
-                    val = m0 + (m1 - m0) * frac
-            out.append((tick, float(val)))
-        return out
-
-    def _gap_ticks(t_end: pd.Timestamp, t_start_next: pd.Timestamp, f: str) -> List[pd.Timestamp]:
-        """Sinh ticks trong gap (loại trừ chồng biên với 2 segment)."""
-        off = _freq_offset(f)
-        # Bên trái: nếu t_end trùng phút → bắt đầu từ t_end + off
-        left = _ceil_tick(t_end, f)
-        if _floor_tick(t_end, f) == t_end:
-            left = t_end + off
-        # Bên phải: nếu t_start_next trùng phút → kết thúc ở t_start_next - off
-        right = _floor_tick(t_start_next, f)
-        if _floor_tick(t_start_next, f) == t_start_next:
-            right = t_start_next - off
-        if right < left:
-            return []
-        return list(pd.date_range(start=left, end=right, freq=f))
-
-    # ---------- Chuẩn hóa toàn bộ segments ----------
-    norm = []
-    for i, seg in enumerate(segments):
-        s = _normalize_segment(seg)
-        if s is None:
-            continue
-        t0, t1 = s["Thời điểm"].iloc[0], s["Thời điểm"].iloc[-1]
-        norm.append((i, s, t0, t1))
-
-    if not norm:
-        cols = ["pair_idx", "Thời điểm", "MW"] if include_pair_idx else ["Thời điểm", "MW"]
-        return pd.DataFrame(columns=cols)
-
-    # Bảo toàn thứ tự input (pair_idx tăng dần)
-    rows: List[Tuple] = []
-
-    # ---------- Lấy mẫu phút TRONG từng segment ----------
-    for i, s, t0, t1 in norm:
-        start_tick = _ceil_tick(t0, freq)
-        end_tick   = _floor_tick(t1, freq)
-        ticks = list(pd.date_range(start=start_tick, end=end_tick, freq=freq)) if end_tick >= start_tick else []
-
-        if include_edge_minutes:
-            # chỉ thêm các event trùng EXACT mốc phút, và phải nằm trong phạm vi segment
-            edges = [t for t in s["Thời điểm"].tolist() if _floor_tick(t, freq) == t and t0 <= t <= t1]
-            ticks = sorted(set(ticks + edges))
-
-        times = s["Thời điểm"].tolist()
-        mws   = s["MW"].astype(float).tolist()
-        interp = _interp_segment(times, mws, ticks)
-
-        if include_pair_idx:
-            rows += [(i, t, v) for (t, v) in interp]
-        else:
-            rows += [(t, v) for (t, v) in interp]
-
-    # ---------- Xử lý GAP giữa các segment (tùy chọn) ----------
+    Tính trên mảng int64-ns: sinh toàn bộ tick của mọi segment trong 1 lượt
+    (TickPieces.expand) rồi nội suy vector, không dùng Timestamp / date_range từng segment.
+    """
+    cols = ["pair_idx", "Thời điểm", "MW"] if include_pair_idx else ["Thời điểm", "MW"]
     gp = (gap_policy or "none").lower()
-    if gp not in {"none", "nan", "ffill", "bridge_linear"}:
+    if gp not in GAP_POLICIES:
         gp = "none"
 
-    if gp != "none":
-        for k in range(len(norm) - 1):
-            i, s_i, t0_i, t1_i = norm[k]
-            j, s_j, t0_j, t1_j = norm[k+1]
-            # Chỉ là gap khi t1_i < t0_j
-            if not (t1_i < t0_j):
-                continue
-
-            ticks_gap = _gap_ticks(t1_i, t0_j, freq)
-            if not ticks_gap:
-                continue
-
-            if gp == "nan":
-                if include_pair_idx:
-                    rows += [(i, t, math.nan) for t in ticks_gap]
-                else:
-                    rows += [(t, math.nan) for t in ticks_gap]
-
-            elif gp == "ffill":
-                mw_last = float(s_i["MW"].iloc[-1])
-                if include_pair_idx:
-                    rows += [(i, t, mw_last) for t in ticks_gap]
-                else:
-                    rows += [(t, mw_last) for t in ticks_gap]
-
-            elif gp == "bridge_linear":
-                tL, mL = s_i["Thời điểm"].iloc[-1], float(s_i["MW"].iloc[-1])
-                tR, mR = s_j["Thời điểm"].iloc[0],  float(s_j["MW"].iloc[0])
-                dur = (tR - tL).total_seconds()
-                for t in ticks_gap:
-                    if dur <= 0:
-                        val = mL
-                    else:
-                        frac = (t - tL).total_seconds() / dur
-                        if frac < 0: frac = 0.0
-                        if frac > 1: frac = 1.0
-                        val = mL + (mR - mL) * frac
-                    if include_pair_idx:
-                        rows.append((i, t, float(val)))  # gán về pair trước theo quy ước cũ
-                    else:
-                        rows.append((t, float(val)))
-
-    # ---------- Trả kết quả ----------
-    cols = ["pair_idx", "Thời điểm", "MW"] if include_pair_idx else ["Thời điểm", "MW"]
-    out = pd.DataFrame(rows, columns=cols)
-    if out.empty:
-        return out
+    pieces = tick_pieces(segments, freq=freq, eps=eps, gap_policy=gp)
+    if len(pieces) == 0:
+        return pd.DataFrame(columns=cols)
 
+    # Thứ tự dòng gốc: theo (pair_idx nếu cần,) rank, rồi tick tăng dần trong mảnh
     if include_pair_idx:
-        out = (out.sort_values(["pair_idx", "Thời điểm"])
-                 .drop_duplicates(subset=["pair_idx", "Thời điểm"], keep="last")
-                 .reset_index(drop=True))
+        pieces = pieces.take(np.lexsort((pieces.a, pieces.rank, pieces.pid)))
     else:
-        out = (out.sort_values("Thời điểm")
-                 .drop_duplicates(subset=["Thời điểm"], keep="last")
-                 .reset_index(drop=True))
-    return out
+        pieces = pieces.take(np.lexsort((pieces.a, pieces.rank)))
+    k, n = pieces.expand()
+
+    # Sort ổn định theo (pair_idx,) thời điểm rồi giữ dòng CUỐI của mỗi tick trùng
+    if include_pair_idx:
+        pid = pieces.pid[k]
+        d_pid, d_n = np.diff(pid), np.diff(n)
+        if np.any((d_pid < 0) | ((d_pid == 0) & (d_n < 0))):
+            order = np.lexsort((n, pid))
+            k, n, pid = k[order], n[order], pid[order]
+        last = np.ones(len(n), dtype=bool)
+        last[:-1] = (pid[1:] != pid[:-1]) | (n[1:] != n[:-1])
+        k, n, pid = k[last], n[last], pid[last]
+    else:
+        if np.any(np.diff(n) < 0):
+            order = np.argsort(n, kind="stable")
+            k, n = k[order], n[order]
+        last = np.ones(len(n), dtype=bool)
+        last[:-1] = n[1:] != n[:-1]
+        k, n = k[last], n[last]
+
+    out = {}
+    if include_pair_idx:
+        out["pair_idx"] = pid
+    out["Thời điểm"] = (n * pieces.dt_ns).view("datetime64[ns]")
+    out["MW"] = pieces.value(k, n)
+    return pd.DataFrame(out, columns=cols)
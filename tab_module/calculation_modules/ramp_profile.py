@@ -0,0 +1,418 @@
+# ramp_profile.py
+import numpy as np
+import pandas as pd
+from typing import Optional, Sequence, Tuple
+from tab_module.calculation_modules.segment_store import (
+    SegmentStore, EV_START, EV_HOLD_START, EV_HOLD_END, EV_FINISH, EV_CUT, as_datetime64,
+)
+
+NS_PER_SEC = 1_000_000_000
+_T_MAX = np.iinfo(np.int64).max
+
+
+# ===================== Helper thời gian (khớp timedelta / Timedelta) =====================
+def ramp_ns(delta_mw, rate):
+    """
+    |ΔMW| / rate giây -> int64 ns (vector hóa ramp_dt của bản loop).
+    Làm tròn tới micro-giây giống hệt timedelta(seconds=float) (round-half-even
+    trên phần lẻ) để mốc thời gian trùng khớp bản loop.
+    """
+    sec = np.maximum(np.abs(np.asarray(delta_mw, dtype=float)) / rate, 0.0)
+    whole = np.trunc(sec)
+    us = whole.astype(np.int64) * 1_000_000 + np.rint((sec - whole) * 1e6).astype(np.int64)
+    return us * 1000
+
+
+def total_seconds(delta_ns):
+    """Tương đương vector của Timedelta.total_seconds() (bỏ phần nano-giây như pandas)."""
+    us = np.asarray(delta_ns, dtype=np.int64) // 1000
+    return (us // 1_000_000).astype(float) + (us % 1_000_000) / 1e6
+
+
+def py_round3(values):
+    """round(x, 3) kiểu Python (khác np.round ở vài ca biên)."""
+    return np.array([round(v, 3) for v in np.asarray(values, dtype=float).tolist()], dtype=float)
+
+
+def prepare_step_arrays(df_step: pd.DataFrame):
+    """Chuẩn hóa df_step giống bản loop, trả về (t_ns: int64, mw: float64) đã sort (stable) theo thời gian."""
+    if df_step is None or df_step.empty or "MW" not in df_step or "Thời điểm" not in df_step:
+        return None
+    df = pd.DataFrame({
+        "MW": pd.to_numeric(df_step["MW"], errors="coerce"),
+        "Thời điểm": as_datetime64(df_step["Thời điểm"]),
+    })
+    df = df.dropna(subset=["MW", "Thời điểm"]).sort_values("Thời điểm", kind="stable").reset_index(drop=True)
+    if len(df) < 2:
+        return None
+    t_ns = df["Thời điểm"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    mw = df["MW"].to_numpy(dtype=float)
+    return t_ns, mw
+
+
+def _row_searchsorted(a: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    np.searchsorted(a[i], v[i], side="left") cho từng dòng i (a: N x K, mỗi dòng tăng dần),
+    tìm nhị phân đồng thời trên mọi dòng: ceil(log2(K + 1)) bước, mỗi bước 1 phần tử / dòng.
+    """
+    n, k = a.shape
+    rows = np.arange(n)
+    lo = np.zeros(n, dtype=np.intp)
+    hi = np.full(n, k, dtype=np.intp)
+    for _ in range(int(k).bit_length()):
+        mid = (lo + hi) // 2
+        active = lo < hi
+        go = active & (a[rows, np.minimum(mid, k - 1)] < v)
+        lo = np.where(go, mid + 1, lo)
+        hi = np.where(active & ~go, mid, hi)
+    return lo
+
+
+# ===================== Profile hợp đồng =====================
+class RampProfile:
+    """
+    Hợp đồng ramp khai báo:
+      - rate_bands : ranh giới vùng tốc độ (MW), ví dụ (330,) -> 2 vùng [<330, >=330]
+      - up_rates / down_rates : MW/s cho từng vùng; tốc độ 1 chặng lấy theo vùng
+                                của MW tại ĐẦU chặng
+      - up_stops / down_stops : (mốc MW, hold giây) khi băng qua mốc theo chiều đó
+            * hold > 0  : giữ phẳng tại mốc N giây (sinh hold_start/hold_end)
+            * hold = 0  : dừng chặng tại mốc, không giữ
+            * hold None : chỉ chia chặng để làm tròn thời gian (quỹ đạo MW
+                          không neo lại nếu tốc độ hai bên mốc như nhau)
+    Băng qua mốc h: TĂNG khi m0 < h <= m1, GIẢM khi m0 > h >= m1.
+
+    compile() chuẩn hóa 1 lần (sort mốc theo chiều đi, mảng tốc độ);
+    trajectories() dựng bảng breakpoint cho mọi cặp.
+    """
+
+    def __init__(self, name: str,
+                 rate_bands: Sequence[float],
+                 up_rates: Sequence[float],
+                 down_rates: Sequence[float],
+                 up_stops: Sequence[Tuple[float, Optional[int]]] = (),
+                 down_stops: Sequence[Tuple[float, Optional[int]]] = ()):
+        if len(up_rates) != len(rate_bands) + 1 or len(down_rates) != len(rate_bands) + 1:
+            raise ValueError("up_rates/down_rates phải có len(rate_bands) + 1 phần tử")
+        if min(list(up_rates) + list(down_rates)) <= 0:
+            raise ValueError("Tốc độ ramp phải > 0")
+        self.name = name
+        self.rate_bands = tuple(float(b) for b in rate_bands)
+        self.up_rates = tuple(float(r) for r in up_rates)
+        self.down_rates = tuple(float(r) for r in down_rates)
+        self.up_stops = tuple((float(h), hold) for h, hold in up_stops)
+        self.down_stops = tuple((float(h), hold) for h, hold in down_stops)
+        self._compiled = None
+
+    def compile(self):
+        """Bảng tra đã chuẩn hóa (cache): bands, tốc độ theo chiều, mốc theo thứ tự đi."""
+        if self._compiled is None:
+            self._compiled = {
+                "bands": np.asarray(self.rate_bands, dtype=float),
+                "rates": {+1: np.asarray(self.up_rates, dtype=float),
+                          -1: np.asarray(self.down_rates, dtype=float)},
+                "stops": {+1: sorted(self.up_stops, key=lambda s: s[0]),
+                          -1: sorted(self.down_stops, key=lambda s: -s[0])},
+            }
+        return self._compiled
+
+    def rate(self, mw, direction: int):
+        """Tốc độ (MW/s) của chặng bắt đầu tại mw theo chiều direction (+1/-1)."""
+        c = self.compile()
+        return c["rates"][direction][np.searchsorted(c["bands"], mw, side="right")]
+
+    def trajectories(self, t0, m0, m1) -> "RampTrajectories":
+        return RampTrajectories(self, t0, m0, m1)
+
+    def __repr__(self) -> str:
+        return f"RampProfile({self.name!r})"
+
+
+class RampTrajectories:
+    """
+    Bảng breakpoint tuyến tính từng đoạn cho n cặp (t0, m0) -> m1.
+
+    Mỗi cặp gồm K mảnh (n x K): mảnh k phủ (end[k-1], end[k]] và có
+      MW(t) = clamp(anchor_mw ± rate * Δt(anchor_t), clamp_mw)
+    (hold = mảnh rate 0). Mốc không qua -> mảnh độ dài 0 (tự bị bỏ qua khi tra).
+    Ngoài ra:
+      - finish  : thời điểm tới m1 (chưa xét cắt), làm tròn từng chặng như bản loop
+      - hold_*  : (n x H) mốc hold theo thứ tự đi (has_hold = có hold > 0)
+    mw_at(t) / time_at(mw): tra nhị phân mảnh theo end / MW cuối mảnh, O(log K) mỗi cặp.
+    """
+
+    def __init__(self, profile: RampProfile, t0, m0, m1):
+        c = profile.compile()
+        t0 = np.asarray(t0, dtype=np.int64)
+        m0 = np.asarray(m0, dtype=float)
+        m1 = np.asarray(m1, dtype=float)
+        n = len(t0)
+        self.t0, self.m0, self.m1 = t0, m0, m1
+        self.sign = np.sign(m1 - m0).astype(np.int8)
+        self._end_mw = None                      # MW cuối từng mảnh, dựng khi gọi time_at lần đầu
+
+        n_up, n_dn = len(c["stops"][+1]), len(c["stops"][-1])
+        n_stop = max(n_up, n_dn)
+        K = 2 * n_stop + 1
+        self.end = np.empty((n, K), dtype=np.int64)
+        self.anchor_t = np.empty((n, K), dtype=np.int64)
+        self.anchor_mw = np.empty((n, K), dtype=float)
+        self.rate = np.zeros((n, K), dtype=float)
+        self.clamp = np.empty((n, K), dtype=float)
+        self.hold_mw = np.full((n, n_stop), np.nan)
+        self.hold_start = np.zeros((n, n_stop), dtype=np.int64)
+        self.hold_end = np.zeros((n, n_stop), dtype=np.int64)
+        self.has_hold = np.zeros((n, n_stop), dtype=bool)
+        self.finish = t0.copy()  # PHẲNG: sẽ được thay bằng t_next khi dựng cặp
+
+        for d in (+1, -1):
+            sel = self.sign == d
+            if not sel.any():
+                continue
+            rates = c["rates"][d]
+            bands = c["bands"]
+
+            def _rate(mw):
+                return rates[np.searchsorted(bands, mw, side="right")]
+
+            s_t0, s_m0, s_m1 = t0[sel], m0[sel], m1[sel]
+            cur_t, cur_mw = s_t0.copy(), s_m0.copy()               # đầu chặng (làm tròn thời gian)
+            anc_t, anc_mw, anc_r = s_t0.copy(), s_m0.copy(), _rate(s_m0)  # neo quỹ đạo MW
+            prev_end = s_t0.copy()
+            ns = len(s_t0)
+            c_end = np.empty((ns, K), dtype=np.int64)
+            c_at = np.empty((ns, K), dtype=np.int64)
+            c_amw = np.empty((ns, K))
+            c_rate = np.zeros((ns, K))
+            c_clamp = np.empty((ns, K))
+            h_mw = np.full((ns, n_stop), np.nan)
+            h_s = np.zeros((ns, n_stop), dtype=np.int64)
+            h_e = np.zeros((ns, n_stop), dtype=np.int64)
+            h_has = np.zeros((ns, n_stop), dtype=bool)
+
+            stops = c["stops"][d]
+            for j in range(n_stop):
+                kr, kh = 2 * j, 2 * j + 1
+                # mặc định: 2 mảnh độ dài 0 tiếp nối mảnh trước
+                c_end[:, kr] = prev_end
+                c_end[:, kh] = prev_end
+                c_at[:, kr], c_amw[:, kr], c_rate[:, kr], c_clamp[:, kr] = anc_t, anc_mw, anc_r, s_m1
+                c_at[:, kh], c_amw[:, kh], c_rate[:, kh], c_clamp[:, kh] = anc_t, anc_mw, anc_r, s_m1
+                if j >= len(stops):
+                    continue
+                h, hold = stops[j]
+                crossed = (s_m0 < h) & (h <= s_m1) if d > 0 else (s_m0 > h) & (h >= s_m1)
+                if not crossed.any():
+                    continue
+                leg_r = _rate(cur_mw)
+                t_h = cur_t + ramp_ns(h - cur_mw, leg_r)
+                anchors = crossed & ((hold is not None) | (leg_r != _rate(np.full_like(cur_mw, h))))
+                hold_ns = max(int(hold or 0), 0) * NS_PER_SEC
+                t_after = t_h + hold_ns
+
+                # mảnh ramp tới mốc (neo tại anchor hiện tại, kẹp ở h)
+                c_end[anchors, kr] = t_h[anchors]
+                c_clamp[anchors, kr] = h
+                # mảnh hold (rate 0 tại h)
+                c_end[anchors, kh] = t_after[anchors]
+                c_at[anchors, kh], c_amw[anchors, kh], c_rate[anchors, kh], c_clamp[anchors, kh] = \
+                    t_h[anchors], h, 0.0, h
+                if hold is not None and hold > 0:
+                    h_mw[crossed, j] = h
+                    h_s[crossed, j] = t_h[crossed]
+                    h_e[crossed, j] = t_after[crossed]
+                    h_has[crossed, j] = True
+
+                # chuyển sang chặng mới
+                cur_t = np.where(crossed, t_after, cur_t)
+                cur_mw = np.where(crossed, h, cur_mw)
+                anc_t = np.where(anchors, t_after, anc_t)
+                anc_mw = np.where(anchors, h, anc_mw)
+                anc_r = np.where(anchors, _rate(np.full_like(cur_mw, h)), anc_r)
+                prev_end = np.where(anchors, t_after, prev_end)
+
+            # mảnh cuối: neo hiện tại, kẹp ở m1
+            c_end[:, -1] = _T_MAX
+            c_at[:, -1], c_amw[:, -1], c_rate[:, -1], c_clamp[:, -1] = anc_t, anc_mw, anc_r, s_m1
+
+            self.end[sel], self.anchor_t[sel], self.anchor_mw[sel] = c_end, c_at, c_amw
+            self.rate[sel], self.clamp[sel] = c_rate, c_clamp
+            self.hold_mw[sel], self.hold_start[sel], self.hold_end[sel], self.has_hold[sel] = h_mw, h_s, h_e, h_has
+            self.finish[sel] = cur_t + ramp_ns(s_m1 - cur_mw, _rate(cur_mw))
+
+        flat = self.sign == 0
+        self.end[flat] = _T_MAX
+        self.anchor_t[flat] = t0[flat, None]
+        self.anchor_mw[flat] = m1[flat, None]
+        self.clamp[flat] = m1[flat, None]
+
+    def mw_at(self, t):
+        """MW theo quỹ đạo tại thời điểm t (int64 ns, 1 giá trị / cặp). t <= t0 -> m0."""
+        t = np.asarray(t, dtype=np.int64)
+        k = _row_searchsorted(self.end, t)[:, None]
+        a_t = np.take_along_axis(self.anchor_t, k, axis=1)[:, 0]
+        a_mw = np.take_along_axis(self.anchor_mw, k, axis=1)[:, 0]
+        r = np.take_along_axis(self.rate, k, axis=1)[:, 0]
+        cl = np.take_along_axis(self.clamp, k, axis=1)[:, 0]
+        dt = total_seconds(t - a_t)
+        val = np.where(self.sign > 0, np.minimum(a_mw + r * dt, cl),
+                       np.where(self.sign < 0, np.maximum(a_mw - r * dt, cl), self.m1))
+        return np.where(t <= self.t0, self.m0, val)
+
+    def time_at(self, mw):
+        """
+        Thời điểm đầu tiên quỹ đạo đạt mức mw (int64 ns, 1 giá trị / cặp): tìm nhị phân mảnh đầu
+        tiên có MW cuối mảnh đã tới mw, rồi tính trên mảnh đó. mw ngoài [m0, m1] -> -1.
+        """
+        mw = np.asarray(mw, dtype=float)
+        s = self.sign.astype(float)
+        if self._end_mw is None:
+            # MW cuối từng mảnh theo chiều đi (s * MW không giảm dọc mỗi dòng)
+            fin = self.end < _T_MAX
+            dt = total_seconds(np.where(fin, self.end, self.anchor_t) - self.anchor_t)
+            reach = s[:, None] * np.minimum(s[:, None] * (self.anchor_mw - self.clamp) + self.rate * dt, 0.0)
+            end_mw = np.where(fin, self.clamp + reach, self.m1[:, None])
+            self._end_mw = np.maximum.accumulate(s[:, None] * end_mw, axis=1)
+        k = np.minimum(_row_searchsorted(self._end_mw, s * mw), self.end.shape[1] - 1)[:, None]
+        a_t = np.take_along_axis(self.anchor_t, k, axis=1)[:, 0]
+        a_mw = np.take_along_axis(self.anchor_mw, k, axis=1)[:, 0]
+        r = np.take_along_axis(self.rate, k, axis=1)[:, 0]
+        t_hit = np.maximum(a_t + ramp_ns(mw - a_mw, np.where(r > 0, r, 1.0)), self.t0)
+        lo, hi = np.minimum(self.m0, self.m1), np.maximum(self.m0, self.m1)
+        # mảnh hold (rate 0) chỉ được chọn khi mw = đúng mốc hold (mảnh ramp trước dừng ngay dưới mốc
+        # do làm tròn micro-giây) -> thời điểm đạt = đầu mảnh hold
+        out = np.where((mw >= lo) & (mw <= hi) & ((r > 0) | (mw == a_mw)), t_hit, -1)
+        return np.where(mw == self.m0, self.t0, out)
+
+
+# ===================== Segments + summary cho mọi cặp =====================
+def build_profile_per_pair(df_step: pd.DataFrame,
+                           profile: RampProfile,
+                           make_gap_pairs: bool = True,
+                           gap_min_sec: int = 1):
+    """
+    Engine chung PPA/EPC (vector hóa): với mọi cặp i -> i+1
+      - dựng quỹ đạo theo profile (ramp/hold/finish),
+      - UNIVERSAL CUT: finish > t_next -> cắt tại t_next với MW = quỹ đạo tại t_next,
+      - sanitize hold (bỏ nếu cắt trước hold, kéo hold_end về điểm cắt nếu cắt trong hold),
+      - gap pair phẳng nếu finish < t_next.
+    Trả về (SegmentStore, summary) cùng định dạng với bản loop.
+    """
+    prep = prepare_step_arrays(df_step)
+    if prep is None:
+        return SegmentStore.empty(), pd.DataFrame()
+    return build_profile_points(prep[0], prep[1], profile, make_gap_pairs, gap_min_sec)
+
+
+def build_profile_points(t_all, mw_all, profile: RampProfile,
+                         make_gap_pairs: bool = True,
+                         gap_min_sec: int = 1,
+                         first_pair: int = 0):
+    """
+    Như build_profile_per_pair nhưng nhận thẳng mốc đã chuẩn hóa (prepare_step_arrays, >= 2 mốc).
+    first_pair: số thứ tự của cặp đầu tiên (idx_pair / nhãn gap) khi chỉ tính phần đuôi.
+    """
+    t0, t1 = t_all[:-1], t_all[1:]
+    m0, m1 = mw_all[:-1], mw_all[1:]
+    n = len(t0)
+
+    traj = profile.trajectories(t0, m0, m1)
+    finish = np.where(traj.sign == 0, t1, traj.finish)
+
+    # ===== UNIVERSAL CUT =====
+    cut = finish > t1
+    mw_cut = traj.mw_at(t1)
+    finish_t = np.where(cut, t1, finish)
+    finish_mw = np.where(cut, mw_cut, m1)
+
+    # ===== Sanitize hold markers sau universal cut =====
+    keep_hold = traj.has_hold & (finish_t[:, None] > traj.hold_start)
+    hold_end = np.where(keep_hold & (finish_t[:, None] < traj.hold_end), finish_t[:, None], traj.hold_end)
+    inside_hold = (keep_hold & (traj.hold_start <= finish_t[:, None])
+                   & (finish_t[:, None] <= hold_end)).any(axis=1)
+    n_hold = keep_hold.sum(axis=1)
+
+    # ===== Bảng event phẳng: start, [hold_start, hold_end]*, finish, [cut] =====
+    n_ev = 2 + 2 * n_hold + cut
+    gap_sec = total_seconds(t1 - finish_t)
+    is_gap = (gap_sec > max(float(gap_min_sec), 0.0)) if make_gap_pairs else np.zeros(n, dtype=bool)
+
+    # thứ tự segment: cặp i rồi (nếu có) gap i
+    n_seg_rows = np.stack([n_ev, np.where(is_gap, 2, 0)], axis=1).ravel()
+    ends = np.cumsum(n_seg_rows)
+    starts = ends - n_seg_rows
+    total = int(ends[-1]) if len(ends) else 0
+    ev = np.empty(total, dtype=np.int8)
+    ev_mw = np.empty(total, dtype=float)
+    ev_t = np.empty(total, dtype=np.int64)
+
+    p0 = starts[0::2]
+    ev[p0], ev_mw[p0], ev_t[p0] = EV_START, m0, t0
+    pos = p0 + 1
+    for j in range(keep_hold.shape[1]):
+        kh = keep_hold[:, j]
+        hs = pos[kh]
+        ev[hs], ev_mw[hs], ev_t[hs] = EV_HOLD_START, traj.hold_mw[kh, j], traj.hold_start[kh, j]
+        ev[hs + 1], ev_mw[hs + 1], ev_t[hs + 1] = EV_HOLD_END, traj.hold_mw[kh, j], hold_end[kh, j]
+        pos = pos + 2 * kh
+    pf = pos
+    ev[pf], ev_mw[pf], ev_t[pf] = EV_FINISH, finish_mw, finish_t
+    pc = pf[cut] + 1
+    ev[pc], ev_mw[pc], ev_t[pc] = EV_CUT, mw_cut[cut], t1[cut]
+    g0 = starts[1::2][is_gap]
+    ev[g0], ev_mw[g0], ev_t[g0] = EV_START, m1[is_gap], finish_t[is_gap]
+    ev[g0 + 1], ev_mw[g0 + 1], ev_t[g0 + 1] = EV_FINISH, m1[is_gap], t1[is_gap]
+
+    segments = SegmentStore.from_lengths(n_seg_rows[n_seg_rows > 0], ev, ev_mw, ev_t)
+
+    # ===== Summary (cùng cột/kiểu dữ liệu với bản loop; hold = hold đầu tiên còn giữ) =====
+    if keep_hold.shape[1]:
+        j_first = np.argmax(keep_hold, axis=1)[:, None]
+        any_hold = keep_hold.any(axis=1)
+        first_mw = np.take_along_axis(traj.hold_mw, j_first, axis=1)[:, 0]
+        first_hs = np.take_along_axis(traj.hold_start, j_first, axis=1)[:, 0]
+        first_he = np.take_along_axis(hold_end, j_first, axis=1)[:, 0]
+    else:
+        any_hold = np.zeros(n, dtype=bool)
+        first_mw, first_hs, first_he = np.zeros(n), t0, t0
+
+    n_gap = int(is_gap.sum())
+    rows = np.arange(n) + np.cumsum(is_gap) - is_gap  # vị trí dòng của cặp chính
+    rows_gap = rows[is_gap] + 1                        # dòng gap ngay sau cặp chính
+
+    def _col(main, gap, fill=np.nan):
+        out = np.full(n + n_gap, fill, dtype=object)
+        if main is not None:
+            out[rows] = main
+        if gap is not None:
+            out[rows_gap] = gap
+        return out.tolist()
+
+    def _ts(arr):
+        return np.array(list(pd.DatetimeIndex(arr.view("datetime64[ns]"))), dtype=object)
+
+    def _or_na(values, mask):
+        return np.where(mask, values.astype(object), pd.NA)
+
+    start_ts, finish_ts = _ts(t0), _ts(finish_t)
+    tgt_r = py_round3(m1[is_gap])
+    na_gap = np.full(n_gap, pd.NA, dtype=object)
+    cols = {
+        "idx_pair": _col(np.arange(n) + first_pair,
+                         np.array([f"{i}_gap" for i in np.flatnonzero(is_gap) + first_pair], dtype=object)),
+        "StartMW": _col(py_round3(m0), tgt_r),
+        "StartTime": _col(start_ts, finish_ts[is_gap]),
+        "HoldMW": _col(_or_na(py_round3(np.nan_to_num(first_mw)), any_hold), na_gap),
+        "HoldStart": _col(_or_na(_ts(first_hs), any_hold), na_gap),
+        "HoldEnd": _col(_or_na(_ts(first_he), any_hold), na_gap),
+        "FinishMW": _col(py_round3(finish_mw), tgt_r),
+        "FinishTime": _col(finish_ts, _ts(t1[is_gap])),
+        "EndReason": _col(np.where(cut, "cut_by_overwrite", "reach_target").astype(object),
+                          np.full(n_gap, "flat_gap", dtype=object)),
+        "InsideHold": _col(inside_hold, None),
+    }
+    if n_gap:
+        cols["IsGap"] = _col(None, np.full(n_gap, True, dtype=object))
+        cols["GapSec"] = _col(None, np.trunc(gap_sec[is_gap]).astype(np.int64))
+    summary = pd.DataFrame(cols)
+    return segments, summary
@@ -0,0 +1,192 @@
+# result_cache.py
+import hashlib
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, Optional
+from tab_module.calculation_modules.segment_store import SegmentStore
+from tab_module.main_window_modules.input_cache import InputCache
+
+# Tăng khi đổi cấu trúc kết quả lưu trong cache (dict seg/sum/hour, DF phút...)
+RESULT_SCHEMA_VERSION = 1
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024    # 256 MB trong RAM
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024     # 1 GB trên đĩa
+DEFAULT_DISK_DIR = (os.environ.get("DIM_RESULT_CACHE_DIR")
+                    or os.path.join(os.path.expanduser("~"), ".dim_cache", "results"))
+# Mã nguồn các bước tính nằm trong khóa: sửa thuật toán -> khóa mới, kết quả cũ trên đĩa không bị dùng lại
+_CODE_MODULES = ("segment_store", "ramp_profile", "ppa_calculation", "epc_calculation",
+                 "ppa_minutely", "ppa_hourly", "export_utils", "incremental")
+_code_tag = None
+
+
+def code_tag() -> str:
+    global _code_tag
+    if _code_tag is None:
+        h = hashlib.blake2b(digest_size=8)
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _CODE_MODULES:
+            try:
+                with open(os.path.join(here, name + ".py"), "rb") as f:
+                    h.update(f.read())
+            except OSError:   # bản đóng gói không kèm .py -> chỉ dựa vào RESULT_SCHEMA_VERSION
+                h.update(name.encode("utf-8"))
+        _code_tag = h.hexdigest()
+    return _code_tag
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Hash nội dung DataFrame (tên cột, kiểu, giá trị; bỏ qua index)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def result_nbytes(obj) -> int:
+    """Ước lượng dung lượng 1 kết quả (DataFrame / SegmentStore / mảng, lồng trong dict/list)."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())   # deep: cột object (summary) tính cả đối tượng
+    if isinstance(obj, SegmentStore):
+        return sum(a.nbytes for a in (obj.pair_id, obj.event, obj.mw, obj.t_ns, obj.offsets))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(result_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(result_nbytes(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class ResultCache:
+    """
+    Cache kết quả tính PPA/EPC theo từng tổ máy.
+
+    Khóa = hash DF bậc thang + mode + tham số (hold, gap, freq, label, ...) + phiên bản
+    (RESULT_SCHEMA_VERSION, mã nguồn các bước tính, pandas). Cùng dữ liệu + cùng tham số
+    -> dùng lại kết quả, kể cả khi import lại đúng file đó.
+
+    2 tầng:
+      - RAM: LRU theo dung lượng (max_bytes), kết quả lớn hơn max_bytes không giữ
+      - đĩa (tùy chọn): InputCache (pickle, ghi nguyên tử, LRU theo mtime)
+    Kết quả trả ra dùng chung giữa các lần gọi -> chỉ đọc, không sửa tại chỗ.
+    Dùng được từ worker thread (khóa nội bộ).
+
+    Lần tính gần nhất theo dòng (lineage = tổ máy + mode + tham số) được ghi nhớ qua
+    set_latest / latest: dữ liệu mới chỉ ghi thêm lệnh -> tính tiếp từ kết quả đó (incremental.py).
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_BYTES, disk: Optional[InputCache] = None):
+        self.max_bytes = int(max_bytes)
+        self.disk = disk
+        self._mem = OrderedDict()     # key -> (kết quả, dung lượng)
+        self._total = 0
+        self._lock = threading.Lock()
+        self._latest = {}             # lineage -> khóa của lần tính gần nhất
+
+    # ---------- Khóa ----------
+    @staticmethod
+    def key(mode: str, df: pd.DataFrame, params: Dict[str, object], stage: str = "unit") -> str:
+        tag = (f"{stage}|{mode}|{sorted(params.items())}|v{RESULT_SCHEMA_VERSION}"
+               f"|{code_tag()}|pd{pd.__version__}")
+        tag = hashlib.blake2b(tag.encode("utf-8"), digest_size=8).hexdigest()
+        return f"{stage}-{mode.lower()}-{frame_fingerprint(df)}-{tag}"
+
+    @staticmethod
+    def derived(key: str, stage: str, params: Dict[str, object]) -> str:
+        """Khóa cho chặng dựng tiếp từ kết quả của key (vd DF phút từ segments)."""
+        tag = hashlib.blake2b(f"{stage}|{sorted(params.items())}".encode("utf-8"), digest_size=8).hexdigest()
+        return f"{key}-{stage}-{tag}"
+
+    @staticmethod
+    def lineage(unit: str, mode: str, params: Dict[str, object]) -> str:
+        tag = f"{unit}|{mode}|{sorted(params.items())}|v{RESULT_SCHEMA_VERSION}|{code_tag()}"
+        return "latest-" + hashlib.blake2b(tag.encode("utf-8"), digest_size=8).hexdigest()
+
+    # ---------- Lần tính gần nhất ----------
+    def set_latest(self, lineage: str, key: str) -> None:
+        with self._lock:
+            if self._latest.get(lineage) == key:
+                return
+            self._latest[lineage] = key
+        if self.disk is not None:
+            self.disk.put(lineage, key)
+
+    def latest(self, lineage: str) -> Optional[str]:
+        with self._lock:
+            key = self._latest.get(lineage)
+        if key is None and self.disk is not None:
+            key = self.disk.get(lineage)
+            if key is not None:
+                with self._lock:
+                    self._latest.setdefault(lineage, key)
+        return key
+
+    # ---------- Đọc / ghi ----------
+    def get(self, key: str):
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                self._mem.move_to_end(key)
+                return hit[0]
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._remember(key, value)
+                return value
+        return None
+
+    def put(self, key: str, value) -> None:
+        self._remember(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def _remember(self, key: str, value) -> None:
+        size = result_nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._total -= old[1]
+            self._mem[key] = (value, size)
+            self._total += size
+            while self._total > self.max_bytes and self._mem:
+                _, (_, s) = self._mem.popitem(last=False)
+                self._total -= s
+
+    def clear_memory(self, keep_latest: bool = False) -> None:
+        """
+        Bỏ tầng RAM (vd khi import file mới); tầng đĩa giữ theo nội dung nên vẫn đúng.
+        keep_latest: giữ lại kết quả của lần tính gần nhất (+ chặng dựng tiếp) làm gốc tính tiếp.
+        """
+        with self._lock:
+            keep = tuple(self._latest.values()) if keep_latest else ()
+            for key in [k for k in self._mem if not k.startswith(keep)]:
+                self._total -= self._mem.pop(key)[1]
+
+    def clear(self) -> None:
+        self.clear_memory()
+        with self._lock:
+            self._latest.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    @property
+    def nbytes(self) -> int:
+        return self._total
+
+
+_default_result_cache = None
+
+
+def default_result_cache() -> ResultCache:
+    global _default_result_cache
+    if _default_result_cache is None:
+        _default_result_cache = ResultCache(disk=InputCache(DEFAULT_DISK_DIR, DEFAULT_DISK_BYTES))
+    return _default_result_cache
@@ -0,0 +1,199 @@
+# segment_store.py
+import numpy as np
+import pandas as pd
+from typing import Iterable, List, Optional, Sequence
+
+# Mã event (int8) dùng chung cho PPA/EPC
+EVENT_NAMES = ("start", "hold_start", "hold_end", "finish", "cut_by_overwrite")
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_NAMES)}
+EV_START, EV_HOLD_START, EV_HOLD_END, EV_FINISH, EV_CUT = range(len(EVENT_NAMES))
+
+
+def as_datetime64(s: pd.Series) -> pd.Series:
+    """Cột thời điểm -> datetime64; đã đúng kiểu thì trả nguyên (không parse lại), còn lại to_datetime(coerce)."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, errors="coerce")
+
+
+class SegmentStore:
+    """
+    Bảng segment dạng cột (thay cho List[pd.DataFrame]).
+
+    Mỗi dòng là 1 event của 1 segment:
+      - pair_id : int64   số thứ tự segment (trùng index trong list cũ)
+      - event   : int8    mã event (xem event_names)
+      - mw      : float64
+      - t_ns    : int64   thời điểm (ns, datetime64[ns])
+    offsets (int64, dài = số segment + 1): segment k = dòng [offsets[k], offsets[k+1]).
+    Trong mỗi segment các event đã sort theo thời gian.
+
+    Tương thích ngược: store hành xử như list[pd.DataFrame] (len, [k], iter),
+    DataFrame ["Event","MW","Thời điểm"] chỉ được dựng khi truy cập.
+    """
+
+    __slots__ = ("pair_id", "event", "mw", "t_ns", "offsets", "event_names")
+
+    def __init__(self, pair_id, event, mw, t_ns, offsets, event_names: Sequence[str] = EVENT_NAMES):
+        self.pair_id = np.asarray(pair_id, dtype=np.int64)
+        self.event = np.asarray(event, dtype=np.int8)
+        self.mw = np.asarray(mw, dtype=float)
+        self.t_ns = np.asarray(t_ns, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.event_names = tuple(event_names)
+
+    # ---------- Khởi tạo ----------
+    @classmethod
+    def empty(cls) -> "SegmentStore":
+        z = np.zeros(0)
+        return cls(z, z, z, z, np.zeros(1))
+
+    @classmethod
+    def from_lengths(cls, lengths, event, mw, t_ns, event_names: Sequence[str] = EVENT_NAMES) -> "SegmentStore":
+        """Dựng store từ số dòng mỗi segment (đã theo thứ tự segment)."""
+        lengths = np.asarray(lengths, dtype=np.int64)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        pair_id = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        return cls(pair_id, event, mw, t_ns, offsets, event_names)
+
+    @classmethod
+    def from_frames(cls, segments: Iterable[Optional[pd.DataFrame]]) -> "SegmentStore":
+        """
+        Chuyển List[pd.DataFrame] (API cũ) -> store. Chuẩn hóa 1 lần:
+        to_datetime / to_numeric, bỏ dòng thiếu, sort theo thời gian trong từng segment.
+        Segment rỗng/None vẫn giữ chỗ (0 dòng) để index không bị lệch.
+        """
+        if isinstance(segments, SegmentStore):
+            return segments
+        segments = list(segments or [])
+        if not segments:
+            return cls.empty()
+
+        parts, lengths = [], []
+        for seg in segments:
+            if seg is None or getattr(seg, "empty", True):
+                lengths.append(0)
+                continue
+            ev = seg["Event"] if "Event" in seg.columns else pd.Series("point", index=seg.index)
+            parts.append(pd.DataFrame({
+                "Event": ev.astype(str).to_numpy(),
+                "MW": pd.to_numeric(seg["MW"], errors="coerce").to_numpy(dtype=float),
+                "Thời điểm": as_datetime64(seg["Thời điểm"]).to_numpy(dtype="datetime64[ns]"),
+                "_seg": len(lengths),
+            }))
+            lengths.append(None)
+        if not parts:
+            return cls.from_lengths(lengths, [], [], [])
+
+        flat = pd.concat(parts, ignore_index=True).dropna(subset=["MW", "Thời điểm"])
+        flat = flat.sort_values(["_seg", "Thời điểm"], kind="stable")
+        counts = flat["_seg"].value_counts()
+        lengths = [int(counts.get(k, 0)) for k in range(len(lengths))]
+
+        names = list(EVENT_NAMES)
+        for name in pd.unique(flat["Event"]):
+            if name not in EVENT_CODES:
+                names.append(name)
+        codes = pd.Categorical(flat["Event"], categories=names).codes
+        t_ns = flat["Thời điểm"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        return cls.from_lengths(lengths, codes, flat["MW"].to_numpy(dtype=float), t_ns, names)
+
+    # ---------- Kích thước / truy cập ----------
+    @property
+    def n_segments(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return self.n_segments
+
+    def __bool__(self) -> bool:
+        return self.n_segments > 0
+
+    def __iter__(self):
+        for k in range(self.n_segments):
+            yield self.segment(k)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self.segment(i) for i in range(*k.indices(self.n_segments))]
+        if k < 0:
+            k += self.n_segments
+        if not 0 <= k < self.n_segments:
+            raise IndexError("segment index out of range")
+        return self.segment(k)
+
+    def rows(self, k: int) -> slice:
+        return slice(int(self.offsets[k]), int(self.offsets[k + 1]))
+
+    def event_labels(self, rows=slice(None)) -> np.ndarray:
+        return np.asarray(self.event_names, dtype=object)[self.event[rows]]
+
+    def segment(self, k: int) -> pd.DataFrame:
+        """View tương thích: DataFrame ["Event","MW","Thời điểm"] của segment k."""
+        r = self.rows(k)
+        return pd.DataFrame({
+            "Event": self.event_labels(r),
+            "MW": self.mw[r],
+            "Thời điểm": self.t_ns[r].view("datetime64[ns]"),
+        })
+
+    def to_frames(self) -> List[pd.DataFrame]:
+        return [self.segment(k) for k in range(self.n_segments)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Toàn bộ bảng phẳng: pair_id / Event / MW / Thời điểm."""
+        return pd.DataFrame({
+            "pair_id": self.pair_id,
+            "Event": self.event_labels(),
+            "MW": self.mw,
+            "Thời điểm": self.t_ns.view("datetime64[ns]"),
+        })
+
+    # ---------- Tiện ích vector hóa theo segment ----------
+    def first_last(self):
+        """(idx_first, idx_last) của mỗi segment; -1 nếu segment rỗng."""
+        lens = self.lengths
+        first = np.where(lens > 0, self.offsets[:-1], -1)
+        last = np.where(lens > 0, self.offsets[1:] - 1, -1)
+        return first, last
+
+    def event_row(self, code: int, last: bool = False) -> np.ndarray:
+        """Dòng đầu (hoặc cuối nếu last=True) có event = code trong mỗi segment; -1 nếu không có."""
+        out = np.full(self.n_segments, -1, dtype=np.int64)
+        rows = np.flatnonzero(self.event == code)
+        if last:
+            rows = rows[::-1]
+        seg, pos = np.unique(self.pair_id[rows], return_index=True)
+        out[seg] = rows[pos]
+        return out
+
+    def start_finish_mw(self):
+        """
+        MW đầu/cuối mỗi segment theo quy ước nhãn cũ:
+        start = MW của event 'start' đầu tiên (không có thì dòng đầu),
+        finish = MW của event 'finish' cuối cùng (không có thì dòng cuối).
+        Segment rỗng -> NaN.
+        """
+        first, last = self.first_last()
+        r_start = self.event_row(EV_START)
+        r_finish = self.event_row(EV_FINISH, last=True)
+        r_start = np.where(r_start >= 0, r_start, first)
+        r_finish = np.where(r_finish >= 0, r_finish, last)
+        mw = np.append(self.mw, np.nan)  # index -1 -> NaN
+        return mw[r_start], mw[r_finish]
+
+    def take(self, indices) -> "SegmentStore":
+        """Store con gồm các segment theo indices (pair_id đánh lại 0..k-1)."""
+        idx = np.asarray(indices, dtype=np.int64)
+        lens = self.lengths[idx]
+        out_start = np.cumsum(lens) - lens
+        rows = np.arange(int(lens.sum())) + np.repeat(self.offsets[idx] - out_start, lens)
+        return SegmentStore.from_lengths(lens, self.event[rows], self.mw[rows], self.t_ns[rows], self.event_names)
+
+    def __repr__(self) -> str:
+        return f"SegmentStore(segments={self.n_segments}, rows={len(self.t_ns)})"
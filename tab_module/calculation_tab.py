@@ -1,27 +1,64 @@
 # calculation_tab.py
+import os
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QPushButton, QMessageBox,
-    QHBoxLayout, QFileDialog, QTableView
+    QHBoxLayout, QFileDialog, QTableView, QProgressBar, QSplitter
+)
+from PySide6.QtCore import Qt, QThreadPool
+from tab_module.calculation_modules.plot_panel import PlotPanel  # khung vẽ nhúng (S1/S2 × PPA/EPC)
+from tab_module.calculation_modules.segment_store import SegmentStore
+from tab_module.main_window_modules.hourly_model import HourlyTableModel
+from tab_module.calculation_modules.calc_worker import CalcWorker
+from tab_module.calculation_modules.contract_index import ContractIndex
+from tab_module.calculation_modules.result_cache import default_result_cache
+# build_*_per_pair -> giờ -> ghép Sub-Contract ; xuất phút + giờ trong 1 sheet
+from tab_module.calculation_modules.pipeline import (
+    compute_units,
+    export_minutely_and_hourly,
+    merge_hour_with_contract,
 )
-from PySide6.QtGui import QStandardItemModel, QStandardItem
-from PySide6.QtCore import Qt
-import pandas as pd
-from PySide6.QtGui import QColor
-from tab_module.calculation_modules.ppa_calculation import build_ppa_per_pair
-from tab_module.calculation_modules.epc_calculation import build_epc_per_pair  # EPC 429/429
-from tab_module.calculation_modules.plot_ppa import draw_ppa_df  # hỗ trợ tuple (segments, summary)
-from tab_module.calculation_modules.ppa_minutely import ppa_segments_to_minutely
-# export phút + giờ trong 1 sheet
 from tab_module.calculation_modules.export_utils import (
-    export_ppa_minutely_and_hourly_to_excel,
     minutely_to_hourly_avg,   # <<< dùng để tính hourly cho dashboard
+    EXPORT_FORMATS,
+    export_formats,
 )
 
+# Cấu hình riêng từng chế độ tính
+_MODES = {
+    "PPA": {
+        "attr": "ppa",
+        "subtitle": "cached",
+        "save_title": "Lưu PPA (minutely + hourly)",
+        "save_name": "PPA_Hour.xlsx",
+        "no_save_msg": "Đã tạo DF1_ppa/DF2_ppa cùng dữ liệu giờ (chưa lưu file).",
+    },
+    "EPC": {  # 429/429; tốc độ phụ thuộc 330 như ta đã thống nhất
+        "attr": "epc",
+        "subtitle": "right",
+        "save_title": "Lưu EPC (minutely + hourly)",
+        "save_name": "EPC_Hour.xlsx",
+        "no_save_msg": "Đã tạo DF1_epc/DF2_epc và dữ liệu theo giờ (chưa lưu file).",
+    },
+}
+
+# Bộ lọc hộp thoại lưu -> định dạng xuất (chỉ hiện định dạng dùng được, xem export_formats)
+_SAVE_FILTERS = {
+    "Excel Files (*.xlsx)": "xlsx",
+    "Excel - ghi nhanh (*.xlsx)": "xlsx_fast",
+    "CSV (*.csv)": "csv",
+    "CSV nén gzip (*.csv.gz)": "csv_gz",
+    "Parquet (*.parquet)": "parquet",
+    "Feather (*.feather)": "feather",
+}
+
 class CalculationTab(QWidget):
     def __init__(self, main_window_ref=None):
         super().__init__()
         self.main_window_ref = main_window_ref
         self._last_mode = None  # "PPA" hoặc "EPC"
+        self._worker = None     # CalcWorker đang chạy (None = rảnh)
+        self._job_mode = None   # chế độ / file của lần chạy hiện tại
+        self._job_path = None
 
         root = QVBoxLayout()
         #root.addWidget(QLabel("Chức năng tính toán PPA / EPC"))
@@ -33,6 +70,7 @@ class CalculationTab(QWidget):
         btn_calc_ppa = QPushButton("Calculate PPA")
         btn_calc_ppa.clicked.connect(self.calculate_ppa)
         row_btns.addWidget(btn_calc_ppa)
+        self.btn_calc_ppa = btn_calc_ppa
 
         btn_draw_df1_ppa = QPushButton("Draw DF1_PPA")
         btn_draw_df1_ppa.clicked.connect(self.draw_df1_ppa)
@@ -46,6 +84,7 @@ class CalculationTab(QWidget):
         btn_calc_epc = QPushButton("Calculate EPC")
         btn_calc_epc.clicked.connect(self.calculate_epc)
         row_btns.addWidget(btn_calc_epc)
+        self.btn_calc_epc = btn_calc_epc
 
         btn_draw_df1_epc = QPushButton("Draw DF1_EPC")
         btn_draw_df1_epc.clicked.connect(self.draw_df1_epc)
@@ -55,8 +94,27 @@ class CalculationTab(QWidget):
         btn_draw_df2_epc.clicked.connect(self.draw_df2_epc)
         row_btns.addWidget(btn_draw_df2_epc)
 
+        # --- Dashboard: đổi qua lại kết quả PPA / EPC ---
+        btn_switch = QPushButton("PPA ⇄ EPC")
+        btn_switch.clicked.connect(self.switch_dashboard)
+        row_btns.addWidget(btn_switch)
+
         root.addLayout(row_btns)
 
+        # ================= Tiến độ + Hủy (pipeline chạy nền) =================
+        row_prog = QHBoxLayout()
+        self.progress = QProgressBar()
+        self.progress.setTextVisible(True)
+        self.progress.setValue(0)
+        row_prog.addWidget(self.progress, 1)
+        self.lbl_status = QLabel("")
+        row_prog.addWidget(self.lbl_status, 2)
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.cancel_calculation)
+        row_prog.addWidget(self.btn_cancel)
+        root.addLayout(row_prog)
+
         # ================= Dashboard (Hourly Preview) =================
         #root.addWidget(QLabel("Dashboard: Hourly preview (cập nhật sau khi Calculate)"))
 
@@ -85,7 +143,15 @@ class CalculationTab(QWidget):
         col2.addWidget(self.table_hour_s2)
         row_dash.addLayout(col2)
 
-        root.addLayout(row_dash)
+        # ================= Khung vẽ (Draw DFx_PPA/EPC vẽ vào đây, không mở cửa sổ mới) =================
+        dash = QWidget()
+        dash.setLayout(row_dash)
+        self.plot_panel = PlotPanel(self)
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(dash)
+        splitter.addWidget(self.plot_panel)
+        splitter.setStretchFactor(1, 1)
+        root.addWidget(splitter, 1)
 
         self.setLayout(root)
 
@@ -105,100 +171,46 @@ class CalculationTab(QWidget):
         return df1, df2
 
     def _df_to_model(self, df):
-        """Chuyển pandas.DataFrame -> QStandardItemModel để hiển thị trên QTableView."""
-        model = QStandardItemModel()
-        if df is None or df.empty:
-            return model
-
-        # set header
-        model.setColumnCount(len(df.columns))
-        model.setRowCount(len(df.index))
-        model.setHorizontalHeaderLabels([str(c) for c in df.columns])
-
-        # fill data
-        for r in range(len(df.index)):
-            for c in range(len(df.columns)):
-                val = df.iat[r, c]
-                if pd.isna(val):
-                    text = ""
-                elif isinstance(val, (pd.Timestamp, )):
-                    # format kiểu "20:00 12/30/24"
-                    text = val.strftime("%H:%M %d/%m/%y")#("%H:%M %m/%d/%y")
-                else:
-                    text = str(val)
-
-                item = QStandardItem(text)
-
-                if isinstance(val, (int, float)):
-                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                if df.columns[c] == "Δ%" and pd.notna(val):
-                    try:
-                        val_num = float(val)
-                        if val_num > 2:
-                            item.setBackground(QColor(144, 238, 144))  # xanh lá nhạt
-                        elif val_num < -2:
-                            item.setBackground(QColor(255, 182, 193))  # đỏ nhạt
-                    except Exception:
-                        pass
-                model.setItem(r, c, item)
-        return model
-    def _merge_hour_with_contract(self, hour_df: pd.DataFrame, ct_df: pd.DataFrame) -> pd.DataFrame:
-        """
-        Ghép Sub-Contract vào hourly theo khóa thời gian dạng chuỗi '%H:%M %d/%m/%y'.
-        Tính duy nhất cột Δ% theo yêu cầu.
-        """
-        if hour_df is None or hour_df.empty:
-            return hour_df
-        if ct_df is None or ct_df.empty or "Time" not in ct_df or "Output Power" not in ct_df:
-            return hour_df
-
-        # ===== Left: hourly =====
-        tmp = hour_df.copy()
-
-        # bảo đảm 'Thời điểm' là datetime trước khi format
-        if "Thời điểm" in tmp.columns and not pd.api.types.is_datetime64_any_dtype(tmp["Thời điểm"]):
-            tmp["Thời điểm"] = pd.to_datetime(tmp["Thời điểm"], errors="coerce")
-
-        # format -> string khóa thống nhất
-        tmp["TimeKey"] = pd.to_datetime(tmp["Thời điểm"], errors="coerce").dt.strftime("%H:%M %d/%m/%y")
-        tmp = tmp.dropna(subset=["TimeKey"])
-        tmp["TimeKey"] = tmp["TimeKey"].astype(str)
-
-        # ===== Right: Sub-Contract =====
-        ct = ct_df.copy()
-        # nếu Time là datetime -> format; nếu là string -> vẫn ép datetime rồi format cho chắc
-        ct["TimeKey"] = pd.to_datetime(ct["Time"], errors="coerce", dayfirst=True).dt.strftime("%H:%M %d/%m/%y")
-        ct = ct.dropna(subset=["TimeKey"])
-        ct["TimeKey"] = ct["TimeKey"].astype(str)
-
-        ct["Output Power"] = pd.to_numeric(ct["Output Power"], errors="coerce")
-        ct = ct.rename(columns={"Output Power": "Output Power_CT"})
-
-        # xử lý trùng mốc thời gian: lấy bản ghi cuối cùng
-        ct = ct.groupby("TimeKey", as_index=False).last()[["TimeKey", "Output Power_CT"]]
-
-        # ===== Merge =====
-        out = tmp.merge(ct, on="TimeKey", how="left")
-
-        # ==== chỉ tính Δ% ====
-        out["Δ%"] = (out["MW"] - out["Output Power_CT"]) / out["MW"] * 100
-        out.loc[out["MW"].abs() <= 1e-9, "Δ%"] = None
-
-        # sắp cột: Thời điểm, MW, Output Power_CT, Δ%
-        pref = [c for c in ["Thời điểm", "MW", "Output Power_CT", "Δ%"] if c in out.columns]
-        rest = [c for c in out.columns if c not in pref + ["TimeKey"]]
-        out = out[pref + rest]
-        return out
-
+        """Chuyển pandas.DataFrame -> HourlyTableModel (text/căn lề/màu Δ% tính sẵn theo cột)."""
+        return HourlyTableModel(df)
+
+    def _contracts(self):
+        """{tổ máy: ContractIndex} đã dựng lúc import Sub-Contract (chưa có thì dựng từ DF1_CT/DF2_CT)."""
+        ref = self.main_window_ref
+        if ref is None:
+            return {}
+        index = getattr(ref, "CT_INDEX", None)
+        if not index:
+            tol = getattr(ref, "CT_TOLERANCE", None)
+            index = {"S1": ContractIndex(getattr(ref, "DF1_CT", None), tol),
+                     "S2": ContractIndex(getattr(ref, "DF2_CT", None), tol)}
+            ref.CT_INDEX = index
+        return index
 
     def _update_dashboard_from_hourly(self, mode_title, s1_hour, s2_hour, subtitle="cached"):
+        # GHÉP Sub-Contract nếu có (chỉ mục hợp đồng dùng lại, chỉ tra theo giờ)
+        contracts = self._contracts()
+        s1_view = merge_hour_with_contract(s1_hour, contracts.get("S1")) #df sau khi ghép
+        s2_view = merge_hour_with_contract(s2_hour, contracts.get("S2"))
+        self._show_dashboard(mode_title, s1_view, s2_view, subtitle)
+
+    def switch_dashboard(self):
+        """Đổi dashboard giữa kết quả PPA / EPC đã tính (không tính lại, không chuẩn bị lại hợp đồng)."""
+        ref = self.main_window_ref
+        done = [m for m, cfg in _MODES.items() if getattr(ref, f"DF1_{cfg['attr']}_hourly", None) is not None]
+        if not done:
+            QMessageBox.warning(self, "Chưa có kết quả", "Hãy bấm 'Calculate PPA' hoặc 'Calculate EPC' trước.")
+            return
+        others = [m for m in done if m != self._last_mode]
+        mode = others[0] if others else done[0]
+        key = _MODES[mode]["attr"]
+        self._last_mode = mode
+        self._update_dashboard_from_hourly(mode, getattr(ref, f"DF1_{key}_hourly"),
+                                           getattr(ref, f"DF2_{key}_hourly"), _MODES[mode]["subtitle"])
+
+    def _show_dashboard(self, mode_title, s1_view, s2_view, subtitle="cached"):
+        """Hiển thị DF giờ đã ghép Sub-Contract lên 2 bảng dashboard."""
         self.lbl_dashboard_title.setText(f"{mode_title} – Hourly ({subtitle})")
-
-        # GHÉP Sub-Contract nếu có
-        df1_ct = getattr(self.main_window_ref, "DF1_CT", None) if self.main_window_ref else None
-        df2_ct = getattr(self.main_window_ref, "DF2_CT", None) if self.main_window_ref else None
-        s1_view = self._merge_hour_with_contract(s1_hour, df1_ct) #df sau khi ghép
-        s2_view = self._merge_hour_with_contract(s2_hour, df2_ct)
         self.main_window_ref.DF1_dashboard = s1_view
         self.main_window_ref.DF2_dashboard = s2_view
         self.table_hour_s1.setModel(self._df_to_model(s1_view))
@@ -222,122 +234,152 @@ class CalculationTab(QWidget):
         self.table_hour_s1.resizeColumnsToContents()
         self.table_hour_s2.resizeColumnsToContents()
 
-    # ================== PPA ==================
-    def calculate_ppa(self):
+    # ================== Chạy nền: tính -> dashboard -> (hỏi file) -> xuất ==================
+    def _start_worker(self, worker, on_result, on_error):
+        # slot là method của widget -> Qt tự chuyển về GUI thread (queued)
+        self._worker = worker
+        worker.signals.progress.connect(self._on_progress)
+        worker.signals.result.connect(on_result)
+        worker.signals.error.connect(on_error)
+        worker.signals.cancelled.connect(self._on_cancelled)
+        worker.signals.finished.connect(self._on_worker_finished)
+        self._set_busy(True)
+        QThreadPool.globalInstance().start(worker)
+
+    def _set_busy(self, busy):
+        self.btn_calc_ppa.setEnabled(not busy)
+        self.btn_calc_epc.setEnabled(not busy)
+        self.btn_cancel.setEnabled(busy)
+        if busy:
+            self.progress.setRange(0, 0)   # chạy vô định cho tới tín hiệu tiến độ đầu tiên
+        elif self.progress.maximum() == 0:
+            self.progress.setRange(0, 1)
+
+    def _on_progress(self, stage, done, total):
+        self.progress.setRange(0, total)
+        self.progress.setValue(done)
+        self.lbl_status.setText(stage)
+
+    def _on_cancelled(self):
+        self.lbl_status.setText("Đã hủy.")
+
+    def _on_worker_finished(self):
+        # worker xuất file có thể đã được khởi động trong slot kết quả của worker tính
+        if self._worker is not None and self.sender() is self._worker.signals:
+            self._worker = None
+            self._set_busy(False)
+
+    def cancel_calculation(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self.btn_cancel.setEnabled(False)
+            self.lbl_status.setText("Đang hủy (dừng sau chặng hiện tại)...")
+
+    def _run_calculation(self, mode):
+        if self._worker is not None:
+            return
         df1, df2 = self._require_data()
         if df1 is None:
             return
-
-        seg1, sum1 = build_ppa_per_pair(df1)
-        seg2, sum2 = build_ppa_per_pair(df2)
-
-        # lưu kết quả PPA
-        self.main_window_ref.DF1_ppa = (seg1, sum1)
-        self.main_window_ref.DF2_ppa = (seg2, sum2)
-
-        # tạo DF phút
-        s1_min = ppa_segments_to_minutely(seg1, freq="T", include_pair_idx=False)
-        s2_min = ppa_segments_to_minutely(seg2, freq="T", include_pair_idx=False)
-        self.main_window_ref.DF1_ppa_minutely = s1_min
-        self.main_window_ref.DF2_ppa_minutely = s2_min
-
-        # >>> tạo DF giờ trước
-        s1_hour = minutely_to_hourly_avg(s1_min, freq="T", drop_incomplete=True, label="right")
-        s2_hour = minutely_to_hourly_avg(s2_min, freq="T", drop_incomplete=True, label="right")
-        self.main_window_ref.DF1_ppa_hourly = s1_hour
-        self.main_window_ref.DF2_ppa_hourly = s2_hour
-
-        # cập nhật dashboard từ DF giờ đã có
-        self._last_mode = "PPA"
-        self._update_dashboard_from_hourly("PPA", s1_hour, s2_hour)
-
-        # hỏi lưu file
-        path, _ = QFileDialog.getSaveFileName(self, "Lưu PPA (minutely + hourly)", "PPA_Hour.xlsx", "Excel Files (*.xlsx)")
+        ref = self.main_window_ref
+        self._job_mode = mode
+        # mọi tổ máy trong file (S1/S2 luôn có) ; Sub-Contract hiện chỉ có cho S1/S2
+        units = dict(getattr(ref, "UNITS", None) or {})
+        units["S1"], units["S2"] = df1, df2
+        # tổ máy có cùng dữ liệu + tham số với lần tính trước -> lấy thẳng từ cache
+        worker = CalcWorker(compute_units, mode, units, self._contracts(), cache=default_result_cache())
+        self._start_worker(worker, self._on_calculated, self._on_calc_error)
+
+    def _on_calc_error(self, ex):
+        QMessageBox.critical(self, f"Lỗi khi tính {self._job_mode}", f"Đã xảy ra lỗi:\n{ex}")
+
+    def _on_calculated(self, res):
+        mode = self._job_mode
+        cfg = _MODES[mode]
+        ref = self.main_window_ref
+        key = cfg["attr"]
+
+        # lưu kết quả (EPC riêng để không đè PPA) ; UNITS_<mode>: {tổ máy: dict kết quả}
+        setattr(ref, f"UNITS_{key}", res)
+        s1, s2 = res["S1"], res["S2"]
+        setattr(ref, f"DF1_{key}", (s1["seg"], s1["sum"]))
+        setattr(ref, f"DF2_{key}", (s2["seg"], s2["sum"]))
+        setattr(ref, f"DF1_{key}_minutely", None)  # chỉ dựng lại khi xuất file
+        setattr(ref, f"DF2_{key}_minutely", None)
+        # DF giờ tính thẳng từ segments (không cần dựng DF phút)
+        setattr(ref, f"DF1_{key}_hourly", s1["hour"])
+        setattr(ref, f"DF2_{key}_hourly", s2["hour"])
+
+        # cập nhật dashboard từ DF giờ đã ghép
+        self._last_mode = mode
+        self._show_dashboard(mode, s1["view"], s2["view"], subtitle=cfg["subtitle"])
+        # lớp đang vẽ của mode này -> thay bằng kết quả mới (bỏ qua nếu chưa vẽ)
+        for unit, n in (("S1", 1), ("S2", 2)):
+            if self.plot_panel.has_layer(mode, unit):
+                self.plot_panel.show_pairs(mode, unit, res[unit]["seg"], title=f"DF{n}_{mode} – {unit}",
+                                           activate=False, summary=res[unit]["sum"])
+
+        # hỏi lưu file trên GUI thread, rồi xuất ở worker mới
+        available = export_formats()
+        filters = [f for f, fmt in _SAVE_FILTERS.items() if fmt in available]
+        path, chosen = QFileDialog.getSaveFileName(self, cfg["save_title"], cfg["save_name"], ";;".join(filters))
         if not path:
-            QMessageBox.information(self, "Đã tính xong", "Đã tạo DF1_ppa/DF2_ppa cùng dữ liệu phút + giờ (chưa lưu file).")
+            QMessageBox.information(self, "Đã tính xong", cfg["no_save_msg"])
             return
-        try:
-            # export có thể dùng lại s1_min/s2_min và cả s1_hour/s2_hour
-            export_ppa_minutely_and_hourly_to_excel(s1_min, s2_min, filepath=path, sheet_name="PPA", freq="T", drop_incomplete=True)
-            QMessageBox.information(self, "Hoàn tất", f"Đã lưu file:\n{path}")
-        except Exception as ex:
-            QMessageBox.critical(self, "Lỗi khi xuất Excel", f"Đã xảy ra lỗi:\n{ex}")
+        fmt = _SAVE_FILTERS.get(chosen, "xlsx")
+        if not path.lower().endswith(EXPORT_FORMATS[fmt]):
+            path = os.path.splitext(path)[0] + EXPORT_FORMATS[fmt]
+        self._job_path = path
+        worker = CalcWorker(export_minutely_and_hourly, s1["seg"], s2["seg"], path, mode,
+                            cache=default_result_cache(), keys=(s1["key"], s2["key"]), fmt=fmt)
+        self._start_worker(worker, self._on_exported, self._on_export_error)
+
+    def _on_exported(self, out):
+        key = _MODES[self._job_mode]["attr"]
+        setattr(self.main_window_ref, f"DF1_{key}_minutely", out["s1_min"])
+        setattr(self.main_window_ref, f"DF2_{key}_minutely", out["s2_min"])
+        QMessageBox.information(self, "Hoàn tất", f"Đã lưu file:\n{self._job_path}")
+
+    def _on_export_error(self, ex):
+        if isinstance(ex, PermissionError):
+            QMessageBox.critical(self, "Không thể ghi file",
+                                 "File đang mở trong Excel hoặc không có quyền ghi.\n"
+                                 "Hãy đóng file rồi thử lại, hoặc lưu sang tên khác.")
+        else:
+            QMessageBox.critical(self, "Lỗi khi xuất file", f"Đã xảy ra lỗi:\n{ex}")
+
+    # ================== Vẽ ==================
+    def _draw(self, mode, unit):
+        """Vẽ kết quả mode của tổ máy vào khung vẽ nhúng (bấm lại cùng kết quả -> chỉ blit)."""
+        n = 1 if unit == "S1" else 2
+        value = getattr(self.main_window_ref, f"DF{n}_{_MODES[mode]['attr']}", None) if self.main_window_ref else None
+        if value is None:
+            QMessageBox.warning(self, f"Chưa tính {mode}", f"Hãy bấm 'Calculate {mode}' trước.")
+            return
+        title = f"DF{n}_{mode} – {unit}"
+        segments = SegmentStore.from_frames(value[0] if isinstance(value, tuple) else value)
+        summary = value[1] if isinstance(value, tuple) and len(value) > 1 else None
+        if not segments or len(segments.t_ns) == 0:
+            QMessageBox.warning(self, "Chưa có dữ liệu", f"{title} đang rỗng.")
+            return
+        self.plot_panel.show_pairs(mode, unit, segments, title=title, summary=summary)
 
+    # ================== PPA ==================
+    def calculate_ppa(self):
+        self._run_calculation("PPA")
 
     def draw_df1_ppa(self):
-        if not self.main_window_ref or not hasattr(self.main_window_ref, "DF1_ppa"):
-            QMessageBox.warning(self, "Chưa tính PPA", "Hãy bấm 'Calculate PPA' trước.")
-            return
-        draw_ppa_df(self.main_window_ref.DF1_ppa, "DF1_PPA – S1", parent=self)
+        self._draw("PPA", "S1")
 
     def draw_df2_ppa(self):
-        if not self.main_window_ref or not hasattr(self.main_window_ref, "DF2_ppa"):
-            QMessageBox.warning(self, "Chưa tính PPA", "Hãy bấm 'Calculate PPA' trước.")
-            return
-        draw_ppa_df(self.main_window_ref.DF2_ppa, "DF2_PPA – S2", parent=self)
+        self._draw("PPA", "S2")
 
     # ================== EPC ==================
     def calculate_epc(self):  # 429/429; tốc độ phụ thuộc 330 như ta đã thống nhất
-        df1, df2 = self._require_data()
-        if df1 is None:
-            return
-
-        seg1, sum1 = build_epc_per_pair(df1)
-        seg2, sum2 = build_epc_per_pair(df2)
-
-        # lưu kết quả EPC riêng để không đè PPA
-        self.main_window_ref.DF1_epc = (seg1, sum1)
-        self.main_window_ref.DF2_epc = (seg2, sum2)
-
-        s1_min = ppa_segments_to_minutely(seg1, freq="T", include_pair_idx=False)
-        s2_min = ppa_segments_to_minutely(seg2, freq="T", include_pair_idx=False)
-        self.main_window_ref.DF1_epc_minutely = s1_min
-        self.main_window_ref.DF2_epc_minutely = s2_min
-
-        # cập nhật dashboard theo giờ
-        # tạo & lưu DF giờ trước, rồi hiển thị từ cache (không tính lại)
-        s1_hour = minutely_to_hourly_avg(s1_min, freq="T", drop_incomplete=True, label="right")
-        s2_hour = minutely_to_hourly_avg(s2_min, freq="T", drop_incomplete=True, label="right")
-        self.main_window_ref.DF1_epc_hourly = s1_hour
-        self.main_window_ref.DF2_epc_hourly = s2_hour
-
-        self._last_mode = "EPC"
-        self._update_dashboard_from_hourly("EPC", s1_hour, s2_hour, subtitle="right")
-
-
-        # hỏi lưu file
-        path, _ = QFileDialog.getSaveFileName(
-            self, "Lưu EPC (minutely + hourly)", "EPC_Hour.xlsx", "Excel Files (*.xlsx)"
-        )
-        if not path:
-            QMessageBox.information(self, "Đã tính xong",
-                                    "Đã tạo DF1_epc/DF2_epc và dữ liệu theo phút (chưa lưu file).")
-            return
-        try:
-            export_ppa_minutely_and_hourly_to_excel(
-                df_s1_minutely=s1_min,
-                df_s2_minutely=s2_min,
-                filepath=path,
-                sheet_name="EPC",
-                freq="T",
-                drop_incomplete=True
-            )
-            QMessageBox.information(self, "Hoàn tất", f"Đã lưu file:\n{path}")
-        except PermissionError:
-            QMessageBox.critical(self, "Không thể ghi file",
-                                 "File đang mở trong Excel hoặc không có quyền ghi.\n"
-                                 "Hãy đóng file rồi thử lại, hoặc lưu sang tên khác.")
-        except Exception as ex:
-            QMessageBox.critical(self, "Lỗi khi xuất Excel", f"Đã xảy ra lỗi:\n{ex}")
+        self._run_calculation("EPC")
 
     def draw_df1_epc(self):
-        if not self.main_window_ref or not hasattr(self.main_window_ref, "DF1_epc"):
-            QMessageBox.warning(self, "Chưa tính EPC", "Hãy bấm 'Calculate EPC' trước.")
-            return
-        draw_ppa_df(self.main_window_ref.DF1_epc, "DF1_EPC – S1", parent=self)
+        self._draw("EPC", "S1")
 
     def draw_df2_epc(self):
-        if not self.main_window_ref or not hasattr(self.main_window_ref, "DF2_epc"):
-            QMessageBox.warning(self, "Chưa tính EPC", "Hãy bấm 'Calculate EPC' trước.")
-            return
-        draw_ppa_df(self.main_window_ref.DF2_epc, "DF2_EPC – S2", parent=self)
+        self._draw("EPC", "S2")
@@ -5,8 +5,16 @@ from PySide6.QtWidgets import (
     QTableView, QLabel, QFileDialog, QMessageBox, QGroupBox
 )
 from tab_module.main_window_modules.pandas_model import PandasModel
-from tab_module.main_window_modules.data_utils import POSITION_INDEXES, REQUIRED_COLS, double_col, interleave_cols, read_any
+from tab_module.main_window_modules.data_utils import (
+    ColumnCountError, make_unit_steps, read_dispatch, read_sub_contract
+)
+from tab_module.main_window_modules.input_cache import default_cache
 from tab_module.main_window_modules.plot_utils import draw_df
+from tab_module.calculation_modules.contract_index import ContractIndex
+from tab_module.calculation_modules.result_cache import default_result_cache
+
+# Hậu tố thuộc tính kết quả do CalculationTab gắn vào cửa sổ này (DF1_ppa, UNITS_epc, ...)
+RESULT_KEYS = ("ppa", "epc")
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -14,8 +22,11 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Dashboard S1 / S2 – Draw DF1/DF2")
         self.DF1 = pd.DataFrame()
         self.DF2 = pd.DataFrame()
+        self.UNITS = {}                # DF bậc thang theo tổ máy (gồm cả S1/S2)
         self.DF1_CT = pd.DataFrame()   # NEW: Sub-Contract S1
         self.DF2_CT = pd.DataFrame()   # NEW: Sub-Contract S2
+        self.CT_TOLERANCE = None       # None: khớp đúng phút ; vd pd.Timedelta("30s"): mốc gần nhất trong ±30s
+        self.CT_INDEX = {}             # {tổ máy: ContractIndex} dựng 1 lần khi import Sub-Contract
 
         # Layout chính
         root = QWidget()
@@ -80,84 +91,21 @@ class MainWindow(QMainWindow):
         if not path:
             return
         try:
-            df_raw = read_any(path)
+            # đọc streaming chỉ các cột cần, tách theo tổ máy (luôn có S1/S2) ; file đã import -> lấy từ cache
+            parts = default_cache().load(path, "dispatch-all", lambda: read_dispatch(path, all_units=True))
+        except ColumnCountError:
+            QMessageBox.critical(self, "Thiếu cột", "File không đủ số cột yêu cầu.")
+            return
         except Exception as e:
             QMessageBox.critical(self, "Lỗi đọc file", str(e))
             return
+        df_s1, df_s2 = parts["S1"], parts["S2"]
+        self._drop_results()
 
-        if df_raw.shape[1] <= max(POSITION_INDEXES):
-            QMessageBox.critical(self, "Thiếu cột", "File không đủ số cột yêu cầu.")
-            return
-
-        df = df_raw.iloc[:, POSITION_INDEXES].copy()
-        df.columns = REQUIRED_COLS
-
-        for col in ["CS ra lệnh (MW)", "CS hoàn thành (MW)"]:
-            df[col] = pd.to_numeric(df[col], errors="coerce").round(4)
-        df = df.dropna(subset=["CS hoàn thành (MW)"]).reset_index(drop=True)
-
-        for col in ["Thời điểm BĐTH", "Thời điểm hoàn thành"]:
-            df[col] = pd.to_datetime(df[col], errors="coerce", dayfirst=True)
-            df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-        df["Tổ máy"] = df["Tổ máy"].astype(str).str.strip().str.upper()
-
-        df_s1 = df[df["Tổ máy"] == "S1"].reset_index(drop=True)
-        df_s2 = df[df["Tổ máy"] == "S2"].reset_index(drop=True)
-        if len(df_s1) > 1:
-            df_s1.loc[1:, "Thời điểm hoàn thành"] = "0"
-        if len(df_s2) > 1:
-            df_s2.loc[1:, "Thời điểm hoàn thành"] = "0"
-
-        def make_df(dfi):
-            # MW dạng bậc thang từ "CS hoàn thành (MW)"
-            mw = double_col(dfi, "CS hoàn thành (MW)")
-
-            # Chuỗi thời điểm interleave (BĐTH, Hoàn thành, ...)
-            t = interleave_cols(dfi, "Thời điểm BĐTH", "Thời điểm hoàn thành")
-
-            # --- Dừng lệnh theo BĐTH, hoàn thành = None, chèn None đầu ---
-            if "Dừng lệnh" in dfi.columns:
-                stop_start = dfi["Dừng lệnh"].where(dfi["Dừng lệnh"].notna(), None).reset_index(drop=True)
-            else:
-                stop_start = pd.Series([None] * len(dfi), dtype=object)
-
-            # nhân đôi để khớp step, rồi đặt xen kẽ [flag, None, flag, None, ...]
-            stop_vals = stop_start.repeat(2).reset_index(drop=True)
-            stop_vals.iloc[1::2] = None
-
-            # chèn None vào đầu (pandas >= 2.0 dùng concat thay append)
-            stop_vals = pd.concat([pd.Series([None], dtype=object), stop_vals], ignore_index=True)
-
-            # ======= XỬ LÝ CỘT CASE TƯƠNG TỰ CỘT THỜI ĐIỂM =======
-            if {"Case BĐTH", "Case hoàn thành"}.issubset(set(dfi.columns)):
-                case_series = interleave_cols(dfi, "Case BĐTH", "Case hoàn thành")
-            elif "Case" in dfi.columns:
-                case_start = dfi["Case"].astype(object).reset_index(drop=True)
-                case_series = case_start.repeat(2).reset_index(drop=True)
-                case_series.iloc[1::2] = None  # vị trí hoàn thành để None
-            else:
-                # không có thông tin Case
-                case_series = pd.Series([None] * (len(dfi) * 2), dtype=object)
-
-            # Căn hàng: bỏ phần tử đầu của thời điểm, bỏ phần tử cuối của MW
-            t = t[1:].reset_index(drop=True)
-            mw = mw[:-1].reset_index(drop=True)
-
-            # Cắt/khớp độ dài stop_vals & case_series theo thời điểm
-            stop_vals = stop_vals.iloc[:len(t)].reset_index(drop=True)
-            case_out  = case_series[1:].reset_index(drop=True)  # bỏ phần tử đầu để song song với t
-            case_out  = case_out.iloc[:len(t)].reset_index(drop=True)
-
-            return pd.DataFrame({
-                "MW": mw,
-                "Thời điểm": t,
-                "Case": case_out,
-                "Dừng lệnh": stop_vals
-            })
-
-        self.DF1 = make_df(df_s1)
-        self.DF2 = make_df(df_s2)
+        # DF bậc thang cho mọi tổ máy trong file (DF1/DF2 = S1/S2 như cũ)
+        self.UNITS = make_unit_steps(parts)
+        self.DF1 = self.UNITS["S1"]
+        self.DF2 = self.UNITS["S2"]
 
         print("\n====== DF1 (S1) ======")
         print(self.DF1)
@@ -168,8 +116,9 @@ class MainWindow(QMainWindow):
         self.model_s2.setDataFrame(df_s2)
         self.lbl_s1.setText(f"{len(df_s1)} dòng, {len(df_s1.columns)} cột")
         self.lbl_s2.setText(f"{len(df_s2)} dòng, {len(df_s2.columns)} cột")
-        self.view_s1.resizeColumnsToContents()
-        self.view_s2.resizeColumnsToContents()
+        # ước lượng độ rộng cột từ mẫu dòng (resizeColumnsToContents phải render cả bảng)
+        self.model_s1.sample_column_widths(self.view_s1)
+        self.model_s2.sample_column_widths(self.view_s2)
 
     # NEW: Import Sub-Contract (Sheet1=S1 → DF1_CT, Sheet2=S2 → DF2_CT)
     def import_sub_contract(self):
@@ -181,21 +130,15 @@ class MainWindow(QMainWindow):
             return
 
         try:
-            # Sheet1 (index 0) -> S1
-            df1 = pd.read_excel(path, sheet_name=0, usecols=[0, 1])
-            df1.columns = ["Time", "Output Power"]
-            df1["Time"] = pd.to_datetime(df1["Time"], errors="coerce", dayfirst=True)
-            df1["Output Power"] = pd.to_numeric(df1["Output Power"], errors="coerce")
-
-            # Sheet2 (index 1) -> S2
-            df2 = pd.read_excel(path, sheet_name=1, usecols=[0, 1])
-            df2.columns = ["Time", "Output Power"]
-            df2["Time"] = pd.to_datetime(df2["Time"], errors="coerce", dayfirst=True)
-            df2["Output Power"] = pd.to_numeric(df2["Output Power"], errors="coerce")
+            # Sheet1 -> S1, Sheet2 -> S2 ; file đã import -> lấy từ cache
+            parts = default_cache().load(path, "subct", lambda: read_sub_contract(path))
 
             # Lưu vào thuộc tính
-            self.DF1_CT = df1.dropna(subset=["Time", "Output Power"]).reset_index(drop=True)
-            self.DF2_CT = df2.dropna(subset=["Time", "Output Power"]).reset_index(drop=True)
+            self.DF1_CT = parts["S1"]
+            self.DF2_CT = parts["S2"]
+            # chuẩn hóa + chỉ mục theo giờ 1 lần, dùng lại cho mọi lần tính / đổi PPA-EPC
+            self.CT_INDEX = {u: ContractIndex(df, self.CT_TOLERANCE) for u, df in parts.items()}
+            self._refresh_contract_views()
 
             # Log nhanh
             print("\n===== DF1_CT (S1 – Sub Ct) =====")
@@ -216,3 +159,22 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Lỗi import Sub-Contract", str(e))
             return
+
+    # ===== Kết quả PPA/EPC đã tính =====
+    def _drop_results(self):
+        """Dữ liệu dispatch mới: bỏ kết quả của file cũ (thuộc tính + tầng RAM của cache kết quả)."""
+        for key in RESULT_KEYS:
+            for name in (f"UNITS_{key}", f"DF1_{key}", f"DF2_{key}",
+                         f"DF1_{key}_minutely", f"DF2_{key}_minutely",
+                         f"DF1_{key}_hourly", f"DF2_{key}_hourly"):
+                if hasattr(self, name):
+                    delattr(self, name)
+        default_result_cache().clear_memory(keep_latest=True)   # gốc để tính tiếp khi file chỉ ghi thêm lệnh
+
+    def _refresh_contract_views(self):
+        """Sub-Contract mới: ghép lại bảng so sánh của kết quả đã tính (segments/giờ không đổi)."""
+        for key in RESULT_KEYS:
+            units = getattr(self, f"UNITS_{key}", None) or {}
+            for u, res in units.items():
+                index = self.CT_INDEX.get(u)
+                res["view"] = index.compare(res["hour"]) if index is not None else res["hour"]
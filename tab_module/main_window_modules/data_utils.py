@@ -1,7 +1,13 @@
 # data_utils.py
+import io
 import os
+import re
+import time
+import importlib.util
+import numpy as np
 import pandas as pd
-import tempfile
+from typing import Dict, Iterator, Optional, Sequence
+from openpyxl import load_workbook
 from xlsx2csv import Xlsx2csv
 
 POSITION_INDEXES = [2,3, 4, 5, 6, 7, 16]  # C, E, F, G, H
@@ -23,6 +29,127 @@ def double_col(df: pd.DataFrame, col: str) -> pd.Series:
 def interleave_cols(df: pd.DataFrame, col1: str, col2: str, dropna=False) -> pd.Series:
     return df[[col1, col2]].stack(dropna=dropna).reset_index(drop=True)
 
+# ===================== DF bậc thang cho build_*_per_pair =====================
+STEP_TIME_FMT = "%Y-%m-%d %H:%M:%S"   # định dạng chuỗi thời điểm cũ (bảng dispatch dựng tay / bản lưu cũ)
+NO_COMPLETION = pd.NaT                # "Thời điểm hoàn thành" bị bỏ (từ lệnh thứ 2 mỗi tổ máy)
+
+
+def _as_datetime(s: pd.Series) -> np.ndarray:
+    """Cột thời điểm -> datetime64[ns]; đã là datetime thì giữ nguyên, chuỗi thì parse 1 lần ("0" -> NaT)."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.to_numpy(dtype="datetime64[ns]")
+    return pd.to_datetime(s, format=STEP_TIME_FMT, errors="coerce").to_numpy(dtype="datetime64[ns]")
+
+
+def _flags(s: pd.Series) -> np.ndarray:
+    # như s.where(s.notna(), None): cột số giữ NaN (float), cột khác NaN -> None
+    if s.dtype.kind in "iuf":
+        return s.to_numpy(dtype=float).astype(object)
+    vals = s.to_numpy(dtype=object).copy()
+    vals[pd.isna(vals)] = None
+    return vals
+
+
+def make_step_df(dfi: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bảng dispatch 1 tổ máy (read_dispatch) -> DF bậc thang cho build_*_per_pair
+    (n lệnh -> 2n-1 dòng, dựng thẳng trên mảng numpy):
+      - MW       : [v0, v0, v1, v1, ..., v(n-1)]               ("CS hoàn thành (MW)")
+      - Thời điểm: [HT0, BĐ1, HT1, BĐ2, ..., HT(n-1)]          datetime64[ns], HT đã bỏ = NO_COMPLETION
+      - Case     : [None, c1, None, c2, ..., None]             (vị trí lẻ = Case lệnh kế tiếp)
+      - Dừng lệnh: [None, d0, nan/None, d1, ..., nan/None]     (vị trí lẻ = cờ lệnh hiện tại)
+    """
+    n = len(dfi)
+    m = max(2 * n - 1, 0)
+
+    # MW bậc thang
+    mw = np.repeat(dfi["CS hoàn thành (MW)"].to_numpy(), 2)[:m]
+
+    # Thời điểm xen kẽ (BĐTH, hoàn thành), bỏ phần tử đầu
+    t = np.empty(2 * n, dtype="datetime64[ns]")
+    t[0::2] = _as_datetime(dfi["Thời điểm BĐTH"])
+    t[1::2] = _as_datetime(dfi["Thời điểm hoàn thành"])
+    t = t[1:]
+
+    # Dừng lệnh: None đầu, cờ lệnh i ở vị trí 2i+1, vị trí chẵn còn lại trống
+    stop = np.full(m, None, dtype=object)
+    if "Dừng lệnh" in dfi.columns:
+        if dfi["Dừng lệnh"].dtype.kind in "iuf":
+            stop[2::2] = np.nan
+        stop[1::2] = _flags(dfi["Dừng lệnh"])[:len(stop[1::2])]
+
+    # Case: (Case BĐTH, Case hoàn thành) xen kẽ bỏ phần tử đầu ; hoặc Case lệnh i+1 ở vị trí 2i+1
+    if {"Case BĐTH", "Case hoàn thành"}.issubset(set(dfi.columns)):
+        cases = np.empty(2 * n, dtype=object)
+        cases[0::2] = dfi["Case BĐTH"].to_numpy(dtype=object)
+        cases[1::2] = dfi["Case hoàn thành"].to_numpy(dtype=object)
+        case_out = cases[1:]
+    else:
+        case_out = np.full(m, None, dtype=object)
+        if "Case" in dfi.columns:
+            case_out[1::2] = dfi["Case"].to_numpy(dtype=object)[1:]
+
+    return pd.DataFrame({
+        "MW": mw,
+        "Thời điểm": t,
+        "Case": case_out,
+        "Dừng lệnh": stop,
+    })
+
+
+def make_unit_steps(parts: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """{tổ máy: bảng dispatch đã chuẩn hóa} (read_dispatch) -> {tổ máy: DF bậc thang}."""
+    return {u: make_step_df(dfu) for u, dfu in parts.items()}
+
+
+# ===================== Đọc xlsx: chọn engine tự động =====================
+# Thứ tự ưu tiên: calamine (Rust, nếu có python-calamine) -> openpyxl -> xlsx2csv (trong RAM)
+XLSX_ENGINES = ("calamine", "openpyxl", "xlsx2csv")
+
+
+def xlsx_engines() -> list:
+    """Các engine đọc xlsx dùng được trong môi trường hiện tại, theo thứ tự ưu tiên."""
+    out = []
+    for eng in XLSX_ENGINES:
+        if eng == "calamine" and importlib.util.find_spec("python_calamine") is None:
+            continue
+        out.append(eng)
+    return out
+
+
+def _read_xlsx_xlsx2csv(path: str) -> pd.DataFrame:
+    # Chuyển sheet 1 sang CSV trong bộ nhớ (không ghi file tạm -> không tốn I/O,
+    # nhiều lần import song song không đè file của nhau)
+    buf = io.StringIO()
+    Xlsx2csv(path, outputencoding="utf-8").convert(buf, sheetid=1)
+    buf.seek(0)
+    return pd.read_csv(buf)
+
+
+def read_xlsx(path: str,
+              engines: Optional[Sequence[str]] = None,
+              timings: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """
+    Đọc sheet đầu của file .xlsx, thử lần lượt từng engine (mặc định xlsx_engines())
+    tới khi thành công. Thời gian mỗi engine đã thử (kể cả engine lỗi) ghi vào timings
+    {engine: giây} nếu truyền vào.
+    """
+    engines = list(engines) if engines is not None else xlsx_engines()
+    timings = {} if timings is None else timings
+    last_err = None
+    for eng in engines:
+        t0 = time.perf_counter()
+        try:
+            if eng == "xlsx2csv":
+                return _read_xlsx_xlsx2csv(path)
+            return pd.read_excel(path, sheet_name=0, engine=eng)
+        except Exception as e:
+            last_err = e
+        finally:
+            timings[eng] = time.perf_counter() - t0
+    raise last_err or ValueError("Không có engine đọc xlsx.")
+
+
 def read_any(path: str) -> pd.DataFrame:
     ext = os.path.splitext(path)[1].lower()
 
@@ -35,12 +162,7 @@ def read_any(path: str) -> pd.DataFrame:
         return pd.read_csv(path)
 
     if ext == ".xlsx":
-        try:
-            return pd.read_excel(path, sheet_name=0, engine="openpyxl")
-        except Exception:
-            tmp_csv = os.path.join(tempfile.gettempdir(), "xlsx_fallback.csv")
-            Xlsx2csv(path, outputencoding="utf-8").convert(tmp_csv, sheetid=1)
-            return pd.read_csv(tmp_csv, encoding="utf-8")
+        return read_xlsx(path)
 
     if ext == ".xls":
         return pd.read_excel(path, sheet_name=0, engine="xlrd")
@@ -49,3 +171,222 @@ def read_any(path: str) -> pd.DataFrame:
         return pd.read_excel(path, sheet_name=0, engine="pyxlsb")
 
     raise ValueError("Định dạng không hỗ trợ.")
+
+
+# ===================== Đọc streaming: chỉ các cột cần + tách S1/S2 theo khối =====================
+CHUNK_ROWS = 5000
+MW_COLS = ["CS ra lệnh (MW)", "CS hoàn thành (MW)"]
+TIME_COLS = ["Thời điểm BĐTH", "Thời điểm hoàn thành"]
+_INFER_COLS = ["Case", "Dừng lệnh"]          # cột để nguyên kiểu, suy kiểu như read_excel
+# Chuỗi pandas coi là NaN khi đọc (na_values mặc định) + mã lỗi Excel
+_NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+    "#REF!", "#VALUE!", "#DIV/0!", "#NAME?", "#NUM!", "#NULL!",
+}
+
+
+class ColumnCountError(ValueError):
+    """File không đủ cột theo POSITION_INDEXES."""
+
+
+def _xlsx_cell(v):
+    """Giá trị ô openpyxl -> giống read_excel: rỗng/lỗi -> NaN, số nguyên dạng float -> int."""
+    if v is None:
+        return np.nan
+    if isinstance(v, str):
+        return np.nan if v in _NA_STRINGS else v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def _iter_xlsx_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """openpyxl read-only, chỉ đọc tới cột max(POSITION_INDEXES); dòng 1 là header."""
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        width = max(POSITION_INDEXES) + 1
+        # dimension trong file có thể sai -> nếu báo thiếu cột thì kiểm lại trên dữ liệu thật
+        wide = ws.max_column is not None and ws.max_column >= width
+        rows = ws.iter_rows(max_col=width, values_only=True)
+        header = next(rows, ())
+        wide = wide or (len(header) >= width and header[width - 1] is not None)
+        buf, pending = [], []
+        for row in rows:
+            vals = [row[i] if i < len(row) else None for i in POSITION_INDEXES]
+            if all(v is None for v in row):
+                pending.append(vals)          # dòng trống cuối sheet bị bỏ như read_excel
+                continue
+            wide = wide or (len(row) >= width and row[width - 1] is not None)
+            buf += pending
+            pending = []
+            buf.append(vals)
+            if len(buf) >= chunk_rows:
+                yield pd.DataFrame([[_xlsx_cell(v) for v in r] for r in buf], columns=REQUIRED_COLS)
+                buf = []
+        if not wide:
+            raise ColumnCountError("File không đủ số cột yêu cầu.")
+        if buf:
+            yield pd.DataFrame([[_xlsx_cell(v) for v in r] for r in buf], columns=REQUIRED_COLS)
+    finally:
+        wb.close()
+
+
+def _csv_encoding(path: str) -> str:
+    for enc in ["utf-8-sig", "utf-8", "cp1258", "cp1252"]:
+        try:
+            with open(path, encoding=enc) as f:
+                while f.read(1 << 20):
+                    pass
+            return enc
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return "utf-8"
+
+
+def _iter_csv_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """read_csv theo khối với usecols + dtype chuỗi cho các cột không phải MW."""
+    text_cols = {POSITION_INDEXES[REQUIRED_COLS.index(c)]: str
+                 for c in REQUIRED_COLS if c not in MW_COLS}
+    try:
+        reader = pd.read_csv(path, encoding=_csv_encoding(path), usecols=POSITION_INDEXES,
+                             dtype=text_cols, chunksize=chunk_rows)
+    except ValueError as e:
+        raise ColumnCountError(f"File không đủ số cột yêu cầu. ({e})")
+    with reader:
+        for chunk in reader:
+            chunk = chunk.iloc[:, np.argsort(np.argsort(POSITION_INDEXES))]
+            chunk.columns = REQUIRED_COLS
+            yield chunk
+
+
+def iter_needed_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Đọc file dispatch theo từng khối dòng, CHỈ lấy các cột POSITION_INDEXES
+    (đặt tên REQUIRED_COLS, chưa chuẩn hóa kiểu).
+      - .xlsx: openpyxl read-only (lỗi mở file -> read_xlsx với các engine còn lại)
+      - .csv : read_csv(usecols, dtype, chunksize)
+      - .xls / .xlsb: đọc cả file qua read_any rồi cắt cột
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        yield from _iter_csv_chunks(path, chunk_rows)
+        return
+    if ext == ".xlsx":
+        chunks = _iter_xlsx_chunks(path, chunk_rows)
+        try:
+            first = next(chunks, None)
+        except ColumnCountError:
+            raise
+        except Exception:
+            chunks = None                     # workbook lỗi với openpyxl -> calamine / xlsx2csv
+        if chunks is not None:
+            if first is not None:
+                yield first
+                yield from chunks
+            return
+        df_raw = read_xlsx(path, engines=[e for e in xlsx_engines() if e != "openpyxl"])
+    else:
+        df_raw = read_any(path)
+    if df_raw.shape[1] <= max(POSITION_INDEXES):
+        raise ColumnCountError("File không đủ số cột yêu cầu.")
+    df = df_raw.iloc[:, POSITION_INDEXES].copy()
+    df.columns = REQUIRED_COLS
+    yield df
+
+
+UNIT_NAME = re.compile(r"S\d+")   # tên tổ máy hợp lệ (sau strip / upper)
+
+
+def read_dispatch(path: str,
+                  units: Sequence[str] = ("S1", "S2"),
+                  chunk_rows: int = CHUNK_ROWS,
+                  all_units: bool = False) -> Dict[str, pd.DataFrame]:
+    """
+    Đọc streaming + chuẩn hóa kiểu + tách theo tổ máy (thay cho read_any + xử lý trong import_file).
+    Mỗi khối: MW -> số (round 4), bỏ dòng thiếu "CS hoàn thành (MW)", thời điểm -> datetime64[ns]
+    (dayfirst, bỏ phần lẻ giây), "Tổ máy" strip/upper rồi chia vào từng unit.
+    Kết quả giống cách cũ:
+      - định dạng ngày đoán 1 lần từ giá trị đầu tiên của cả cột (không đoán lại theo khối)
+      - "Case"/"Dừng lệnh" suy kiểu trên toàn cột như read_excel (toàn số -> số)
+      - từ dòng thứ 2 mỗi unit, "Thời điểm hoàn thành" = NO_COMPLETION (NaT, trước đây là chuỗi "0")
+    Trả về {unit: DataFrame}: luôn có các unit trong units (rỗng nếu file không có);
+    all_units=True: thêm mọi tổ máy khác có trong cột "Tổ máy" (theo thứ tự xuất hiện), chỉ lấy
+    tên hợp lệ UNIT_NAME (S1, S2, S3, ...) -> ô rác ("479886", "660", ...) không thành tổ máy.
+    """
+    units = [str(u).strip().upper() for u in units]
+    parts = {u: [] for u in units}
+    time_fmt = {}                                 # cột thời gian -> format đã đoán
+    numeric_ok = {c: True for c in _INFER_COLS}   # toàn bộ giá trị khác NaN đều là số?
+    needs_float = {c: False for c in _INFER_COLS}
+
+    for chunk in iter_needed_chunks(path, chunk_rows):
+        for col in _INFER_COLS:
+            if numeric_ok[col]:
+                vals = chunk[col]
+                conv = pd.to_numeric(vals, errors="coerce")
+                numeric_ok[col] = int(conv.notna().sum()) == int(vals.notna().sum())
+                needs_float[col] |= bool(vals.isna().any()) or conv.dtype.kind == "f"
+
+        for col in MW_COLS:
+            chunk[col] = pd.to_numeric(chunk[col], errors="coerce").round(4)
+        chunk = chunk.dropna(subset=["CS hoàn thành (MW)"]).copy()   # bản riêng -> gán cột không cảnh báo
+
+        for col in TIME_COLS:
+            if col not in time_fmt:
+                nn = chunk[col].dropna()
+                if nn.empty:
+                    continue
+                first = nn.iloc[0]
+                time_fmt[col] = (pd.tseries.api.guess_datetime_format(first, dayfirst=True)
+                                 if isinstance(first, str) else None)
+        for col in TIME_COLS:
+            fmt = time_fmt.get(col) or "mixed"
+            t = pd.to_datetime(chunk[col], errors="coerce", dayfirst=True, format=fmt)
+            if getattr(t.dt, "tz", None) is not None:
+                t = t.dt.tz_localize(None)
+            chunk[col] = t.dt.floor("s").astype("datetime64[ns]")
+
+        chunk["Tổ máy"] = chunk["Tổ máy"].astype(str).str.strip().str.upper()
+        if all_units:
+            for u in chunk["Tổ máy"].dropna().unique():
+                if u not in parts and UNIT_NAME.fullmatch(u):
+                    parts[u] = []
+        for u in parts:
+            part = chunk[chunk["Tổ máy"] == u]
+            if not part.empty:
+                parts[u].append(part)
+
+    out = {}
+    for u in parts:
+        df_u = (pd.concat(parts[u], ignore_index=True) if parts[u]
+                else pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if c in TIME_COLS else object)
+                                   for c in REQUIRED_COLS}))
+        for col in _INFER_COLS:
+            if numeric_ok[col] and len(df_u):
+                df_u[col] = pd.to_numeric(df_u[col]).astype(float if needs_float[col] else np.int64)
+        if len(df_u) > 1:
+            df_u.loc[1:, "Thời điểm hoàn thành"] = NO_COMPLETION
+        out[u] = df_u
+    return out
+
+
+SUB_CT_COLS = ["Time", "Output Power"]
+
+
+def read_sub_contract(path: str, units: Sequence[str] = ("S1", "S2")) -> Dict[str, pd.DataFrame]:
+    """
+    Đọc file Sub-Contract: sheet thứ i -> units[i], lấy 2 cột đầu (Time, Output Power),
+    Time -> datetime (dayfirst), Output Power -> số, bỏ dòng thiếu 1 trong 2.
+    Mở workbook 1 lần cho mọi sheet. Trả về {unit: DataFrame}.
+    """
+    out = {}
+    with pd.ExcelFile(path) as xls:
+        for i, u in enumerate(units):
+            df = pd.read_excel(xls, sheet_name=i, usecols=[0, 1])
+            df.columns = SUB_CT_COLS
+            df["Time"] = pd.to_datetime(df["Time"], errors="coerce", dayfirst=True)
+            df["Output Power"] = pd.to_numeric(df["Output Power"], errors="coerce")
+            out[u] = df.dropna(subset=SUB_CT_COLS).reset_index(drop=True)
+    return out
@@ -0,0 +1,100 @@
+# hourly_model.py
+import numpy as np
+import pandas as pd
+from PySide6.QtCore import QAbstractTableModel, Qt, QModelIndex
+from PySide6.QtGui import QColor
+
+TIME_FMT = "%H:%M %d/%m/%y"            # ví dụ "20:00 30/12/24"
+DELTA_COL = "Δ%"
+DELTA_LIMIT = 2.0
+_BG_UP = QColor(144, 238, 144)          # xanh lá nhạt: Δ% > 2
+_BG_DOWN = QColor(255, 182, 193)        # đỏ nhạt: Δ% < -2
+_ALIGN_NUM = Qt.AlignRight | Qt.AlignVCenter
+_DISPLAY = Qt.DisplayRole
+_ALIGN = Qt.TextAlignmentRole
+_BACKGROUND = Qt.BackgroundRole
+
+
+def _cell_text(val) -> str:
+    if pd.isna(val):
+        return ""
+    if isinstance(val, pd.Timestamp):
+        return val.strftime(TIME_FMT)
+    return str(val)
+
+
+def _render(s: pd.Series):
+    """(text, căn phải) cho cả cột, cùng quy tắc với từng ô của bảng cũ."""
+    n = len(s)
+    na = s.isna().to_numpy()
+    if s.dtype.kind == "M" and getattr(s.dt, "tz", None) is None:
+        # cắt lại chuỗi ISO "YYYY-MM-DDTHH:MM" thành TIME_FMT (strftime của pandas chạy từng phần tử)
+        iso = np.datetime_as_string(s.to_numpy(), unit="m")
+        text = np.array([f"{x[11:16]} {x[8:10]}/{x[5:7]}/{x[2:4]}" for x in iso], dtype=object)
+        right = np.zeros(n, dtype=bool)
+    elif s.dtype.kind in "iub":
+        # phần tử numpy int/bool không phải int/float của Python -> không căn phải
+        text = np.array(list(map(str, s.to_numpy().tolist())), dtype=object)
+        right = np.zeros(n, dtype=bool)
+    elif s.dtype.kind == "f":
+        text = np.array(list(map(str, s.to_numpy().tolist())), dtype=object)
+        right = np.ones(n, dtype=bool)
+    else:
+        vals = s.to_numpy(dtype=object)
+        text = np.array([_cell_text(v) for v in vals], dtype=object)
+        right = np.array([isinstance(v, (int, float)) for v in vals], dtype=bool)
+    text[na] = ""
+    return text, right
+
+
+class HourlyTableModel(QAbstractTableModel):
+    """
+    Model chỉ đọc cho bảng dashboard giờ (hourly + Sub-Contract + Δ%).
+    Text, căn lề và màu nền Δ% được tính 1 lần cho cả cột khi tạo model,
+    data() chỉ tra mảng theo role.
+    """
+
+    def __init__(self, df: pd.DataFrame = None, parent=None):
+        super().__init__(parent)
+        self._df = pd.DataFrame() if df is None else df
+        self._headers = [str(c) for c in self._df.columns]
+        self._text, self._right, self._bg = [], [], []
+        for c, name in enumerate(self._df.columns):
+            text, right = _render(self._df.iloc[:, c])
+            self._text.append(text)
+            self._right.append(right)
+            self._bg.append(self._delta_bg(self._df.iloc[:, c]) if name == DELTA_COL else None)
+
+    @staticmethod
+    def _delta_bg(s: pd.Series) -> np.ndarray:
+        v = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float)
+        bg = np.full(len(v), None, dtype=object)
+        bg[v > DELTA_LIMIT] = _BG_UP
+        bg[v < -DELTA_LIMIT] = _BG_DOWN
+        return bg
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._df)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        r, c = index.row(), index.column()
+        if role == _DISPLAY:
+            return self._text[c][r]
+        if role == _ALIGN:
+            return _ALIGN_NUM if self._right[c][r] else None
+        if role == _BACKGROUND:
+            bg = self._bg[c]
+            return None if bg is None else bg[r]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._headers[section]
+        return str(section + 1)
@@ -0,0 +1,158 @@
+# input_cache.py
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+import pandas as pd
+from typing import Callable, Dict, Optional
+from tab_module.main_window_modules.data_utils import POSITION_INDEXES, REQUIRED_COLS, SUB_CT_COLS
+
+# Tăng khi đổi cách chuẩn hóa dữ liệu đầu vào (read_dispatch / read_sub_contract)
+CACHE_SCHEMA_VERSION = 2
+DEFAULT_CACHE_DIR = os.environ.get("DIM_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".dim_cache", "inputs")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024   # 512 MB
+TMP_GRACE_SEC = 3600                    # file .tmp cũ hơn -> bỏ dở (process chết giữa chừng), xóa được
+
+
+def file_digest(path: str, block: int = 1 << 20) -> str:
+    """Hash nội dung file (đọc theo khối, không phụ thuộc tên/mtime)."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(block)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+class InputCache:
+    """
+    Cache trên đĩa cho các DataFrame đã chuẩn hóa từ file đầu vào.
+
+    Khóa = hash nội dung file + loại dữ liệu ("dispatch", "subct", ...) + phiên bản schema
+    (POSITION_INDEXES / REQUIRED_COLS / SUB_CT_COLS / CACHE_SCHEMA_VERSION / pandas). Đổi file hoặc đổi
+    schema -> khóa mới, entry cũ tự bị đẩy ra bởi eviction.
+
+    Mỗi entry là 1 file pickle (protocol cao nhất, DataFrame lưu nguyên block numpy, giữ đúng
+    dtype). Ghi nguyên tử (file tạm + os.replace). Tổng dung lượng giới hạn bởi max_bytes,
+    bỏ entry dùng lâu nhất trước (mtime được cập nhật mỗi lần đọc trúng).
+    Mọi lỗi cache đều bỏ qua -> đọc lại file gốc.
+    Nhiều process dùng chung thư mục (batch_cli -j N): eviction chỉ tính / xóa entry .pkl,
+    file .tmp chỉ xóa khi cũ hơn TMP_GRACE_SEC (không đụng file process khác đang ghi).
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root or DEFAULT_CACHE_DIR
+        self.max_bytes = int(max_bytes)
+
+    # ---------- Khóa ----------
+    @staticmethod
+    def schema_tag() -> str:
+        return f"v{CACHE_SCHEMA_VERSION}|{POSITION_INDEXES}|{REQUIRED_COLS}|{SUB_CT_COLS}|pd{pd.__version__}"
+
+    def key(self, path: str, kind: str) -> str:
+        tag = hashlib.blake2b(f"{kind}|{self.schema_tag()}".encode("utf-8"), digest_size=8).hexdigest()
+        return f"{kind}-{file_digest(path)}-{tag}"
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key + ".pkl")
+
+    # ---------- Đọc / ghi ----------
+    def get(self, key: str) -> Optional[Dict[str, pd.DataFrame]]:
+        p = self._entry(key)
+        try:
+            with open(p, "rb") as f:
+                frames = pickle.load(f)
+            os.utime(p)   # đánh dấu vừa dùng (LRU)
+            return frames
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self._remove(p)
+            return None
+
+    def put(self, key: str, frames: Dict[str, pd.DataFrame]) -> None:
+        tmp = None
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(frames, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._entry(key))
+        except Exception:
+            if tmp is not None:
+                self._remove(tmp)
+            return
+        self.evict()
+
+    def _scan(self):
+        """(mtime, size, tên) của các entry .pkl ; xóa luôn file .tmp bỏ dở quá TMP_GRACE_SEC."""
+        entries = []
+        stale = time.time() - TMP_GRACE_SEC
+        for name in os.listdir(self.root):
+            if not name.endswith((".pkl", ".tmp")):
+                continue
+            p = os.path.join(self.root, name)
+            try:
+                st = os.stat(p)
+            except OSError:       # process khác vừa xóa / đổi tên
+                continue
+            if name.endswith(".pkl"):
+                entries.append((st.st_mtime, st.st_size, name))
+            elif st.st_mtime < stale:
+                self._remove(p)
+        return entries
+
+    def evict(self) -> None:
+        """Xóa entry .pkl cũ nhất tới khi tổng dung lượng <= max_bytes."""
+        try:
+            entries = self._scan()
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.root, name))
+            total -= size
+
+    def clear(self) -> None:
+        try:
+            entries = self._scan()
+        except OSError:
+            return
+        for _, _, name in entries:
+            self._remove(os.path.join(self.root, name))
+
+    @staticmethod
+    def _remove(p: str) -> None:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+    # ---------- Tiện ích ----------
+    def load(self, path: str, kind: str,
+             loader: Callable[[], Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+        """Trả frames từ cache nếu có, ngược lại gọi loader() rồi lưu lại."""
+        try:
+            key = self.key(path, kind)
+        except OSError:
+            return loader()
+        frames = self.get(key)
+        if frames is None:
+            frames = loader()
+            self.put(key, frames)
+        return {name: df.copy() for name, df in frames.items()}
+
+
+_default_cache = None
+
+
+def default_cache() -> InputCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = InputCache()
+    return _default_cache
@@ -0,0 +1,107 @@
+# pair_model.py
+import numpy as np
+import pandas as pd
+from typing import Optional
+from PySide6.QtCore import QAbstractTableModel, Qt, QModelIndex
+from tab_module.calculation_modules.segment_store import SegmentStore
+
+HEADERS = ["Cụm", "Bắt đầu", "Kết thúc", "EndReason", "Hold"]
+NAT_NS = np.iinfo(np.int64).min          # NaT dạng int64 ns
+_DISPLAY = Qt.DisplayRole
+
+
+def _time_text(t_ns: np.ndarray) -> np.ndarray:
+    """int64 ns (NaT = min int64) -> "YYYY-MM-DD HH:MM:SS" cho cả mảng."""
+    t = t_ns.view("datetime64[ns]")
+    out = np.array([x.replace("T", " ") for x in np.datetime_as_string(t, unit="s")], dtype=object)
+    out[np.isnat(t)] = ""
+    return out
+
+
+def pair_table(segments: SegmentStore, summary: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Bảng cụm cho hộp thoại chọn: 1 dòng / segment (cùng thứ tự, dòng i = segment i).
+    Lấy từ summary của build_*_per_pair (idx_pair, StartMW/FinishMW, StartTime/FinishTime,
+    EndReason, InsideHold); không có / lệch số dòng -> dựng từ store (không có EndReason / Hold).
+    Cột: pair (nhãn idx_pair), pair_no (số cụm, dòng gap thuộc cụm trước nó), start_mw, finish_mw,
+    start_ns, finish_ns, trend (↑ / ↓ / →), end_reason, inside_hold (bool), label.
+    """
+    n = segments.n_segments
+    if summary is not None and len(summary) == n and "idx_pair" in summary.columns:
+        pair = summary["idx_pair"].astype(str).to_numpy(dtype=object)
+        start_mw = pd.to_numeric(summary["StartMW"], errors="coerce").to_numpy(dtype=float)
+        finish_mw = pd.to_numeric(summary["FinishMW"], errors="coerce").to_numpy(dtype=float)
+        start_ns = pd.to_datetime(summary["StartTime"], errors="coerce").to_numpy(dtype="datetime64[ns]").view(np.int64)
+        finish_ns = pd.to_datetime(summary["FinishTime"], errors="coerce").to_numpy(dtype="datetime64[ns]").view(np.int64)
+        end_reason = (summary["EndReason"].astype(object).fillna("").astype(str).to_numpy(dtype=object)
+                      if "EndReason" in summary.columns else np.full(n, "", dtype=object))
+        inside_hold = (summary["InsideHold"].eq(True).to_numpy(dtype=bool)
+                       if "InsideHold" in summary.columns else np.zeros(n, dtype=bool))
+    else:
+        pair = np.arange(n).astype(str).astype(object)
+        start_mw, finish_mw = segments.start_finish_mw()
+        first, last = segments.first_last()
+        t = np.append(segments.t_ns, NAT_NS)   # index -1 -> NaT
+        start_ns, finish_ns = t[first], t[last]
+        end_reason = np.full(n, "", dtype=object)
+        inside_hold = np.zeros(n, dtype=bool)
+
+    # dòng gap ("i_gap") -> NaN -> lấy số cụm ngay trước nó
+    pair_no = pd.to_numeric(pd.Series(pair), errors="coerce").ffill().fillna(-1).to_numpy(dtype=np.int64)
+    trend = np.select([finish_mw > start_mw, finish_mw < start_mw], ["↑", "↓"], "→").astype(object)
+    # nhãn "Pair i: s ↑ f" cho cả bảng 1 lượt (không dựng DataFrame / format từng cụm)
+    label = ("Pair " + pd.Series(pair) + ": " + pd.Series(np.char.mod("%.1f", start_mw)) + " "
+             + pd.Series(trend) + " " + pd.Series(np.char.mod("%.1f", finish_mw)))
+    return pd.DataFrame({
+        "pair": pair, "pair_no": pair_no,
+        "start_mw": start_mw, "finish_mw": finish_mw,
+        "start_ns": start_ns, "finish_ns": finish_ns,
+        "trend": trend, "end_reason": end_reason, "inside_hold": inside_hold,
+        "label": label.to_numpy(dtype=object),
+    })
+
+
+class PairTableModel(QAbstractTableModel):
+    """
+    Model chỉ đọc (ảo) cho bảng cụm: text các cột tính 1 lần cho cả bảng,
+    set_rows chỉ đổi danh sách dòng đang hiện (lọc) -> data() tra mảng theo dòng.
+    """
+
+    def __init__(self, table: pd.DataFrame, parent=None):
+        super().__init__(parent)
+        self._text = [
+            table["label"].to_numpy(dtype=object),
+            _time_text(table["start_ns"].to_numpy()),
+            _time_text(table["finish_ns"].to_numpy()),
+            table["end_reason"].to_numpy(dtype=object),
+            np.where(table["inside_hold"].to_numpy(), "✓", "").astype(object),
+        ]
+        self._rows = np.arange(len(table))
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Dòng của bảng cụm (= index segment) ứng với từng dòng đang hiện."""
+        return self._rows
+
+    def set_rows(self, rows: np.ndarray) -> None:
+        self.beginResetModel()
+        self._rows = np.asarray(rows, dtype=np.int64)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != _DISPLAY:
+            return None
+        return self._text[index.column()][self._rows[index.row()]]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return str(section + 1)
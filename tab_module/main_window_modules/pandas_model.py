@@ -1,25 +1,86 @@
 # pandas_model.py
+import numpy as np
 import pandas as pd
 from PySide6.QtCore import QAbstractTableModel, Qt, QModelIndex
 
+RENDER_BLOCK = 256       # số dòng render 1 lần cho mỗi cột
+FETCH_ROWS = 5000        # số dòng đưa ra view mỗi lần fetchMore
+WIDTH_SAMPLE = 200       # số dòng mẫu để ước lượng độ rộng cột
+_DISPLAY = Qt.DisplayRole
+
+
+def render_column(s: pd.Series) -> np.ndarray:
+    """
+    Chuỗi hiển thị của cả 1 Series (vector hóa), giống "" if pd.isna(v) else str(v) từng ô.
+    """
+    na = s.isna().to_numpy()
+    if s.dtype.kind == "M" and getattr(s.dt, "tz", None) is None:
+        # str(Timestamp) = "YYYY-MM-DD HH:MM:SS" (+ phần lẻ giây nếu có -> ô đó dùng str())
+        vals = s.to_numpy()
+        out = np.array([x.replace("T", " ") for x in np.datetime_as_string(vals, unit="s")], dtype=object)
+        frac = ~na & (vals.astype("datetime64[s]") != vals)
+        if frac.any():
+            out[frac] = [str(v) for v in s[frac]]
+    elif s.dtype.kind in "biuf":
+        out = np.array(list(map(str, s.to_numpy().tolist())), dtype=object)
+    elif s.dtype.kind == "O" or isinstance(s.dtype, pd.StringDtype):
+        out = s.astype(str).to_numpy(dtype=object)
+    else:
+        out = np.array([str(v) for v in s], dtype=object)
+    out[na] = ""
+    return out
+
+
 class PandasModel(QAbstractTableModel):
+    """
+    Model chỉ đọc cho DataFrame lớn:
+      - ô được render theo khối RENDER_BLOCK dòng x 1 cột (vector hóa), cache tới khi setDataFrame
+      - rowCount tăng dần qua canFetchMore/fetchMore (FETCH_ROWS dòng mỗi lần)
+      - sample_column_widths: độ rộng cột từ mẫu dòng, thay cho resizeColumnsToContents
+    """
+
     def __init__(self, df=pd.DataFrame(), parent=None):
         super().__init__(parent)
+        self._set(df)
+
+    def _set(self, df):
         self._df = df
+        self._cache = {}                              # (cột, khối) -> mảng chuỗi
+        self._loaded = min(len(df), FETCH_ROWS)
+
+    def _text(self, row: int, col: int) -> str:
+        blk = row // RENDER_BLOCK
+        arr = self._cache.get((col, blk))
+        if arr is None:
+            start = blk * RENDER_BLOCK
+            arr = render_column(self._df.iloc[start:start + RENDER_BLOCK, col])
+            self._cache[(col, blk)] = arr
+        return arr[row - blk * RENDER_BLOCK]
 
     def rowCount(self, parent=QModelIndex()):
-        return 0 if parent.isValid() else len(self._df)
+        return 0 if parent.isValid() else self._loaded
 
     def columnCount(self, parent=QModelIndex()):
         return 0 if parent.isValid() else len(self._df.columns)
 
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._df)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        n = min(FETCH_ROWS, len(self._df) - self._loaded)
+        if n <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + n - 1)
+        self._loaded += n
+        self.endInsertRows()
+
     def data(self, index, role=Qt.DisplayRole):
-        if not index.isValid():
+        # view hỏi nhiều role cho mỗi ô -> loại role khác trước, không đụng tới DataFrame
+        if role != _DISPLAY or not index.isValid():
             return None
-        if role == Qt.DisplayRole:
-            val = self._df.iat[index.row(), index.column()]
-            return "" if pd.isna(val) else str(val)
-        return None
+        return self._text(index.row(), index.column())
 
     def headerData(self, section, orientation, role=Qt.DisplayRole):
         if role != Qt.DisplayRole:
@@ -31,5 +92,18 @@ class PandasModel(QAbstractTableModel):
 
     def setDataFrame(self, df):
         self.beginResetModel()
-        self._df = df
+        self._set(df)
         self.endResetModel()
+
+    def sample_column_widths(self, view, sample: int = WIDTH_SAMPLE, max_width: int = 400):
+        """Đặt độ rộng cột của view theo header + mẫu dòng đầu/giữa/cuối (không duyệt toàn bảng)."""
+        n = len(self._df)
+        rows = np.unique(np.linspace(0, n - 1, min(n, sample)).astype(int)) if n else []
+        fm = view.fontMetrics()
+        hfm = view.horizontalHeader().fontMetrics()
+        pad = 2 * view.style().pixelMetric(view.style().PixelMetric.PM_FocusFrameHMargin) + 12
+        for c in range(len(self._df.columns)):
+            w = hfm.horizontalAdvance(str(self._df.columns[c]))
+            for text in render_column(self._df.iloc[rows, c]):
+                w = max(w, fm.horizontalAdvance(text))
+            view.setColumnWidth(c, min(w + pad, max_width))
@@ -2,7 +2,8 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 from PySide6.QtWidgets import QMessageBox
-import mplcursors
+from tab_module.calculation_modules.segment_store import as_datetime64
+from tab_module.calculation_modules.plot_lod import LodLine
 
 def draw_df(df: pd.DataFrame, title: str, parent=None):
     if df is None or df.empty:
@@ -10,8 +11,8 @@ def draw_df(df: pd.DataFrame, title: str, parent=None):
             QMessageBox.warning(parent, "Chưa có dữ liệu", f"{title} đang rỗng.")
         return
     try:
-        df_plot = df.copy()
-        df_plot["Thời điểm"] = pd.to_datetime(df_plot["Thời điểm"], errors="coerce")
+        df_plot = pd.DataFrame({"Thời điểm": as_datetime64(df["Thời điểm"]),
+                                "MW": pd.to_numeric(df["MW"], errors="coerce")})
         df_plot = df_plot.dropna(subset=["MW", "Thời điểm"]).reset_index(drop=True)
         if df_plot.empty:
             if parent:
@@ -19,27 +20,23 @@ def draw_df(df: pd.DataFrame, title: str, parent=None):
             return
 
         fig, ax = plt.subplots(figsize=(10, 5))
-        # Vẽ line bình thường
-        ax.plot(df_plot["Thời điểm"], df_plot["MW"], marker='o', label=title)
+        # Vẽ line theo mức chi tiết (M4 theo khung nhìn, marker khi zoom đủ gần)
+        t = df_plot["Thời điểm"]
+        mw = df_plot["MW"].to_numpy(dtype=float)
+
+        # Tooltip: chỉ dựng chữ cho điểm đang hover
+        def _tip(i):
+            return f"Thời điểm: {t.iloc[i].strftime('%Y-%m-%d %H:%M:%S')}\nMW: {mw[i]:.2f}"
+
+        lod = LodLine(ax, t.to_numpy(dtype="datetime64[ns]"), mw, tip=_tip, label=title)
         ax.set_title(title)
         ax.set_xlabel("Thời điểm")
         ax.set_ylabel("MW")
         ax.grid(True)
 
-        # Scatter “ẩn” để cursor chỉ bám vào CÁC ĐIỂM (không trôi trên đoạn line)
-        pts = ax.scatter(df_plot["Thời điểm"], df_plot["MW"], s=1, alpha=0)
-        cursor = mplcursors.cursor(pts, hover=True)
-
-        @cursor.connect("add")
-        def _on_add(sel):
-            i = sel.index
-            x = pd.to_datetime(df_plot["Thời điểm"].iloc[i])
-            y = float(df_plot["MW"].iloc[i])
-            sel.annotation.set_text(f"Thời điểm: {x.strftime('%Y-%m-%d %H:%M:%S')}\nMW: {y:.2f}")
-            sel.annotation.get_bbox_patch().set(fc="white", alpha=0.9)
-
         # Giữ tham chiếu tránh GC
-        fig._cursor = cursor
+        fig._cursor = lod.cursor
+        fig._lod = lod
 
         fig.tight_layout()
         plt.show()